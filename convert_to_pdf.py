@@ -1,27 +1,387 @@
 import os
-from docx2pdf import convert
+import sys
+import time
+import argparse
+import queue
+import atexit
+import shutil
+import signal
+import socket
+import tempfile
+import threading
+import subprocess
+from concurrent.futures import ThreadPoolExecutor, as_completed
 
-def convert_docx_to_pdf():
-    docx_dir = 'docx'
-    pdf_dir = 'pdf'
+from incremental import CHECK_MODES, StageManifest
 
+# UNO входит в поставку LibreOffice (пакет python3-uno); без него используется пакетная конвертация через CLI
+try:
+    import uno
+    from com.sun.star.beans import PropertyValue
+except ImportError:
+    uno = None
+
+# docx2pdf требует Microsoft Word (Windows/macOS), на Linux используется LibreOffice
+CONVERTER_BACKENDS = ('libreoffice', 'docx2pdf')
+DEFAULT_BACKEND = 'docx2pdf' if sys.platform in ('win32', 'darwin') else 'libreoffice'
+
+SOFFICE = shutil.which('soffice') or shutil.which('libreoffice') or 'soffice'
+CONVERT_WORKERS = max(1, (os.cpu_count() or 1) // 2)  # Количество экземпляров LibreOffice
+CONVERT_TIMEOUT = 120  # Время на конвертацию одного документа, с
+CONVERT_RETRIES = 2  # Повторные попытки после ошибки или таймаута (с перезапуском экземпляра)
+CLI_BATCH_SIZE = 50  # Документов на один запуск soffice без UNO
+OFFICE_START_TIMEOUT = 60  # Время на запуск экземпляра LibreOffice, с
+OFFICE_MAX_DOCUMENTS = 500  # Экземпляр перезапускается после стольких документов, чтобы не копил память
+MANIFEST_NAME = 'convert_manifest.jsonl'  # Манифест сконвертированных документов в директории PDF
+
+office_pool = None  # OfficePool процесса
+
+
+def uno_properties(**kwargs):
+    properties = []
+    for name, value in kwargs.items():
+        prop = PropertyValue()
+        prop.Name = name
+        prop.Value = value
+        properties.append(prop)
+    return tuple(properties)
+
+
+def kill_process_tree(process):
+    """
+    Завершает soffice вместе с дочерними процессами (soffice.bin запускается отдельным процессом).
+    """
+    if hasattr(os, 'killpg'):
+        try:
+            os.killpg(process.pid, signal.SIGKILL)
+        except ProcessLookupError:
+            pass
+    else:
+        process.kill()
+    process.wait()
+
+
+def converted_since(pdf_path, started):
+    # Старый PDF от прошлого запуска не считается результатом конвертации
+    return os.path.exists(pdf_path) and os.path.getmtime(pdf_path) >= started - 1
+
+
+def free_port():
+    with socket.socket() as sock:
+        sock.bind(('127.0.0.1', 0))
+        return sock.getsockname()[1]
+
+
+class OfficeWorker:
+    """
+    Один постоянный экземпляр LibreOffice в режиме headless со своим профилем,
+    чтобы экземпляры не блокировали друг друга.
+    """
+
+    def __init__(self):
+        self.profile_dir = tempfile.mkdtemp(prefix='lo_profile_')
+        self.profile_url = 'file://' + os.path.abspath(self.profile_dir).replace(os.sep, '/')
+        self.process = None
+        self.desktop = None
+        self.documents = 0
+
+    def start(self):
+        """
+        Запускает экземпляр и подключается к нему по UNO.
+        """
+        port = free_port()
+        self.process = subprocess.Popen(
+            [SOFFICE, '--headless', '--invisible', '--nologo', '--norestore', '--nodefault',
+             f'-env:UserInstallation={self.profile_url}',
+             f'--accept=socket,host=127.0.0.1,port={port};urp;StarOffice.ComponentContext'],
+            stdout=subprocess.DEVNULL, stderr=subprocess.DEVNULL, start_new_session=True)
+
+        local_context = uno.getComponentContext()
+        resolver = local_context.ServiceManager.createInstanceWithContext(
+            'com.sun.star.bridge.UnoUrlResolver', local_context)
+        deadline = time.monotonic() + OFFICE_START_TIMEOUT
+        while True:
+            try:
+                context = resolver.resolve(
+                    f'uno:socket,host=127.0.0.1,port={port};urp;StarOffice.ComponentContext')
+                break
+            except Exception:
+                if self.process.poll() is not None or time.monotonic() > deadline:
+                    self.stop()
+                    raise RuntimeError('Не удалось запустить LibreOffice')
+                time.sleep(0.5)
+        self.desktop = context.ServiceManager.createInstanceWithContext('com.sun.star.frame.Desktop', context)
+        self.documents = 0
+
+    def stop(self):
+        if self.desktop is not None:
+            try:
+                self.desktop.terminate()
+            except Exception:
+                pass  # Экземпляр уже завершился или завис
+            self.desktop = None
+        if self.process is not None:
+            try:
+                self.process.wait(timeout=10)
+            except subprocess.TimeoutExpired:
+                kill_process_tree(self.process)
+            self.process = None
+
+    def kill(self):
+        if self.process is not None:
+            kill_process_tree(self.process)
+            self.process = None
+        self.desktop = None
+
+    def close(self):
+        self.stop()
+        shutil.rmtree(self.profile_dir, ignore_errors=True)
+
+    def convert_uno(self, docx_path, pdf_path):
+        document = self.desktop.loadComponentFromURL(
+            uno.systemPathToFileUrl(os.path.abspath(docx_path)), '_blank', 0,
+            uno_properties(Hidden=True, ReadOnly=True))
+        try:
+            document.storeToURL(uno.systemPathToFileUrl(os.path.abspath(pdf_path)),
+                                uno_properties(FilterName='writer_pdf_Export'))
+        finally:
+            document.close(True)
+
+    def convert(self, docx_path, pdf_path, timeout=CONVERT_TIMEOUT):
+        """
+        Конвертирует один документ. При превышении timeout экземпляр завершается и поднимается TimeoutError.
+        """
+        if uno is None:
+            self.convert_batch([docx_path], os.path.dirname(pdf_path) or '.', timeout)
+            return
+
+        if self.process is None or self.process.poll() is not None or self.documents >= OFFICE_MAX_DOCUMENTS:
+            self.stop()
+            self.start()
+
+        errors = []
+
+        def run():
+            try:
+                self.convert_uno(docx_path, pdf_path)
+            except Exception as e:
+                errors.append(e)
+
+        # Вызов UNO нельзя прервать, поэтому зависший экземпляр завершается целиком
+        thread = threading.Thread(target=run, daemon=True)
+        thread.start()
+        thread.join(timeout)
+        if thread.is_alive():
+            self.kill()
+            raise TimeoutError(f'Конвертация {docx_path} не уложилась в {timeout} с')
+        if errors:
+            raise errors[0]
+        self.documents += 1
+
+    def convert_batch(self, docx_paths, pdf_dir, timeout=CONVERT_TIMEOUT):
+        """
+        Конвертирует несколько документов одним запуском soffice (без UNO).
+        Время на пакет - timeout на каждый документ.
+        """
+        started = time.time()
+        process = subprocess.Popen(
+            [SOFFICE, '--headless', '--invisible', '--nologo', '--norestore',
+             f'-env:UserInstallation={self.profile_url}',
+             '--convert-to', 'pdf', '--outdir', pdf_dir, *docx_paths],
+            stdout=subprocess.DEVNULL, stderr=subprocess.DEVNULL, start_new_session=True)
+        try:
+            process.wait(timeout=timeout * len(docx_paths))
+        except subprocess.TimeoutExpired:
+            kill_process_tree(process)
+            raise TimeoutError(f'Пакетная конвертация не уложилась в {timeout * len(docx_paths)} с')
+        missing = [docx_path for docx_path in docx_paths
+                   if not converted_since(pdf_output_path(docx_path, pdf_dir), started)]
+        if missing:
+            raise RuntimeError(f'LibreOffice не создал PDF для: {", ".join(missing)}')
+
+
+class OfficePool:
+    """
+    Пул постоянных экземпляров LibreOffice. Каждый вызов convert занимает один экземпляр,
+    поэтому одновременно конвертируется столько документов, сколько экземпляров в пуле.
+    """
+
+    def __init__(self, workers=CONVERT_WORKERS):
+        self.workers = [OfficeWorker() for _ in range(workers)]
+        self.idle = queue.Queue()
+        for worker in self.workers:
+            self.idle.put(worker)
+
+    def convert(self, docx_path, pdf_path, timeout=CONVERT_TIMEOUT, retries=CONVERT_RETRIES):
+        """
+        Конвертирует документ, повторяя попытку с перезапуском экземпляра после ошибки или таймаута.
+        """
+        worker = self.idle.get()
+        try:
+            for attempt in range(retries + 1):
+                try:
+                    worker.convert(docx_path, pdf_path, timeout)
+                    return pdf_path
+                except Exception as e:
+                    worker.kill()
+                    if attempt == retries:
+                        raise
+                    print(f'Ошибка при конвертации {docx_path} (попытка {attempt + 1}): {e}')
+        finally:
+            self.idle.put(worker)
+
+    def convert_batch(self, docx_paths, pdf_dir, timeout=CONVERT_TIMEOUT, retries=CONVERT_RETRIES):
+        """
+        Конвертирует пакет документов одним запуском soffice (без UNO), а не получившиеся документы -
+        по одному с повторными попытками. С UNO все документы конвертируются по одному.
+        :return: Словарь {путь к DOCX: путь к PDF или исключение}.
+        """
+        started = time.time()
+        if uno is None:
+            worker = self.idle.get()
+            try:
+                worker.convert_batch(docx_paths, pdf_dir, timeout)
+            except Exception as e:
+                print(f'Ошибка при пакетной конвертации: {e}')
+            finally:
+                self.idle.put(worker)
+
+        results = {}
+        for docx_path in docx_paths:
+            pdf_path = pdf_output_path(docx_path, pdf_dir)
+            if uno is None and converted_since(pdf_path, started):
+                results[docx_path] = pdf_path
+                continue
+            try:
+                results[docx_path] = self.convert(docx_path, pdf_path, timeout, retries)
+            except Exception as e:
+                results[docx_path] = e
+        return results
+
+    def close(self):
+        for worker in self.workers:
+            worker.close()
+
+
+def get_office_pool(workers=CONVERT_WORKERS):
+    """
+    Возвращает пул LibreOffice процесса, создавая его при первом вызове.
+    Экземпляры запускаются при первой конвертации и завершаются при выходе из программы.
+    """
+    global office_pool
+    if office_pool is None:
+        office_pool = OfficePool(workers)
+        atexit.register(office_pool.close)
+    return office_pool
+
+
+def pdf_output_path(docx_path, pdf_dir):
+    pdf_file = os.path.splitext(os.path.basename(docx_path))[0] + '.pdf'
+    return os.path.join(pdf_dir, pdf_file)
+
+
+def resolve_workers(backend=DEFAULT_BACKEND, workers=None):
+    """
+    Число параллельных конвертаций для бэкенда: для LibreOffice - workers (по умолчанию CONVERT_WORKERS),
+    для docx2pdf всегда 1, так как все вызовы обслуживает один процесс Word.
+    """
+    if backend != 'libreoffice':
+        return 1
+    return workers or CONVERT_WORKERS
+
+
+def init_convert_thread(backend=DEFAULT_BACKEND):
+    """
+    Инициализатор потоков конвертации (ThreadPoolExecutor(initializer=...)).
+    docx2pdf на Windows управляет Word через COM, а COM нужно инициализировать в каждом потоке,
+    который к нему обращается; основной поток инициализируется pywin32 при импорте.
+    """
+    if backend == 'docx2pdf' and sys.platform == 'win32':
+        import pythoncom
+        pythoncom.CoInitialize()
+
+
+def convert_file(docx_path, pdf_dir='pdf', backend=DEFAULT_BACKEND, timeout=CONVERT_TIMEOUT, retries=CONVERT_RETRIES):
+    """
+    Конвертирует один DOCX-файл в PDF.
+
+    :param docx_path: Путь к DOCX-файлу.
+    :param pdf_dir: Директория для PDF.
+    :param backend: 'libreoffice' (пул экземпляров, см. get_office_pool) или 'docx2pdf' (Microsoft Word).
+    :param timeout: Время на конвертацию документа в LibreOffice, с.
+    :param retries: Повторные попытки в LibreOffice.
+    :return: Путь к созданному PDF.
+    """
+    os.makedirs(pdf_dir, exist_ok=True)
+    pdf_path = pdf_output_path(docx_path, pdf_dir)
+    if backend == 'libreoffice':
+        return get_office_pool().convert(docx_path, pdf_path, timeout, retries)
+
+    from docx2pdf import convert
+    convert(docx_path, pdf_path)
+    return pdf_path
+
+def convert_docx_to_pdf(docx_dir='docx', pdf_dir='pdf', backend=DEFAULT_BACKEND, workers=CONVERT_WORKERS,
+                        incremental=True, check_mode='mtime'):
+    """
+    Конвертирует все DOCX из docx_dir в PDF.
+
+    :param incremental: Пропускать документы, которые не изменились с прошлой конвертации
+                        (см. incremental.StageManifest).
+    :param check_mode: Способ проверки изменений: 'mtime' или 'hash'.
+    """
     # Создаем директорию 'pdf', если она не существует
     if not os.path.exists(pdf_dir):
         os.makedirs(pdf_dir)
 
     # Получаем список всех файлов в папке 'docx'
-    docx_files = [f for f in os.listdir(docx_dir) if f.endswith('.docx')]
+    docx_files = sorted(f for f in os.listdir(docx_dir) if f.endswith('.docx'))
+    docx_paths = [os.path.join(docx_dir, docx_file) for docx_file in docx_files]
 
-    for docx_file in docx_files:
-        docx_path = os.path.join(docx_dir, docx_file)
-        pdf_file = os.path.splitext(docx_file)[0] + '.pdf'
-        pdf_path = os.path.join(pdf_dir, pdf_file)
-        try:
-            print(f'Конвертируем {docx_file} в PDF...')
-            convert(docx_path, pdf_path)
-            print(f'Файл {pdf_file} успешно создан.')
-        except Exception as e:
-            print(f'Ошибка при конвертации {docx_file}: {e}')
+    manifest = StageManifest(os.path.join(pdf_dir, MANIFEST_NAME), check_mode)
+    if incremental:
+        docx_paths, skipped = manifest.split(docx_paths)
+        print(f'Пропущено актуальных PDF: {skipped}')
+
+    if backend != 'libreoffice':
+        for docx_path in docx_paths:
+            docx_file = os.path.basename(docx_path)
+            try:
+                print(f'Конвертируем {docx_file} в PDF...')
+                pdf_path = convert_file(docx_path, pdf_dir, backend)
+                manifest.record(docx_path, [pdf_path])
+                print(f'Файл {os.path.basename(pdf_path)} успешно создан.')
+            except Exception as e:
+                print(f'Ошибка при конвертации {docx_file}: {e}')
+        return
+
+    # LibreOffice: с UNO каждый документ отдаётся свободному экземпляру,
+    # без UNO документы конвертируются пакетами, чтобы не запускать soffice на каждый файл
+    pool = get_office_pool(workers)
+    batch_size = 1 if uno is not None else CLI_BATCH_SIZE
+    batches = [docx_paths[i:i + batch_size] for i in range(0, len(docx_paths), batch_size)]
+    print(f'Конвертируем {len(docx_paths)} документов в PDF ({workers} экземпляров LibreOffice)...')
+    with ThreadPoolExecutor(max_workers=workers) as executor:
+        futures = [executor.submit(pool.convert_batch, batch, pdf_dir) for batch in batches]
+        for future in as_completed(futures):
+            for docx_path, result in future.result().items():
+                docx_file = os.path.basename(docx_path)
+                if isinstance(result, Exception):
+                    print(f'Ошибка при конвертации {docx_file}: {result}')
+                else:
+                    manifest.record(docx_path, [result])
+                    print(f'Файл {os.path.basename(result)} успешно создан.')
 
 if __name__ == '__main__':
-    convert_docx_to_pdf()
+    parser = argparse.ArgumentParser(description="Конвертация DOCX в PDF")
+    parser.add_argument("--docx-dir", default='docx')
+    parser.add_argument("--pdf-dir", default='pdf')
+    parser.add_argument("--backend", choices=CONVERTER_BACKENDS, default=DEFAULT_BACKEND)
+    parser.add_argument("--workers", type=int, default=CONVERT_WORKERS, help="Количество экземпляров LibreOffice")
+    parser.add_argument("--check", choices=CHECK_MODES, default='mtime',
+                        help="Как определять изменившиеся документы: по времени изменения или по хэшу")
+    parser.add_argument("--force", action="store_true", help="Конвертировать все документы заново")
+    args = parser.parse_args()
+
+    convert_docx_to_pdf(args.docx_dir, args.pdf_dir, backend=args.backend, workers=args.workers,
+                        incremental=not args.force, check_mode=args.check)
@@ -0,0 +1,130 @@
+import os
+import argparse
+import numpy as np
+from ultralytics import YOLO
+
+from main import (MODEL_INPUT_SIZE, CLASS_ID_TO_KEY, DECODERS, load_model, detect_batch, build_annotation)
+
+# Порог IoU, начиная с которого боксы двух бэкендов считаются одним и тем же боксом
+PARITY_IOU_THRESHOLD = 0.9
+
+
+def export_onnx(model_path='final_best.pt', imgsz=MODEL_INPUT_SIZE, dynamic=True, simplify=True):
+    """
+    Экспортирует обученную модель разметки документов в ONNX.
+    :param dynamic: Динамические размеры пакета и входа (нужно для пакетного инференса страниц).
+    :return: Путь к созданному ONNX-файлу (рядом с исходной моделью).
+    """
+    model = YOLO(model_path)
+    return model.export(format='onnx', imgsz=imgsz, dynamic=dynamic, simplify=simplify)
+
+
+def box_iou(box1, box2):
+    x1 = max(box1[0], box2[0])
+    y1 = max(box1[1], box2[1])
+    x2 = min(box1[2], box2[2])
+    y2 = min(box1[3], box2[3])
+    intersection = max(0, x2 - x1) * max(0, y2 - y1)
+    area1 = (box1[2] - box1[0]) * (box1[3] - box1[1])
+    area2 = (box2[2] - box2[0]) * (box2[3] - box2[1])
+    union = area1 + area2 - intersection
+    return intersection / union if union > 0 else 0.0
+
+
+def compare_annotations(reference, candidate, iou_threshold=PARITY_IOU_THRESHOLD):
+    """
+    Сравнивает два JSON одной страницы по классам: бокс кандидата считается совпавшим,
+    если его IoU с ещё не сопоставленным боксом эталона того же класса не меньше iou_threshold.
+    :return: (число совпавших боксов, число боксов эталона, число боксов кандидата, список IoU совпавших).
+    """
+    matched = 0
+    ious = []
+    reference_total = 0
+    candidate_total = 0
+    for key in CLASS_ID_TO_KEY.values():
+        reference_boxes = list(reference[key])
+        candidate_boxes = candidate[key]
+        reference_total += len(reference_boxes)
+        candidate_total += len(candidate_boxes)
+        for box in candidate_boxes:
+            if not reference_boxes:
+                break
+            best_iou, best_idx = max((box_iou(box, ref), idx) for idx, ref in enumerate(reference_boxes))
+            if best_iou >= iou_threshold:
+                matched += 1
+                ious.append(best_iou)
+                reference_boxes.pop(best_idx)
+    return matched, reference_total, candidate_total, ious
+
+
+def check_parity(torch_model_path, onnx_model_path, input_dir, max_images=20, iou_threshold=PARITY_IOU_THRESHOLD):
+    """
+    Сравнивает JSON-разметку бэкендов PyTorch и ONNX Runtime на изображениях из input_dir.
+    :return: Словарь со сводкой сравнения; ключ "passed" равен True, если все боксы совпали.
+    """
+    torch_model = load_model("torch", torch_model_path)
+    onnx_model = load_model("onnx", onnx_model_path)
+
+    image_files = sorted(f for f in os.listdir(input_dir) if f.lower().endswith(('.png', '.jpg', '.jpeg')))
+    image_files = image_files[:max_images]
+
+    identical_pages = 0
+    matched_total = reference_total = candidate_total = 0
+    all_ious = []
+    for image_file in image_files:
+        image_path = os.path.join(input_dir, image_file)
+        decoded = DECODERS["full"](image_path)
+        if decoded is None:
+            print(f"Не удалось загрузить изображение: {image_file}")
+            continue
+        image, image_height, image_width = decoded
+
+        annotations = []
+        for model in (torch_model, onnx_model):
+            detections = detect_batch(model, [image])[0]
+            annotations.append(build_annotation(detections, image_file, image_path, image_height, image_width))
+        reference, candidate = annotations
+
+        if reference == candidate:
+            identical_pages += 1
+        matched, page_reference, page_candidate, ious = compare_annotations(reference, candidate, iou_threshold)
+        matched_total += matched
+        reference_total += page_reference
+        candidate_total += page_candidate
+        all_ious.extend(ious)
+        print(f"{image_file}: совпало {matched} из {page_reference} (PyTorch) / {page_candidate} (ONNX) боксов")
+
+    summary = {
+        "pages": len(image_files),
+        "identical_pages": identical_pages,
+        "matched_boxes": matched_total,
+        "torch_boxes": reference_total,
+        "onnx_boxes": candidate_total,
+        "mean_iou": float(np.mean(all_ious)) if all_ious else None,
+        "passed": matched_total == reference_total == candidate_total
+    }
+    print(f"Страниц с идентичным JSON: {identical_pages} из {len(image_files)}")
+    print(f"Совпавших боксов: {matched_total}, PyTorch: {reference_total}, ONNX: {candidate_total}, "
+          f"средний IoU: {summary['mean_iou']}")
+    print("Паритет подтверждён" if summary["passed"] else "Паритет НЕ подтверждён")
+    return summary
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Экспорт модели разметки в ONNX и проверка паритета с PyTorch")
+    parser.add_argument("--model", default='final_best.pt')
+    parser.add_argument("--imgsz", type=int, default=MODEL_INPUT_SIZE)
+    parser.add_argument("--input-dir", default='input/images', help="Изображения для проверки паритета")
+    parser.add_argument("--max-images", type=int, default=20)
+    parser.add_argument("--skip-parity", action="store_true")
+    args = parser.parse_args()
+
+    onnx_path = export_onnx(args.model, imgsz=args.imgsz)
+    print(f"Модель экспортирована: {onnx_path}")
+
+    if not args.skip_parity:
+        check_parity(args.model, onnx_path, args.input_dir, max_images=args.max_images)
+
+
+if __name__ == "__main__":
+    main()
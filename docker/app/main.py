@@ -1,162 +1,1122 @@
 import os
 import cv2
 import json
+import time
+import ast
+import zlib
+import argparse
+import queue
+import threading
+import dataclasses
+import numpy as np
+import pypdfium2 as pdfium
+from PIL import Image
+from scipy.sparse.csgraph import connected_components
 from ultralytics import YOLO
 import supervision as sv
 
-def process_images(model, input_dir, output_image_dir, output_json_dir):
-    # Создаём директории для выходных данных, если они не существуют
-    os.makedirs(output_image_dir, exist_ok=True)
-    os.makedirs(output_json_dir, exist_ok=True)
-    
-    # Получаем список изображений
-    image_files = [f for f in os.listdir(input_dir) if f.lower().endswith(('.png', '.jpg', '.jpeg'))]
-    
-    # Определяем цвета для классов (опционально, если необходимо для визуализации)
-    class_colors = [
-        sv.Color(255, 0, 0),    # Красный для "Title"
-        sv.Color(0, 255, 0),    # Зеленый для "Paragraph"
-        sv.Color(0, 0, 255),    # Синий для "Table"
-        sv.Color(255, 255, 0),  # Желтый для "Picture"
-        sv.Color(255, 0, 255),  # Магента для "Table_signature"
-        sv.Color(0, 255, 255),  # Циан для "Picture_signature"
-        sv.Color(128, 0, 128),  # Фиолетовый для "Numbered_list"
-        sv.Color(128, 128, 0),  # Оливковый для "Marked_list"
-        sv.Color(128, 128, 128),# Серый для "Header"
-        sv.Color(0, 128, 128),  # Бирюзовый для "Footer"
-        sv.Color(64, 0, 0),      # Тёмно-красный для "Footnote"
-        sv.Color(128, 64, 0),    # Коричневый для "Formula"
-        sv.Color(128, 0, 64)     # Тёмно-фиолетовый для "Graph"
-    ]
-    
+# Пороги детекции
+CONF_THRESHOLD = 0.2
+IOU_THRESHOLD = 0.8
+
+# Параметры пакетного инференса
+BATCH_SIZE = 8  # Количество страниц в одном прямом проходе модели
+BATCH_MAX_WAIT = 0.5  # Максимальное ожидание (в секундах) добора неполного пакета
+QUEUE_SIZE = 2 * BATCH_SIZE  # Сколько декодированных страниц может ждать в очереди
+
+# Параметры конвейера: чтение -> инференс -> запись
+READER_THREADS = 2  # Потоки декодирования изображений
+WRITER_THREADS = 2  # Потоки отрисовки и записи PNG/JSON
+WRITE_QUEUE_SIZE = 2 * BATCH_SIZE  # Сколько обработанных страниц может ждать записи
+
+# Режимы сохранения аннотированных изображений:
+# "all" - для каждой страницы, "sample" - для доли страниц VISUALIZE_SAMPLE_RATE, "none" - не сохранять.
+# В режимах "sample" и "none" недостающие изображения можно построить позже по JSON (см. render_from_json)
+VISUALIZE_MODES = ("all", "sample", "none")
+VISUALIZE_MODE = "all"
+VISUALIZE_SAMPLE_RATE = 0.05
+
+# Размер входа модели (длинная сторона), используется при декодировании с уменьшением
+MODEL_INPUT_SIZE = 640
+
+# Разрешение, в котором растрируются страницы PDF (как в extract_images_pdf2image.py)
+PDF_DPI = 300
+
+# PDFium не потокобезопасен: все вызовы pypdfium2 из разных потоков (сервер, поток чтения PDF)
+# выполняются под этой блокировкой, параллельно идёт только остальная обработка страниц
+PDFIUM_LOCK = threading.Lock()
+
+# Бэкенды инференса: "torch" - ultralytics/PyTorch (final_best.pt), "onnx" - ONNX Runtime на CPU (final_best.onnx),
+# "onnx-int8" - квантованная в INT8 модель (final_best_int8.onnx, см. quantize.py)
+BACKENDS = ("torch", "onnx", "onnx-int8")
+MODEL_PATHS = {
+    "torch": 'final_best.pt',
+    "onnx": 'final_best.onnx',
+    "onnx-int8": 'final_best_int8.onnx',
+}
+ONNX_INTRA_OP_THREADS = 0  # Потоки внутри оператора (0 - по числу ядер)
+ONNX_INTER_OP_THREADS = 0  # Потоки между независимыми операторами (0 - по умолчанию ONNX Runtime)
+MAX_DETECTIONS = 300  # Максимум боксов на страницу, как в ultralytics
+
+# Адаптивный режим: быстрый проход по всей странице, затем тайлы высокого разрешения
+# только вокруг мелких или неуверенных детекций
+ADAPTIVE_SMALL_CLASSES = ("footnote", "formula")  # Классы, которые всегда перепроверяются тайлами
+ADAPTIVE_SMALL_AREA = 0.002  # Бокс площадью меньше этой доли страницы считается мелким
+ADAPTIVE_LOW_CONF = 0.4  # Бокс с уверенностью ниже порога считается неуверенным
+# Сторона тайла в пикселях декодированного изображения. Тайлы имеют смысл только для страницы в полном
+# разрешении (для 300 dpi в ~2.7 раза детальнее, чем вся страница в 640), поэтому адаптивный режим
+# не совместим с --decoder reduced
+TILE_SIZE = 1280
+TILE_MAX_PER_PAGE = 8  # Ограничение числа тайлов на страницу
+TILE_MERGE_IOU = 0.5  # Порог IoU, выше которого бокс тайла считается дубликатом бокса того же класса
+TILE_BORDER = 4  # Боксы, касающиеся внутренней границы тайла, считаются обрезанными и отбрасываются
+
+# Определяем цвета для классов (опционально, если необходимо для визуализации)
+CLASS_COLORS = [
+    sv.Color(255, 0, 0),    # Красный для "Title"
+    sv.Color(0, 255, 0),    # Зеленый для "Paragraph"
+    sv.Color(0, 0, 255),    # Синий для "Table"
+    sv.Color(255, 255, 0),  # Желтый для "Picture"
+    sv.Color(255, 0, 255),  # Магента для "Table_signature"
+    sv.Color(0, 255, 255),  # Циан для "Picture_signature"
+    sv.Color(128, 0, 128),  # Фиолетовый для "Numbered_list"
+    sv.Color(128, 128, 0),  # Оливковый для "Marked_list"
+    sv.Color(128, 128, 128),# Серый для "Header"
+    sv.Color(0, 128, 128),  # Бирюзовый для "Footer"
+    sv.Color(64, 0, 0),      # Тёмно-красный для "Footnote"
+    sv.Color(128, 64, 0),    # Коричневый для "Formula"
+    sv.Color(128, 0, 64)     # Тёмно-фиолетовый для "Graph"
+]
+
+# Словарь для соответствия class_id ключам JSON
+CLASS_ID_TO_KEY = {
+    0: "title",
+    1: "paragraph",
+    2: "table",
+    3: "picture",
+    4: "table_signature",
+    5: "picture_signature",
+    6: "numbered_list",
+    7: "marked_list",
+    8: "header",
+    9: "footer",
+    10: "footnote",
+    11: "formula",
+    12: "graph"
+}
+KEY_TO_CLASS_ID = {key: class_id for class_id, key in CLASS_ID_TO_KEY.items()}
+
+
+def create_annotators():
     # Инициализируем аннотаторы (опционально)
     box_annotator = sv.BoxAnnotator(
-        color=sv.ColorPalette(class_colors),
+        color=sv.ColorPalette(CLASS_COLORS),
         thickness=3
     )
-    
+
     label_annotator = sv.LabelAnnotator(
-        color=sv.ColorPalette(class_colors),
+        color=sv.ColorPalette(CLASS_COLORS),
         text_color=sv.Color(255, 255, 255)
     )
-    
-    # Словарь для соответствия class_id ключам JSON
-    class_id_to_key = {
-        0: "title",
-        1: "paragraph",
-        2: "table",
-        3: "picture",
-        4: "table_signature",
-        5: "picture_signature",
-        6: "numbered_list",
-        7: "marked_list",
-        8: "header",
-        9: "footer",
-        10: "footnote",
-        11: "formula",
-        12: "graph"
-    }
-    
-    # Обработка каждого изображения
-    for image_file in image_files:
+
+    return box_annotator, label_annotator
+
+
+def decode_full(image_path):
+    """
+    Декодирует изображение в исходном разрешении.
+    :return: (изображение BGR, исходная высота, исходная ширина) или None, если файл не читается.
+    """
+    image = cv2.imread(image_path)
+    if image is None:
+        return None
+    image_height, image_width = image.shape[:2]
+    return image, image_height, image_width
+
+
+# Флаги OpenCV для декодирования JPEG сразу с уменьшением в 2, 4 или 8 раз.
+# Уменьшение при декодировании есть только у JPEG (масштабирование DCT), PNG OpenCV всё равно
+# декодирует целиком и затем прореживает, поэтому для остальных форматов флаги не используются.
+REDUCED_DECODE_FLAGS = {
+    8: cv2.IMREAD_REDUCED_COLOR_8,
+    4: cv2.IMREAD_REDUCED_COLOR_4,
+    2: cv2.IMREAD_REDUCED_COLOR_2,
+}
+
+
+def decode_reduced(image_path, target_size=MODEL_INPUT_SIZE):
+    """
+    Декодирует изображение с максимальным уменьшением, при котором длинная сторона
+    остаётся не меньше target_size. Модель всё равно сжимает страницу до своего входа,
+    поэтому для страницы A4 в 300 dpi (3508x2480) достаточно уменьшения в 4 раза.
+    Быстрее полного декодирования только для JPEG; PNG декодируется в исходном размере
+    и уменьшается один раз через cv2.INTER_AREA.
+    :return: (изображение BGR, исходная высота, исходная ширина) или None, если файл не читается.
+    """
+    # Исходный размер и формат читаем из заголовка файла, не декодируя пиксели
+    try:
+        with Image.open(image_path) as img:
+            image_width, image_height = img.size
+            is_jpeg = img.format == "JPEG"
+    except (OSError, ValueError):
+        return None
+
+    factor = next((factor for factor in REDUCED_DECODE_FLAGS
+                   if max(image_width, image_height) / factor >= target_size), 1)
+
+    if is_jpeg:
+        image = cv2.imread(image_path, REDUCED_DECODE_FLAGS.get(factor, cv2.IMREAD_COLOR))
+    else:
+        image = cv2.imread(image_path)
+        if image is not None and factor > 1:
+            image = cv2.resize(image, (image_width // factor, image_height // factor),
+                               interpolation=cv2.INTER_AREA)
+    if image is None:
+        return None
+    return image, image_height, image_width
+
+
+# Доступные декодеры страниц
+DECODERS = {
+    "full": decode_full,
+    "reduced": decode_reduced,
+}
+
+
+def decode_bytes(data):
+    """
+    Декодирует изображение из содержимого файла (PNG/JPEG) в памяти.
+    :return: (изображение BGR, высота, ширина) или None, если данные не являются изображением.
+    """
+    image = cv2.imdecode(np.frombuffer(data, dtype=np.uint8), cv2.IMREAD_COLOR)
+    if image is None:
+        return None
+    image_height, image_width = image.shape[:2]
+    return image, image_height, image_width
+
+
+def render_pdf_pages(pdf, dpi=PDF_DPI, target_size=None, page_numbers=None):
+    """
+    Растрирует страницы PDF в памяти, не сохраняя их на диск.
+    :param pdf: Путь к PDF-файлу или его содержимое (bytes).
+    :param dpi: Разрешение, в котором страница описывается в JSON (image_height/image_width и координаты).
+    :param target_size: Если задан, страница растрируется сразу так, чтобы длинная сторона была target_size
+                        пикселей (размер входа модели), а не в полном разрешении dpi.
+    :param page_numbers: Номера страниц (начиная с 1), которые нужно растрировать; по умолчанию все.
+    :return: Генератор (номер страницы начиная с 1, изображение BGR, высота и ширина страницы в dpi).
+    """
+    # Блокировка берётся на каждое обращение к PDFium, а не на весь генератор,
+    # чтобы потребитель мог обрабатывать страницу, пока другой поток растрирует свою
+    with PDFIUM_LOCK:
+        document = pdfium.PdfDocument(pdf)
+        page_count = len(document)
+    try:
+        page_indices = range(page_count) if page_numbers is None else [n - 1 for n in page_numbers]
+        for page_index in page_indices:
+            with PDFIUM_LOCK:
+                page = document[page_index]
+                try:
+                    # Размер страницы в пунктах (1/72 дюйма)
+                    page_width_pt, page_height_pt = page.get_size()
+                    image_height = round(page_height_pt * dpi / 72)
+                    image_width = round(page_width_pt * dpi / 72)
+
+                    scale = dpi / 72
+                    if target_size is not None:
+                        scale = min(scale, target_size / max(page_width_pt, page_height_pt))
+
+                    # Копируем массив, так как to_numpy() ссылается на буфер битмапа pdfium
+                    bitmap = page.render(scale=scale)
+                    image = bitmap.to_numpy().copy()
+                    bitmap.close()
+                finally:
+                    page.close()
+            yield page_index + 1, image, image_height, image_width
+    finally:
+        with PDFIUM_LOCK:
+            document.close()
+
+
+class PipelineStats:
+    """
+    Потокобезопасный сбор времени работы стадий конвейера и глубины очередей между ними.
+    """
+
+    def __init__(self):
+        self.lock = threading.Lock()
+        self.stage_times = {}  # стадия -> [количество, суммарное время, максимальное время]
+        self.queue_depths = {}  # очередь -> [количество замеров, сумма, максимум]
+        self.started = time.monotonic()
+
+    def add_time(self, stage, seconds):
+        with self.lock:
+            entry = self.stage_times.setdefault(stage, [0, 0.0, 0.0])
+            entry[0] += 1
+            entry[1] += seconds
+            entry[2] = max(entry[2], seconds)
+
+    def add_queue_depth(self, name, depth):
+        with self.lock:
+            entry = self.queue_depths.setdefault(name, [0, 0, 0])
+            entry[0] += 1
+            entry[1] += depth
+            entry[2] = max(entry[2], depth)
+
+    def summary(self):
+        with self.lock:
+            return {
+                "wall_time": time.monotonic() - self.started,
+                "stages": {
+                    stage: {"count": count, "total": total, "mean": total / count, "max": max_time}
+                    for stage, (count, total, max_time) in self.stage_times.items()
+                },
+                "queues": {
+                    name: {"samples": samples, "mean": total / samples, "max": max_depth}
+                    for name, (samples, total, max_depth) in self.queue_depths.items()
+                }
+            }
+
+    def print_summary(self):
+        summary = self.summary()
+        print(f"Общее время: {summary['wall_time']:.2f} с")
+        for stage, stats in summary["stages"].items():
+            print(f"Стадия {stage}: {stats['count']} операций, всего {stats['total']:.2f} с, "
+                  f"в среднем {stats['mean'] * 1000:.1f} мс, максимум {stats['max'] * 1000:.1f} мс")
+        for name, stats in summary["queues"].items():
+            print(f"Очередь {name}: средняя глубина {stats['mean']:.1f}, максимальная {stats['max']}")
+
+
+def load_images(input_dir, file_queue, page_queue, decoder=decode_full, stats=None):
+    """
+    Поток чтения: берёт имена файлов из file_queue, декодирует изображения (один раз на страницу)
+    и кладёт их в очередь для пакетного инференса.
+    """
+    while True:
+        try:
+            image_file = file_queue.get_nowait()
+        except queue.Empty:
+            return
+
         # Полный путь к изображению
         image_path = os.path.join(input_dir, image_file)
-        
+
         # Загружаем изображение
-        image = cv2.imread(image_path)
-        if image is None:
+        started = time.monotonic()
+        try:
+            decoded = decoder(image_path)
+        except Exception as e:
+            print(f"Ошибка при чтении изображения {image_file}: {e}")
+            continue
+        if stats is not None:
+            stats.add_time("read", time.monotonic() - started)
+        if decoded is None:
             print(f"Не удалось загрузить изображение: {image_file}")
             continue
-        
+        image, image_height, image_width = decoded
+
+        page_queue.put({
+            "image_file": image_file,
+            "image_path": image_path,
+            "image": image,
+            "image_height": image_height,
+            "image_width": image_width
+        })
+
+
+def run_readers(input_dir, image_files, page_queue, decoder=decode_full, stats=None, num_threads=READER_THREADS):
+    """
+    Запускает потоки чтения и, когда все они закончат, кладёт в page_queue None как признак конца данных.
+    """
+    file_queue = queue.Queue()
+    for image_file in image_files:
+        file_queue.put(image_file)
+
+    readers = [
+        threading.Thread(target=load_images, args=(input_dir, file_queue, page_queue, decoder, stats), daemon=True)
+        for _ in range(num_threads)
+    ]
+    try:
+        for reader in readers:
+            reader.start()
+        for reader in readers:
+            reader.join()
+    finally:
+        page_queue.put(None)
+
+
+def iter_batches(page_queue, batch_size=BATCH_SIZE, max_wait=BATCH_MAX_WAIT):
+    """
+    Собирает страницы из очереди в пакеты по batch_size штук.
+    Неполный пакет отдаётся, если с момента прихода его первой страницы прошло max_wait секунд.
+    """
+    batch = []
+    deadline = None
+    while True:
+        timeout = None if deadline is None else max(0.0, deadline - time.monotonic())
+        try:
+            page = page_queue.get(timeout=timeout)
+        except queue.Empty:
+            # Время ожидания истекло — отдаём то, что успели собрать
+            yield batch
+            batch = []
+            deadline = None
+            continue
+
+        if page is None:
+            if batch:
+                yield batch
+            return
+
+        batch.append(page)
+        if len(batch) == 1:
+            deadline = time.monotonic() + max_wait
+        if len(batch) >= batch_size:
+            yield batch
+            batch = []
+            deadline = None
+
+
+def letterbox(image, new_shape, auto=False, stride=32):
+    """
+    Масштабирует изображение с сохранением пропорций и дополняет его рамкой до new_shape
+    так же, как это делает ultralytics при инференсе.
+    :param auto: Дополнять только до кратности stride (прямоугольный вход для динамической модели).
+    :return: (изображение, коэффициент масштабирования, (отступ слева, отступ сверху)).
+    """
+    height, width = image.shape[:2]
+    new_height, new_width = new_shape
+    ratio = min(new_height / height, new_width / width)
+    unpad_width, unpad_height = int(round(width * ratio)), int(round(height * ratio))
+
+    pad_width, pad_height = new_width - unpad_width, new_height - unpad_height
+    if auto:
+        pad_width, pad_height = pad_width % stride, pad_height % stride
+    pad_width /= 2
+    pad_height /= 2
+
+    if (width, height) != (unpad_width, unpad_height):
+        image = cv2.resize(image, (unpad_width, unpad_height), interpolation=cv2.INTER_LINEAR)
+    top, bottom = int(round(pad_height - 0.1)), int(round(pad_height + 0.1))
+    left, right = int(round(pad_width - 0.1)), int(round(pad_width + 0.1))
+    image = cv2.copyMakeBorder(image, top, bottom, left, right, cv2.BORDER_CONSTANT, value=(114, 114, 114))
+    return image, ratio, (left, top)
+
+
+def nms(boxes, scores, iou_threshold):
+    """
+    Жадное подавление немаксимумов.
+    :param boxes: Массив (N, 4) в формате [x1, y1, x2, y2].
+    :return: Индексы оставленных боксов по убыванию score.
+    """
+    areas = (boxes[:, 2] - boxes[:, 0]) * (boxes[:, 3] - boxes[:, 1])
+    order = scores.argsort()[::-1]
+    keep = []
+    while order.size > 0:
+        current = order[0]
+        keep.append(current)
+        rest = order[1:]
+        x1 = np.maximum(boxes[current, 0], boxes[rest, 0])
+        y1 = np.maximum(boxes[current, 1], boxes[rest, 1])
+        x2 = np.minimum(boxes[current, 2], boxes[rest, 2])
+        y2 = np.minimum(boxes[current, 3], boxes[rest, 3])
+        intersection = np.clip(x2 - x1, 0, None) * np.clip(y2 - y1, 0, None)
+        iou = intersection / (areas[current] + areas[rest] - intersection + 1e-9)
+        order = rest[iou <= iou_threshold]
+    return np.array(keep, dtype=int)
+
+
+class OnnxDetector:
+    """
+    Детектор на ONNX Runtime (CPU) для модели, экспортированной export_onnx.py.
+    Предобработка и постобработка повторяют ultralytics, поэтому JSON совпадает с бэкендом PyTorch.
+    """
+
+    def __init__(self, model_path, imgsz=None,
+                 intra_op_threads=ONNX_INTRA_OP_THREADS, inter_op_threads=ONNX_INTER_OP_THREADS):
+        """
+        :param imgsz: Размер входа для модели с динамическими размерами, если его нет в метаданных модели.
+                      У статической модели размер входа всегда берётся из её входного тензора.
+        """
+        # onnxruntime нужен только этому бэкенду
+        import onnxruntime as ort
+
+        options = ort.SessionOptions()
+        options.graph_optimization_level = ort.GraphOptimizationLevel.ORT_ENABLE_ALL
+        options.intra_op_num_threads = intra_op_threads
+        options.inter_op_num_threads = inter_op_threads
+        if inter_op_threads > 1:
+            options.execution_mode = ort.ExecutionMode.ORT_PARALLEL
+        self.session = ort.InferenceSession(model_path, sess_options=options, providers=['CPUExecutionProvider'])
+
+        # ultralytics сохраняет имена классов, stride и размер входа при экспорте в метаданных модели
+        metadata = self.session.get_modelmeta().custom_metadata_map
+        self.names = ast.literal_eval(metadata['names']) if 'names' in metadata else dict(CLASS_ID_TO_KEY)
+        self.stride = int(metadata.get('stride', 32))
+
+        model_input = self.session.get_inputs()[0]
+        self.input_name = model_input.name
+        # У динамической модели размеры входа символьные, тогда берём imgsz, с которым она экспортирована
+        input_batch, _, input_height, input_width = model_input.shape
+        # Модель со статическим размером пакета (экспорт с dynamic=False - пакет из 1) принимает только
+        # пакеты этого размера, поэтому detect разбивает пакет страниц на части
+        self.max_batch = input_batch if isinstance(input_batch, int) else None
+        self.dynamic = not (isinstance(input_height, int) and isinstance(input_width, int))
+        if not self.dynamic:
+            self.input_shape = (input_height, input_width)
+        elif imgsz is not None:
+            self.input_shape = (imgsz, imgsz) if isinstance(imgsz, int) else tuple(imgsz)
+        elif 'imgsz' in metadata:
+            self.input_shape = tuple(ast.literal_eval(metadata['imgsz']))
+        else:
+            self.input_shape = (MODEL_INPUT_SIZE, MODEL_INPUT_SIZE)
+
+    def preprocess(self, images):
+        """
+        Готовит пакет изображений BGR ко входу модели (letterbox, RGB, CHW, 0..1).
+        Используется и при калибровке квантизации (quantize.py), чтобы вход совпадал с инференсом.
+        :return: (массив пакета, список (ratio, pad) для каждого изображения).
+        """
+        # Как и ultralytics, для пакета одинаковых страниц дополняем вход только до кратности stride
+        auto = self.dynamic and len({image.shape for image in images}) == 1
+        inputs = []
+        transforms = []
+        for image in images:
+            resized, ratio, pad = letterbox(image, self.input_shape, auto=auto, stride=self.stride)
+            inputs.append(resized[:, :, ::-1].transpose(2, 0, 1))  # BGR -> RGB, HWC -> CHW
+            transforms.append((ratio, pad))
+        return np.ascontiguousarray(np.stack(inputs), dtype=np.float32) / 255.0, transforms
+
+    def detect(self, images, conf=CONF_THRESHOLD, iou=IOU_THRESHOLD):
+        """
+        Выполняет детекцию для пакета изображений BGR за один вызов сессии
+        (или по частям, если размер пакета модели статический).
+        :return: Список sv.Detections в том же порядке, что и images.
+        """
+        chunk_size = self.max_batch or max(1, len(images))
+        outputs = []
+        transforms = []
+        for start in range(0, len(images), chunk_size):
+            batch, chunk_transforms = self.preprocess(images[start:start + chunk_size])
+            if self.max_batch and len(batch) < self.max_batch:
+                # Неполную последнюю часть дополняем пустыми страницами до размера пакета модели
+                padding = np.zeros((self.max_batch - len(batch),) + batch.shape[1:], dtype=batch.dtype)
+                batch = np.concatenate([batch, padding])
+            # Выход модели: (пакет, 4 + число классов, число якорей), боксы в формате [cx, cy, w, h]
+            outputs.extend(self.session.run(None, {self.input_name: batch})[0][:len(chunk_transforms)])
+            transforms.extend(chunk_transforms)
+
+        detections = []
+        for image, prediction, (ratio, (pad_left, pad_top)) in zip(images, outputs, transforms):
+            prediction = prediction.T
+            scores = prediction[:, 4:]
+            class_ids = scores.argmax(axis=1)
+            confidences = scores[np.arange(len(scores)), class_ids]
+            mask = confidences > conf
+            boxes = prediction[mask, :4]
+            class_ids = class_ids[mask]
+            confidences = confidences[mask]
+
+            xyxy = np.empty_like(boxes)
+            xyxy[:, 0] = boxes[:, 0] - boxes[:, 2] / 2
+            xyxy[:, 1] = boxes[:, 1] - boxes[:, 3] / 2
+            xyxy[:, 2] = boxes[:, 0] + boxes[:, 2] / 2
+            xyxy[:, 3] = boxes[:, 1] + boxes[:, 3] / 2
+
+            # NMS по классам: сдвигаем боксы разных классов так, чтобы они не пересекались
+            offsets = class_ids[:, None].astype(np.float32) * 7680
+            keep = nms(xyxy + offsets, confidences, iou)[:MAX_DETECTIONS]
+            xyxy, class_ids, confidences = xyxy[keep], class_ids[keep], confidences[keep]
+
+            # Возвращаем координаты в систему исходного изображения
+            xyxy -= [pad_left, pad_top, pad_left, pad_top]
+            xyxy /= ratio
+            image_height, image_width = image.shape[:2]
+            xyxy[:, [0, 2]] = xyxy[:, [0, 2]].clip(0, image_width)
+            xyxy[:, [1, 3]] = xyxy[:, [1, 3]].clip(0, image_height)
+
+            detections.append(sv.Detections(
+                xyxy=xyxy.astype(np.float32).reshape(-1, 4),
+                confidence=confidences.astype(np.float32),
+                class_id=class_ids.astype(int),
+                data={"class_name": np.array([self.names[int(class_id)] for class_id in class_ids])}
+            ))
+        return detections
+
+
+def load_model(backend="torch", model_path=None,
+               intra_op_threads=ONNX_INTRA_OP_THREADS, inter_op_threads=ONNX_INTER_OP_THREADS):
+    """
+    Загружает модель для выбранного бэкенда.
+    """
+    model_path = model_path or MODEL_PATHS[backend]
+    if backend in ("onnx", "onnx-int8"):
+        return OnnxDetector(model_path, intra_op_threads=intra_op_threads, inter_op_threads=inter_op_threads)
+    return YOLO(model_path)
+
+
+def detect_batch(model, images):
+    """
+    Выполняет детекцию для пакета изображений за один прямой проход модели.
+    :return: Список sv.Detections в том же порядке, что и images.
+    """
+    if isinstance(model, OnnxDetector):
+        return model.detect(images, conf=CONF_THRESHOLD, iou=IOU_THRESHOLD)
+    results = model(images, conf=CONF_THRESHOLD, iou=IOU_THRESHOLD)
+    return [sv.Detections.from_ultralytics(result) for result in results]
+
+
+def select_tiles(detections, image_height, image_width, tile_size=TILE_SIZE, max_tiles=TILE_MAX_PER_PAGE):
+    """
+    Выбирает области страницы для повторной детекции в высоком разрешении:
+    вокруг мелких боксов, боксов классов ADAPTIVE_SMALL_CLASSES и неуверенных боксов.
+    Все размеры, включая tile_size, в пикселях декодированного изображения.
+    :return: Список тайлов [x0, y0, x1, y1] в координатах изображения.
+    """
+    if len(detections) == 0:
+        return []
+
+    xyxy = detections.xyxy
+    areas = (xyxy[:, 2] - xyxy[:, 0]) * (xyxy[:, 3] - xyxy[:, 1])
+    small_class_ids = [class_id for class_id, key in CLASS_ID_TO_KEY.items() if key in ADAPTIVE_SMALL_CLASSES]
+    candidates = (np.isin(detections.class_id, small_class_ids)
+                  | (areas < ADAPTIVE_SMALL_AREA * image_height * image_width))
+    if detections.confidence is not None:
+        candidates |= detections.confidence < ADAPTIVE_LOW_CONF
+
+    tiles = []
+    # Начинаем с самых неуверенных боксов, чтобы при ограничении числа тайлов перепроверить их в первую очередь
+    order = np.argsort(detections.confidence) if detections.confidence is not None else np.arange(len(detections))
+    for idx in order:
+        if not candidates[idx]:
+            continue
+        x1, y1, x2, y2 = xyxy[idx]
+        # Бокс уже целиком попадает в выбранный тайл
+        if any(tx0 <= x1 and ty0 <= y1 and x2 <= tx1 and y2 <= ty1 for tx0, ty0, tx1, ty1 in tiles):
+            continue
+        if len(tiles) >= max_tiles:
+            break
+
+        # Тайл размером tile_size с центром в центре бокса, сдвинутый внутрь страницы
+        width = min(max(tile_size, x2 - x1), image_width)
+        height = min(max(tile_size, y2 - y1), image_height)
+        tx0 = int(min(max(0, (x1 + x2) / 2 - width / 2), image_width - width))
+        ty0 = int(min(max(0, (y1 + y2) / 2 - height / 2), image_height - height))
+        tiles.append([tx0, ty0, int(tx0 + width), int(ty0 + height)])
+    return tiles
+
+
+def detect_adaptive(model, images):
+    """
+    Адаптивная детекция: обычный проход по страницам целиком, затем для страниц с мелкими или неуверенными
+    боксами дополнительный проход по тайлам в высоком разрешении (все тайлы пакета - одним вызовом модели).
+    Боксы тайлов переводятся в координаты страницы и добавляются к общему проходу (см. merge_tile_detections).
+    :return: Список sv.Detections в том же порядке, что и images.
+    """
+    page_detections = detect_batch(model, images)
+
+    crops = []
+    crop_origins = []  # (индекс страницы, тайл)
+    for page_idx, (image, detections) in enumerate(zip(images, page_detections)):
         image_height, image_width = image.shape[:2]
-        
-        # Выполняем детекцию
-        results = model(image_path, conf=0.2, iou=0.8)[0]
-        
-        # Конвертируем результаты в формат detections
-        detections = sv.Detections.from_ultralytics(results)
-        
-        # (Опционально) Рисуем боксы и сохраняем аннотированное изображение
-        annotated_image = box_annotator.annotate(
-            scene=image.copy(),
-            detections=detections
-        )
-        
-        annotated_image = label_annotator.annotate(
-            scene=annotated_image,
-            detections=detections
+        for tile in select_tiles(detections, image_height, image_width):
+            tx0, ty0, tx1, ty1 = tile
+            crops.append(image[ty0:ty1, tx0:tx1])
+            crop_origins.append((page_idx, tile))
+    if not crops:
+        return page_detections
+
+    tile_parts = [[] for _ in page_detections]
+    for (page_idx, tile), detections in zip(crop_origins, detect_batch(model, crops)):
+        if len(detections) == 0:
+            continue
+        tx0, ty0, tx1, ty1 = tile
+        image_height, image_width = images[page_idx].shape[:2]
+        xyxy = detections.xyxy + [tx0, ty0, tx0, ty0]
+
+        # Отбрасываем боксы, обрезанные внутренней границей тайла (граница страницы не считается)
+        cut = np.zeros(len(detections), dtype=bool)
+        if tx0 > 0:
+            cut |= xyxy[:, 0] <= tx0 + TILE_BORDER
+        if ty0 > 0:
+            cut |= xyxy[:, 1] <= ty0 + TILE_BORDER
+        if tx1 < image_width:
+            cut |= xyxy[:, 2] >= tx1 - TILE_BORDER
+        if ty1 < image_height:
+            cut |= xyxy[:, 3] >= ty1 - TILE_BORDER
+
+        detections = dataclasses.replace(detections, xyxy=xyxy)[~cut]
+        tile_parts[page_idx].append(detections)
+
+    return [merge_tile_detections(detections, parts) if parts else detections
+            for detections, parts in zip(page_detections, tile_parts)]
+
+
+def merge_tile_detections(page_detections, tile_parts, iou_threshold=TILE_MERGE_IOU):
+    """
+    Добавляет к детекциям общего прохода новые боксы из тайлов. Детекции общего прохода не меняются
+    (NMS к ним уже применён с IOU_THRESHOLD): дубликаты убираются только среди боксов тайлов -
+    между пересекающимися тайлами и с боксами общего прохода того же класса.
+    """
+    tile_detections = sv.Detections.merge(tile_parts)
+    if len(tile_detections) == 0:
+        return page_detections
+    # Соседние тайлы могут пересекаться и найти один и тот же объект
+    tile_detections = tile_detections.with_nms(threshold=iou_threshold, class_agnostic=False)
+    if len(page_detections) > 0:
+        iou = sv.box_iou_batch(tile_detections.xyxy, page_detections.xyxy)
+        same_class = tile_detections.class_id[:, None] == page_detections.class_id[None, :]
+        duplicate = ((iou > iou_threshold) & same_class).any(axis=1)
+        tile_detections = tile_detections[~duplicate]
+    return sv.Detections.merge([page_detections, tile_detections])
+
+
+def rescale_detections(detections, image, image_height, image_width):
+    """
+    Переводит координаты боксов из декодированного изображения в исходное разрешение страницы.
+    """
+    decoded_height, decoded_width = image.shape[:2]
+    if (decoded_height, decoded_width) == (image_height, image_width):
+        return detections
+    scale_x = image_width / decoded_width
+    scale_y = image_height / decoded_height
+    return dataclasses.replace(detections, xyxy=detections.xyxy * [scale_x, scale_y, scale_x, scale_y])
+
+
+def merge_overlapping_boxes(boxes):
+    """
+    Объединяет пересекающиеся боксы в их общий охватывающий бокс.
+    Повторяет объединение, пока объединённые боксы продолжают пересекаться.
+    :param boxes: Массив (N, 4) в формате [x1, y1, x2, y2].
+    """
+    while len(boxes) > 1:
+        x1, y1, x2, y2 = boxes.T
+        overlap = ((x1[:, None] < x2[None, :]) & (x1[None, :] < x2[:, None])
+                   & (y1[:, None] < y2[None, :]) & (y1[None, :] < y2[:, None]))
+        num_groups, labels = connected_components(overlap, directed=False)
+        if num_groups == len(boxes):
+            break
+        merged = np.empty((num_groups, 4), dtype=boxes.dtype)
+        merged[:, :2] = np.iinfo(boxes.dtype).max if boxes.dtype.kind == 'i' else np.inf
+        merged[:, 2:] = np.iinfo(boxes.dtype).min if boxes.dtype.kind == 'i' else -np.inf
+        np.minimum.at(merged[:, 0], labels, x1)
+        np.minimum.at(merged[:, 1], labels, y1)
+        np.maximum.at(merged[:, 2], labels, x2)
+        np.maximum.at(merged[:, 3], labels, y2)
+        boxes = merged
+    return boxes
+
+
+def build_annotation(detections, image_file, image_path, image_height, image_width,
+                     nms_iou=None, merge_paragraphs=False):
+    """
+    Формирует JSON страницы из детекций: координаты округляются до целых и обрезаются по границам
+    изображения, боксы группируются по классам без поэлементного цикла на Python.
+    :param nms_iou: Если задан, дополнительно выполняется NMS по классам с этим порогом IoU.
+    :param merge_paragraphs: Объединять пересекающиеся боксы параграфов.
+    """
+    # Инициализируем структуру для текущего изображения
+    image_annotation = {
+        "image_height": image_height,
+        "image_width": image_width,
+        "image_path": image_path,
+    }
+    image_annotation.update({key: [] for key in CLASS_ID_TO_KEY.values()})
+
+    if nms_iou is not None and len(detections) > 0 and detections.confidence is not None:
+        detections = detections.with_nms(threshold=nms_iou, class_agnostic=False)
+
+    class_ids = np.asarray(detections.class_id, dtype=int)
+    known = np.isin(class_ids, list(CLASS_ID_TO_KEY))
+    for class_id in np.unique(class_ids[~known]):
+        print(f"Неизвестный class_id {class_id} в изображении {image_file}")
+
+    # Преобразуем координаты в целые числа внутри изображения
+    boxes = np.rint(detections.xyxy[known]).astype(int)
+    boxes[:, [0, 2]] = boxes[:, [0, 2]].clip(0, image_width)
+    boxes[:, [1, 3]] = boxes[:, [1, 3]].clip(0, image_height)
+
+    # Группируем боксы по классам, сохраняя порядок детекций внутри класса
+    class_ids = class_ids[known]
+    order = np.argsort(class_ids, kind='stable')
+    boxes, class_ids = boxes[order], class_ids[order]
+    unique_class_ids, starts = np.unique(class_ids, return_index=True)
+    for class_id, class_boxes in zip(unique_class_ids, np.split(boxes, starts[1:])):
+        key = CLASS_ID_TO_KEY[int(class_id)]
+        if merge_paragraphs and key == "paragraph":
+            class_boxes = merge_overlapping_boxes(class_boxes)
+        image_annotation[key] = class_boxes.tolist()
+
+    return image_annotation
+
+
+def save_annotated_image(image, detections, image_file, output_image_dir, box_annotator, label_annotator):
+    # Рисуем боксы и сохраняем аннотированное изображение
+    annotated_image = box_annotator.annotate(
+        scene=image.copy(),
+        detections=detections
+    )
+
+    annotated_image = label_annotator.annotate(
+        scene=annotated_image,
+        detections=detections
+    )
+
+    # Формируем путь для сохранения аннотированного изображения
+    output_image_path = os.path.join(output_image_dir, f"annotated_{image_file}")
+    cv2.imwrite(output_image_path, annotated_image)
+
+
+def save_annotation(image_annotation, image_file, output_json_dir):
+    # Формируем имя JSON-файла (например, image1.json)
+    base_name = os.path.splitext(image_file)[0]
+    json_file_name = f"{base_name}.json"
+    json_file_path = os.path.join(output_json_dir, json_file_name)
+
+    # Сохраняем аннотацию в отдельный JSON-файл
+    with open(json_file_path, 'w', encoding='utf-8') as json_file:
+        json.dump(image_annotation, json_file, ensure_ascii=False, indent=4)
+
+    return json_file_name
+
+
+def should_visualize(image_file, mode=VISUALIZE_MODE, sample_rate=VISUALIZE_SAMPLE_RATE):
+    """
+    Решает, нужно ли сохранять аннотированное изображение для страницы.
+    В режиме "sample" выбор зависит только от имени файла, поэтому при повторных запусках
+    визуализируются одни и те же страницы.
+    """
+    if mode == "all":
+        return True
+    if mode == "sample":
+        return zlib.crc32(image_file.encode('utf-8')) % 10000 < sample_rate * 10000
+    return False
+
+
+def write_page(page, detections, output_image_dir, output_json_dir, box_annotator, label_annotator,
+               visualize=True, postprocess=None):
+    image_file = page["image_file"]
+    image = page["image"]
+    image_height, image_width = page["image_height"], page["image_width"]
+
+    # (Опционально) Рисуем боксы на том же декодированном изображении и сохраняем его
+    if visualize:
+        save_annotated_image(image, detections, image_file, output_image_dir, box_annotator, label_annotator)
+
+    print(f"Обработано изображение: {image_file}")
+
+    # В JSON координаты всегда в исходном разрешении страницы
+    detections = rescale_detections(detections, image, image_height, image_width)
+    image_annotation = build_annotation(detections, image_file, page["image_path"], image_height, image_width,
+                                        **(postprocess or {}))
+    if "pdf_path" in page:
+        # Страница из PDF не сохраняется на диск, render_from_json растрирует её заново
+        image_annotation["pdf_path"] = page["pdf_path"]
+        image_annotation["page_number"] = page["page_number"]
+    json_file_name = save_annotation(image_annotation, image_file, output_json_dir)
+
+    print(f"JSON-файл сохранён: {json_file_name}")
+
+
+def write_results(write_queue, output_image_dir, output_json_dir, stats=None,
+                  visualize=VISUALIZE_MODE, sample_rate=VISUALIZE_SAMPLE_RATE, postprocess=None):
+    """
+    Поток записи: берёт страницы с результатами детекции из write_queue и сохраняет JSON
+    и, в зависимости от режима visualize, аннотированное PNG.
+    :param postprocess: Дополнительные параметры build_annotation (nms_iou, merge_paragraphs).
+    Завершается, получив None.
+    """
+    box_annotator, label_annotator = create_annotators()
+    while True:
+        item = write_queue.get()
+        if item is None:
+            return
+        page, detections = item
+
+        started = time.monotonic()
+        try:
+            write_page(page, detections, output_image_dir, output_json_dir, box_annotator, label_annotator,
+                       visualize=should_visualize(page["image_file"], visualize, sample_rate),
+                       postprocess=postprocess)
+        except Exception as e:
+            print(f"Ошибка при сохранении результатов для {page['image_file']}: {e}")
+        if stats is not None:
+            stats.add_time("write", time.monotonic() - started)
+
+
+def run_pipeline(model, reader, output_image_dir, output_json_dir,
+                 batch_size=BATCH_SIZE, max_wait=BATCH_MAX_WAIT, writer_threads=WRITER_THREADS,
+                 visualize=VISUALIZE_MODE, sample_rate=VISUALIZE_SAMPLE_RATE, adaptive=False, postprocess=None):
+    """
+    Общий конвейер: поток чтения -> один поток инференса -> потоки записи.
+    Стадии связаны ограниченными очередями, поэтому чтение и кодирование PNG/JSON
+    идут параллельно с работой модели.
+    :param reader: Функция reader(page_queue, stats), которая кладёт страницы в очередь
+                   и по окончании кладёт None.
+    :param adaptive: Использовать адаптивную детекцию с тайлами (см. detect_adaptive).
+    :param postprocess: Дополнительные параметры build_annotation (nms_iou, merge_paragraphs).
+    :return: Сводка по времени стадий и глубине очередей (см. PipelineStats.summary).
+    """
+    # Создаём директории для выходных данных, если они не существуют
+    if visualize != "none":
+        os.makedirs(output_image_dir, exist_ok=True)
+    os.makedirs(output_json_dir, exist_ok=True)
+
+    stats = PipelineStats()
+    page_queue = queue.Queue(maxsize=QUEUE_SIZE)
+    write_queue = queue.Queue(maxsize=WRITE_QUEUE_SIZE)
+
+    reader_thread = threading.Thread(target=reader, args=(page_queue, stats), daemon=True)
+    writers = [
+        threading.Thread(target=write_results,
+                         args=(write_queue, output_image_dir, output_json_dir, stats, visualize, sample_rate,
+                               postprocess),
+                         daemon=True)
+        for _ in range(writer_threads)
+    ]
+    reader_thread.start()
+    for writer in writers:
+        writer.start()
+
+    try:
+        # Обработка страниц пакетами
+        for batch in iter_batches(page_queue, batch_size=batch_size, max_wait=max_wait):
+            stats.add_queue_depth("read->infer", page_queue.qsize())
+            stats.add_queue_depth("infer->write", write_queue.qsize())
+
+            started = time.monotonic()
+            detect = detect_adaptive if adaptive else detect_batch
+            batch_detections = detect(model, [page["image"] for page in batch])
+            stats.add_time("infer", time.monotonic() - started)
+
+            # Раздаём результаты пакета по страницам
+            for page, detections in zip(batch, batch_detections):
+                write_queue.put((page, detections))
+    finally:
+        for _ in writers:
+            write_queue.put(None)
+        for writer in writers:
+            writer.join()
+    reader_thread.join()
+
+    stats.print_summary()
+    return stats.summary()
+
+
+def process_images(model, input_dir, output_image_dir, output_json_dir,
+                   batch_size=BATCH_SIZE, max_wait=BATCH_MAX_WAIT, decoder=decode_full,
+                   reader_threads=READER_THREADS, writer_threads=WRITER_THREADS,
+                   visualize=VISUALIZE_MODE, sample_rate=VISUALIZE_SAMPLE_RATE, adaptive=False, postprocess=None):
+    """
+    Размечает изображения страниц из input_dir.
+    :return: Сводка по времени стадий и глубине очередей (см. PipelineStats.summary).
+    """
+    # Получаем список изображений
+    image_files = [f for f in os.listdir(input_dir) if f.lower().endswith(('.png', '.jpg', '.jpeg'))]
+
+    def reader(page_queue, stats):
+        run_readers(input_dir, image_files, page_queue, decoder, stats, reader_threads)
+
+    return run_pipeline(model, reader, output_image_dir, output_json_dir,
+                        batch_size=batch_size, max_wait=max_wait, writer_threads=writer_threads,
+                        visualize=visualize, sample_rate=sample_rate, adaptive=adaptive,
+                        postprocess=postprocess)
+
+
+def render_pdfs(pdf_paths, page_queue, stats=None, dpi=PDF_DPI, target_size=MODEL_INPUT_SIZE):
+    """
+    Поток чтения для PDF: растрирует страницы в памяти и кладёт их в очередь для инференса.
+    Имена страниц совпадают с теми, что создаёт extract_images_pdf2image.py.
+    По окончании кладёт в page_queue None как признак конца данных.
+    """
+    try:
+        for pdf_path in pdf_paths:
+            pdf_name = os.path.splitext(os.path.basename(pdf_path))[0]
+            try:
+                pages = render_pdf_pages(pdf_path, dpi=dpi, target_size=target_size)
+                while True:
+                    started = time.monotonic()
+                    page = next(pages, None)
+                    if page is None:
+                        break
+                    if stats is not None:
+                        stats.add_time("read", time.monotonic() - started)
+                    page_number, image, image_height, image_width = page
+
+                    image_file = f"{pdf_name}_page_{page_number}.png"
+                    page_queue.put({
+                        "image_file": image_file,
+                        "image_path": image_file,
+                        "pdf_path": pdf_path,
+                        "page_number": page_number,
+                        "image": image,
+                        "image_height": image_height,
+                        "image_width": image_width
+                    })
+            except Exception as e:
+                print(f"Ошибка при растрировании {pdf_path}: {e}")
+    finally:
+        page_queue.put(None)
+
+
+def process_pdfs(model, pdf_paths, output_image_dir, output_json_dir,
+                 batch_size=BATCH_SIZE, max_wait=BATCH_MAX_WAIT, writer_threads=WRITER_THREADS,
+                 visualize="none", sample_rate=VISUALIZE_SAMPLE_RATE, target_size=MODEL_INPUT_SIZE,
+                 adaptive=False, postprocess=None):
+    """
+    Размечает PDF-документы напрямую, без промежуточных PNG на диске.
+    Страницы растрируются в памяти сразу в разрешении входа модели (target_size),
+    а координаты в JSON приводятся к странице в PDF_DPI, как при разметке PNG.
+    Для адаптивного режима тайлам нужна страница в полном разрешении, поэтому target_size игнорируется.
+    :return: Сводка по времени стадий и глубине очередей (см. PipelineStats.summary).
+    """
+    if adaptive:
+        target_size = None
+
+    def reader(page_queue, stats):
+        render_pdfs(pdf_paths, page_queue, stats, target_size=target_size)
+
+    return run_pipeline(model, reader, output_image_dir, output_json_dir,
+                        batch_size=batch_size, max_wait=max_wait, writer_threads=writer_threads,
+                        visualize=visualize, sample_rate=sample_rate, adaptive=adaptive,
+                        postprocess=postprocess)
+
+
+def render_from_json(json_dir, output_image_dir, decoder=decode_full):
+    """
+    Строит аннотированные изображения по уже сохранённым JSON-файлам, без запуска модели.
+    Используется, когда при инференсе визуализация была отключена или выборочной.
+    Изображение страницы берётся из поля "image_path", рисование такое же, как при инференсе.
+    Для JSON, полученных из PDF (--pdf), изображения страницы на диске нет: страница заново
+    растрируется из "pdf_path" в PDF_DPI, поэтому PDF должен оставаться по тому же пути.
+    """
+    os.makedirs(output_image_dir, exist_ok=True)
+    box_annotator, label_annotator = create_annotators()
+
+    json_files = [f for f in os.listdir(json_dir) if f.lower().endswith('.json')]
+    for json_file in json_files:
+        json_path = os.path.join(json_dir, json_file)
+        try:
+            with open(json_path, 'r', encoding='utf-8') as f:
+                image_annotation = json.load(f)
+        except Exception as e:
+            print(f"Ошибка при чтении JSON-файла {json_file}: {e}")
+            continue
+
+        image_path = image_annotation.get("image_path")
+        pdf_path = image_annotation.get("pdf_path")
+        if pdf_path is not None:
+            if not os.path.exists(pdf_path):
+                print(f"Не найден исходный PDF для {json_file}: {pdf_path}")
+                continue
+            try:
+                _, image, image_height, image_width = next(
+                    render_pdf_pages(pdf_path, page_numbers=[image_annotation["page_number"]]))
+            except Exception as e:
+                print(f"Ошибка при растрировании страницы {pdf_path} для {json_file}: {e}")
+                continue
+        else:
+            decoded = decoder(image_path) if image_path and os.path.exists(image_path) else None
+            if decoded is None:
+                print(f"Не удалось загрузить изображение для {json_file}: {image_path}")
+                continue
+            image, image_height, image_width = decoded
+
+        # Собираем боксы из JSON обратно в sv.Detections
+        xyxy = []
+        class_ids = []
+        for key, class_id in KEY_TO_CLASS_ID.items():
+            for box in image_annotation.get(key, []):
+                xyxy.append(box)
+                class_ids.append(class_id)
+        detections = sv.Detections(
+            xyxy=np.array(xyxy, dtype=np.float32).reshape(-1, 4),
+            class_id=np.array(class_ids, dtype=int),
+            data={"class_name": np.array([CLASS_ID_TO_KEY[class_id] for class_id in class_ids])}
         )
-        
-        # Формируем путь для сохранения аннотированного изображения
-        output_image_path = os.path.join(output_image_dir, f"annotated_{image_file}")
-        cv2.imwrite(output_image_path, annotated_image)
-        
-        print(f"Обработано изображение: {image_file}")
-        
-        # Инициализируем структуру для текущего изображения
-        image_annotation = {
-            "image_height": image_height,
-            "image_width": image_width,
-            "image_path": image_path,
-            "title": [],
-            "paragraph": [],
-            "table": [],
-            "picture": [],
-            "table_signature": [],
-            "picture_signature": [],
-            "numbered_list": [],
-            "marked_list": [],
-            "header": [],
-            "footer": [],
-            "footnote": [],
-            "formula": [],
-            "graph": []
-        }
-        
-        # Итерация по всем обнаруженным боксам
-        for idx, box in enumerate(detections.xyxy):
-            class_id = int(detections.class_id[idx])
-            if class_id in class_id_to_key:
-                key = class_id_to_key[class_id]
-                # Преобразуем координаты в список из 4 целых чисел
-                bbox = [
-                    int(box[0]),  # x1
-                    int(box[1]),  # y1
-                    int(box[2]),  # x2
-                    int(box[3])   # y2
-                ]
-                image_annotation[key].append(bbox)
-            else:
-                print(f"Неизвестный class_id {class_id} в изображении {image_file}")
-        
-        # Формируем имя JSON-файла (например, image1.json)
-        base_name = os.path.splitext(image_file)[0]
-        json_file_name = f"{base_name}.json"
-        json_file_path = os.path.join(output_json_dir, json_file_name)
-        
-        # Сохраняем аннотацию в отдельный JSON-файл
-        with open(json_file_path, 'w', encoding='utf-8') as json_file:
-            json.dump(image_annotation, json_file, ensure_ascii=False, indent=4)
-        
-        print(f"JSON-файл сохранён: {json_file_name}")
-    
+
+        # Переводим координаты из исходного разрешения в разрешение декодированного изображения
+        decoded_height, decoded_width = image.shape[:2]
+        scale_x = decoded_width / image_width
+        scale_y = decoded_height / image_height
+        detections.xyxy = detections.xyxy * [scale_x, scale_y, scale_x, scale_y]
+
+        save_annotated_image(image, detections, os.path.basename(image_path), output_image_dir,
+                             box_annotator, label_annotator)
+        print(f"Аннотированное изображение построено по {json_file}")
+
 
 def main():
-    # Загрузка модели
-    model = YOLO('final_best.pt')
-    
+    parser = argparse.ArgumentParser(description="Разметка изображений документов моделью YOLO")
+    parser.add_argument("--visualize", choices=VISUALIZE_MODES,
+                        help="Сохранять аннотированные изображения для всех страниц, для выборки или не сохранять "
+                             f"(по умолчанию {VISUALIZE_MODE} для изображений и none для PDF)")
+    parser.add_argument("--sample-rate", type=float, default=VISUALIZE_SAMPLE_RATE,
+                        help="Доля страниц, визуализируемых в режиме sample")
+    parser.add_argument("--render-only", action="store_true",
+                        help="Не запускать модель, а построить аннотированные изображения по готовым JSON")
+    parser.add_argument("--decoder", choices=list(DECODERS), default="full",
+                        help="Декодер страниц; reduced ускоряет декодирование страниц высокого разрешения")
+    parser.add_argument("--pdf", nargs="+",
+                        help="PDF-файлы или папки с PDF для разметки напрямую, без промежуточных PNG")
+    parser.add_argument("--backend", choices=BACKENDS, default="torch",
+                        help="torch - PyTorch (ultralytics), onnx - ONNX Runtime на CPU, "
+                             "onnx-int8 - квантованная модель на ONNX Runtime")
+    parser.add_argument("--model", help="Путь к модели (по умолчанию зависит от --backend, см. MODEL_PATHS)")
+    parser.add_argument("--threads", type=int, default=ONNX_INTRA_OP_THREADS,
+                        help="Число потоков внутри оператора для ONNX Runtime (0 - по числу ядер)")
+    parser.add_argument("--inter-op-threads", type=int, default=ONNX_INTER_OP_THREADS,
+                        help="Число потоков между операторами для ONNX Runtime")
+    parser.add_argument("--adaptive", action="store_true",
+                        help="Перепроверять мелкие и неуверенные детекции тайлами в высоком разрешении "
+                             "(только с --decoder full)")
+    parser.add_argument("--nms-iou", type=float,
+                        help="Дополнительный NMS по классам при формировании JSON с указанным порогом IoU")
+    parser.add_argument("--merge-paragraphs", action="store_true",
+                        help="Объединять пересекающиеся боксы параграфов")
+    parser.add_argument("--batch-size", type=int, default=BATCH_SIZE)
+    parser.add_argument("--max-wait", type=float, default=BATCH_MAX_WAIT)
+    args = parser.parse_args()
+    if args.adaptive and args.decoder != "full" and not args.pdf:
+        # Уменьшенная страница меньше тайла, и проход по тайлам только повторил бы общий проход
+        parser.error("--adaptive требует страниц в полном разрешении: используйте --decoder full")
+
     # Путь к входной директории с изображениями
     input_dir = 'input/images'
-    
+
     # Путь к выходной директории для аннотированных изображений
     output_image_dir = 'output/images_annotated'
-    
+
     # Путь к выходной директории для JSON-файлов
     output_json_dir = 'output/json_annotations'
-    
+
+    if args.render_only:
+        render_from_json(output_json_dir, output_image_dir, decoder=DECODERS[args.decoder])
+        return
+
+    postprocess = {"nms_iou": args.nms_iou, "merge_paragraphs": args.merge_paragraphs}
+
+    # Загрузка модели
+    model = load_model(args.backend, args.model,
+                       intra_op_threads=args.threads, inter_op_threads=args.inter_op_threads)
+
+    if args.pdf:
+        pdf_paths = []
+        for path in args.pdf:
+            if os.path.isdir(path):
+                pdf_paths.extend(os.path.join(path, f) for f in sorted(os.listdir(path)) if f.lower().endswith('.pdf'))
+            else:
+                pdf_paths.append(path)
+        process_pdfs(model, pdf_paths, output_image_dir, output_json_dir,
+                     batch_size=args.batch_size, max_wait=args.max_wait,
+                     visualize=args.visualize or "none",
+                     sample_rate=args.sample_rate, adaptive=args.adaptive, postprocess=postprocess)
+        return
+
     # Обработка изображений и генерация JSON
-    process_images(model, input_dir, output_image_dir, output_json_dir)
+    process_images(model, input_dir, output_image_dir, output_json_dir,
+                   batch_size=args.batch_size, max_wait=args.max_wait, decoder=DECODERS[args.decoder],
+                   visualize=args.visualize or VISUALIZE_MODE, sample_rate=args.sample_rate,
+                   adaptive=args.adaptive, postprocess=postprocess)
 
 if __name__ == "__main__":
     main()
-
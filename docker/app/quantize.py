@@ -0,0 +1,176 @@
+import os
+import json
+import time
+import random
+import argparse
+import numpy as np
+from onnxruntime.quantization import (CalibrationDataReader, CalibrationMethod, QuantFormat, QuantType,
+                                      quantize_static)
+from ultralytics import YOLO
+
+from main import MODEL_INPUT_SIZE, MODEL_PATHS, CLASS_ID_TO_KEY, DECODERS, OnnxDetector
+
+# Количество страниц для калибровки диапазонов активаций
+CALIBRATION_SAMPLES = 100
+
+
+class PageCalibrationReader(CalibrationDataReader):
+    """
+    Подаёт в калибровку страницы сгенерированного датасета с той же предобработкой, что и OnnxDetector.
+    Декодер должен совпадать с тем, что используется при инференсе (main.py --decoder),
+    иначе диапазоны активаций калибруются на других входах.
+    """
+
+    def __init__(self, detector, image_paths, decoder="full"):
+        self.detector = detector
+        self.image_paths = iter(image_paths)
+        self.decoder = DECODERS[decoder]
+
+    def get_next(self):
+        for image_path in self.image_paths:
+            decoded = self.decoder(image_path)
+            if decoded is None:
+                print(f"Не удалось загрузить изображение: {image_path}")
+                continue
+            image, _, _ = decoded
+            batch, _ = self.detector.preprocess([image])  # Пакет из 1 страницы, как при замере задержки
+            return {self.detector.input_name: batch}
+        return None
+
+
+def list_images(images_dir):
+    return sorted(os.path.join(images_dir, f) for f in os.listdir(images_dir)
+                  if f.lower().endswith(('.png', '.jpg', '.jpeg')))
+
+
+def quantize_model(onnx_path, calibration_dir, output_path=MODEL_PATHS["onnx-int8"],
+                   num_samples=CALIBRATION_SAMPLES, seed=0, decoder="full"):
+    """
+    Статическая пост-тренировочная квантизация модели в INT8 (веса INT8 по каналам, активации UINT8, формат QDQ).
+    Диапазоны активаций калибруются на случайной выборке из num_samples страниц calibration_dir.
+    :param decoder: Декодер страниц (см. main.DECODERS), тот же, что при инференсе.
+    :return: Путь к квантованной модели.
+    """
+    image_paths = list_images(calibration_dir)
+    random.Random(seed).shuffle(image_paths)
+    image_paths = image_paths[:num_samples]
+    print(f"Калибровка на {len(image_paths)} страницах из {calibration_dir}")
+
+    quantize_static(
+        onnx_path,
+        output_path,
+        PageCalibrationReader(OnnxDetector(onnx_path), image_paths, decoder),
+        quant_format=QuantFormat.QDQ,
+        activation_type=QuantType.QUInt8,
+        weight_type=QuantType.QInt8,
+        per_channel=True,
+        calibrate_method=CalibrationMethod.MinMax
+    )
+    print(f"Квантованная модель сохранена: {output_path}")
+    return output_path
+
+
+def measure_latency(model_path, image_paths, warmup=3):
+    """
+    Измеряет задержку детекции на страницу (пакет из одной страницы, без учёта декодирования).
+    :return: Словарь с средней, медианной и 95-перцентильной задержкой в миллисекундах.
+    """
+    detector = OnnxDetector(model_path)
+    images = []
+    for image_path in image_paths:
+        decoded = DECODERS["full"](image_path)
+        if decoded is not None:
+            images.append(decoded[0])
+
+    for image in images[:warmup]:
+        detector.detect([image])
+
+    latencies = []
+    for image in images:
+        started = time.perf_counter()
+        detector.detect([image])
+        latencies.append((time.perf_counter() - started) * 1000)
+    return {
+        "pages": len(latencies),
+        "mean_ms": float(np.mean(latencies)),
+        "p50_ms": float(np.percentile(latencies, 50)),
+        "p95_ms": float(np.percentile(latencies, 95))
+    }
+
+
+def evaluate_map(model_path, data_yaml, imgsz=MODEL_INPUT_SIZE):
+    """
+    Считает mAP модели на валидационной выборке датасета средствами ultralytics.
+    :return: Словарь с mAP50, mAP50-95 и mAP50-95 по классам.
+    """
+    metrics = YOLO(model_path, task='detect').val(data=data_yaml, imgsz=imgsz, batch=1, plots=False)
+    per_class = {CLASS_ID_TO_KEY[int(class_id)]: float(metrics.box.maps[class_id])
+                 for class_id in metrics.box.ap_class_index}
+    return {"map50": float(metrics.box.map50), "map50_95": float(metrics.box.map), "per_class": per_class}
+
+
+def write_report(report, output_dir='.'):
+    """
+    Сохраняет сравнение моделей в quantization_report.json и quantization_report.md.
+    """
+    with open(os.path.join(output_dir, 'quantization_report.json'), 'w', encoding='utf-8') as f:
+        json.dump(report, f, ensure_ascii=False, indent=4)
+
+    fp32, int8 = report["fp32"], report["int8"]
+    lines = [
+        "# Сравнение FP32 и INT8 моделей",
+        "",
+        "| Метрика | FP32 | INT8 |",
+        "|---|---|---|",
+        f"| mAP50 | {fp32['map50']:.4f} | {int8['map50']:.4f} |",
+        f"| mAP50-95 | {fp32['map50_95']:.4f} | {int8['map50_95']:.4f} |",
+        f"| Задержка, средняя (мс) | {fp32['latency']['mean_ms']:.1f} | {int8['latency']['mean_ms']:.1f} |",
+        f"| Задержка, p50 (мс) | {fp32['latency']['p50_ms']:.1f} | {int8['latency']['p50_ms']:.1f} |",
+        f"| Задержка, p95 (мс) | {fp32['latency']['p95_ms']:.1f} | {int8['latency']['p95_ms']:.1f} |",
+        "",
+        "## mAP50-95 по классам",
+        "",
+        "| Класс | FP32 | INT8 | Разница |",
+        "|---|---|---|---|",
+    ]
+    for key in CLASS_ID_TO_KEY.values():
+        if key in fp32["per_class"] and key in int8["per_class"]:
+            difference = int8["per_class"][key] - fp32["per_class"][key]
+            lines.append(f"| {key} | {fp32['per_class'][key]:.4f} | {int8['per_class'][key]:.4f} | {difference:+.4f} |")
+
+    with open(os.path.join(output_dir, 'quantization_report.md'), 'w', encoding='utf-8') as f:
+        f.write("\n".join(lines) + "\n")
+    print("\n".join(lines))
+
+
+def main():
+    parser = argparse.ArgumentParser(description="INT8-квантизация модели разметки и сравнение с FP32")
+    parser.add_argument("--model", default=MODEL_PATHS["onnx"], help="FP32 модель в ONNX (см. export_onnx.py)")
+    parser.add_argument("--output", default=MODEL_PATHS["onnx-int8"])
+    parser.add_argument("--calibration-dir", default='input/images', help="Страницы для калибровки")
+    parser.add_argument("--num-samples", type=int, default=CALIBRATION_SAMPLES)
+    parser.add_argument("--decoder", choices=list(DECODERS), default="full",
+                        help="Декодер страниц для калибровки; должен совпадать с --decoder при инференсе")
+    parser.add_argument("--data", help="dataset.yaml с валидационной выборкой для подсчёта mAP")
+    parser.add_argument("--latency-dir", default='input/images', help="Страницы для замера задержки")
+    parser.add_argument("--latency-pages", type=int, default=20)
+    args = parser.parse_args()
+
+    int8_path = quantize_model(args.model, args.calibration_dir, args.output, num_samples=args.num_samples,
+                               decoder=args.decoder)
+
+    if not args.data:
+        print("Файл --data не задан, сравнение mAP и задержки пропущено")
+        return
+
+    latency_pages = list_images(args.latency_dir)[:args.latency_pages]
+    report = {}
+    for name, model_path in (("fp32", args.model), ("int8", int8_path)):
+        report[name] = evaluate_map(model_path, args.data)
+        report[name]["latency"] = measure_latency(model_path, latency_pages)
+        report[name]["model"] = model_path
+    write_report(report)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,186 @@
+import json
+import queue
+import argparse
+import threading
+from concurrent.futures import Future
+from http.server import ThreadingHTTPServer, BaseHTTPRequestHandler
+from urllib.parse import urlparse, parse_qs
+import numpy as np
+
+from main import (BATCH_SIZE, BATCH_MAX_WAIT, QUEUE_SIZE, MODEL_INPUT_SIZE, BACKENDS,
+                  ONNX_INTRA_OP_THREADS, ONNX_INTER_OP_THREADS, iter_batches, load_model, detect_batch,
+                  decode_bytes, render_pdf_pages, rescale_detections, build_annotation)
+
+# Параметры сервиса
+HOST = '0.0.0.0'
+PORT = 8000
+MAX_BODY_SIZE = 200 * 1024 * 1024  # Максимальный размер загружаемого файла (200 МБ)
+
+
+class BatchingDetector:
+    """
+    Держит модель в памяти и объединяет страницы из одновременных запросов в пакеты.
+    Модель вызывается только из одного рабочего потока.
+    """
+
+    def __init__(self, model, batch_size=BATCH_SIZE, max_wait=BATCH_MAX_WAIT):
+        self.model = model
+        self.batch_size = batch_size
+        self.max_wait = max_wait
+        self.page_queue = queue.Queue(maxsize=QUEUE_SIZE)
+        self.worker = threading.Thread(target=self.run, daemon=True)
+        self.worker.start()
+
+    def submit(self, image):
+        """
+        Ставит изображение в очередь на детекцию.
+        :return: Future, результатом которого будет sv.Detections.
+        """
+        future = Future()
+        self.page_queue.put({"image": image, "future": future})
+        return future
+
+    def run(self):
+        for batch in iter_batches(self.page_queue, batch_size=self.batch_size, max_wait=self.max_wait):
+            try:
+                batch_detections = detect_batch(self.model, [page["image"] for page in batch])
+            except Exception as e:
+                for page in batch:
+                    page["future"].set_exception(e)
+                continue
+            for page, detections in zip(batch, batch_detections):
+                page["future"].set_result(detections)
+
+    def close(self):
+        self.page_queue.put(None)
+        self.worker.join()
+
+
+def annotate_pages(detector, pages):
+    """
+    Выполняет детекцию для списка страниц и формирует для каждой JSON той же схемы, что и process_images.
+    :param pages: Список словарей с ключами image_file, image, image_height, image_width.
+    """
+    # Сначала ставим в очередь все страницы, чтобы они попали в общие пакеты
+    futures = [detector.submit(page["image"]) for page in pages]
+
+    annotations = []
+    for page, future in zip(pages, futures):
+        detections = rescale_detections(future.result(), page["image"], page["image_height"], page["image_width"])
+        annotations.append(build_annotation(detections, page["image_file"], page["image_file"],
+                                            page["image_height"], page["image_width"]))
+    return annotations
+
+
+class InferenceRequestHandler(BaseHTTPRequestHandler):
+    """
+    GET  /health  - проверка готовности сервиса.
+    POST /predict - тело запроса: изображение (PNG/JPEG) или PDF.
+                    Для изображения возвращается JSON страницы, для PDF - список JSON по страницам.
+                    Параметр ?name= задаёт имя файла, которое попадёт в поле image_path.
+    """
+
+    def do_GET(self):
+        if urlparse(self.path).path == '/health':
+            self.send_json(200, {"status": "ok"})
+        else:
+            self.send_json(404, {"error": "Неизвестный путь"})
+
+    def do_POST(self):
+        url = urlparse(self.path)
+        if url.path != '/predict':
+            self.send_json(404, {"error": "Неизвестный путь"})
+            return
+
+        if self.headers.get('Content-Length') is None:
+            self.send_json(411, {"error": "Не указан заголовок Content-Length"})
+            return
+        try:
+            length = int(self.headers['Content-Length'])
+        except ValueError:
+            self.send_json(400, {"error": "Некорректный заголовок Content-Length"})
+            return
+        if length <= 0:
+            self.send_json(400, {"error": "Пустое тело запроса"})
+            return
+        if length > MAX_BODY_SIZE:
+            self.send_json(413, {"error": "Слишком большой файл"})
+            return
+        data = self.rfile.read(length)
+
+        name = parse_qs(url.query).get('name', ['upload'])[0]
+        content_type = self.headers.get('Content-Type', '')
+
+        try:
+            if content_type == 'application/pdf' or data.startswith(b'%PDF'):
+                base_name = name[:-4] if name.lower().endswith('.pdf') else name
+                pages = []
+                # Страницы растрируются сразу в разрешении входа модели,
+                # координаты в ответе приводятся к странице в 300 dpi
+                for page_number, image, image_height, image_width in render_pdf_pages(
+                        data, target_size=MODEL_INPUT_SIZE):
+                    pages.append({
+                        "image_file": f"{base_name}_page_{page_number}.png",
+                        "image": image,
+                        "image_height": image_height,
+                        "image_width": image_width
+                    })
+                result = annotate_pages(self.server.detector, pages)
+            else:
+                decoded = decode_bytes(data)
+                if decoded is None:
+                    self.send_json(400, {"error": "Не удалось декодировать изображение"})
+                    return
+                image, image_height, image_width = decoded
+                page = {"image_file": name, "image": image, "image_height": image_height, "image_width": image_width}
+                result = annotate_pages(self.server.detector, [page])[0]
+        except Exception as e:
+            print(f"Ошибка при обработке запроса {name}: {e}")
+            self.send_json(500, {"error": str(e)})
+            return
+
+        self.send_json(200, result)
+
+    def send_json(self, status, payload):
+        body = json.dumps(payload, ensure_ascii=False).encode('utf-8')
+        self.send_response(status)
+        self.send_header('Content-Type', 'application/json; charset=utf-8')
+        self.send_header('Content-Length', str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+
+def main():
+    parser = argparse.ArgumentParser(description="HTTP-сервис разметки документов моделью YOLO")
+    parser.add_argument("--host", default=HOST)
+    parser.add_argument("--port", type=int, default=PORT)
+    parser.add_argument("--backend", choices=BACKENDS, default="torch")
+    parser.add_argument("--model", help="Путь к модели (по умолчанию зависит от --backend, см. MODEL_PATHS)")
+    parser.add_argument("--threads", type=int, default=ONNX_INTRA_OP_THREADS)
+    parser.add_argument("--inter-op-threads", type=int, default=ONNX_INTER_OP_THREADS)
+    parser.add_argument("--batch-size", type=int, default=BATCH_SIZE)
+    parser.add_argument("--max-wait", type=float, default=BATCH_MAX_WAIT)
+    args = parser.parse_args()
+
+    # Модель загружается один раз на всё время работы сервиса
+    model = load_model(args.backend, args.model,
+                       intra_op_threads=args.threads, inter_op_threads=args.inter_op_threads)
+    detector = BatchingDetector(model, batch_size=args.batch_size, max_wait=args.max_wait)
+
+    # Прогревочный прогон, чтобы первый запрос не ждал инициализации модели
+    detector.submit(np.zeros((MODEL_INPUT_SIZE, MODEL_INPUT_SIZE, 3), dtype=np.uint8)).result()
+
+    server = ThreadingHTTPServer((args.host, args.port), InferenceRequestHandler)
+    server.detector = detector
+    print(f"Сервис разметки запущен на http://{args.host}:{args.port}")
+    try:
+        server.serve_forever()
+    except KeyboardInterrupt:
+        pass
+    finally:
+        server.server_close()
+        detector.close()
+
+
+if __name__ == "__main__":
+    main()
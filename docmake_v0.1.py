@@ -1,6 +1,11 @@
+import io
 import os
+import json
 import random
+import hashlib
+import argparse
 from collections import OrderedDict
+from concurrent.futures import ProcessPoolExecutor, as_completed
 from docx import Document
 from docx.enum.section import WD_ORIENT, WD_SECTION
 from docx.enum.table import WD_TABLE_ALIGNMENT
@@ -9,26 +14,140 @@ from docx.oxml.ns import qn
 from docx.shared import RGBColor, Pt, Cm, Inches, Emu
 from docx.oxml import OxmlElement
 from faker import Faker
-import matplotlib.pyplot as plt
+import matplotlib
+matplotlib.use('Agg')  # Рендеринг без окон, в том числе в дочерних процессах
+from matplotlib.backends.backend_agg import FigureCanvasAgg
+from matplotlib.figure import Figure
 from PIL import Image
 import numpy as np
 
-# Инициализация Faker
+# Локали Faker и их веса
 locales = OrderedDict([
     ('en-US', 1),
     ('ru-RU', 2),
 ])
-fake = Faker(locales)
+
+# Пул текста, заранее сгенерированный Faker
+TEXT_WORDS_PER_LOCALE = 20000  # Размер пула слов каждой локали
+TEXT_SENTENCES_PER_LOCALE = 5000  # Размер пула предложений каждой локали
+TEXT_SENTENCE_WORDS = (3, 15)  # Диапазон длины предложений пула в словах
+TEXT_CORPUS_SEED = 0  # Seed пула, одинаковый во всех процессах
+
+text_corpus = None  # TextCorpus процесса
+
+
+class TextCorpus:
+    """
+    Источник случайного текста с интерфейсом Faker (word, sentence, text), который выбирает
+    слова и предложения из заранее сгенерированных пулов каждой локали.
+    Случайный выбор делается через модуль random, поэтому при заданном seed текст воспроизводим.
+    """
+
+    def __init__(self, words, sentences, weights):
+        """
+        :param words: Словарь {локаль: список слов}.
+        :param sentences: Словарь {локаль: список предложений}.
+        :param weights: Словарь {локаль: вес}, как в locales.
+        """
+        self.words = words
+        self.sentences = sentences
+        self.locale_names = list(weights)
+        self.locale_weights = list(weights.values())
+
+    def choose_locale(self):
+        # Как и Faker со списком локалей, выбираем одну локаль на вызов
+        return random.choices(self.locale_names, weights=self.locale_weights)[0]
+
+    def word(self):
+        return random.choice(self.words[self.choose_locale()])
+
+    def sentence(self, nb_words=6):
+        """
+        Собирает предложение из слов пула. Как и в Faker, длина случайно меняется в пределах 60-140% от nb_words.
+        """
+        if nb_words <= 0:
+            return ''
+        nb_words = random.randint(max(1, int(nb_words * 0.6)), max(1, int(nb_words * 1.4)))
+        words = random.choices(self.words[self.choose_locale()], k=nb_words)
+        words[0] = words[0].capitalize()
+        return ' '.join(words) + '.'
+
+    def text(self, max_nb_chars=200):
+        """
+        Собирает текст из предложений пула длиной не более max_nb_chars символов (но не меньше одного предложения).
+        """
+        sentences = self.sentences[self.choose_locale()]
+        parts = [random.choice(sentences)]
+        length = len(parts[0])
+        while True:
+            sentence = random.choice(sentences)
+            if length + 1 + len(sentence) > max_nb_chars:
+                break
+            parts.append(sentence)
+            length += 1 + len(sentence)
+        return ' '.join(parts)
+
+    def save(self, path):
+        with open(path, 'w', encoding='utf-8') as f:
+            json.dump({'words': self.words, 'sentences': self.sentences}, f, ensure_ascii=False)
+
+
+def build_text_corpus(path=None, seed=TEXT_CORPUS_SEED):
+    """
+    Строит пулы слов и предложений для каждой локали собственным генератором Faker с фиксированным seed.
+    Если задан path, пулы читаются из файла, а при его отсутствии сохраняются туда после генерации.
+
+    :param path: JSON-файл с пулами текста.
+    :param seed: Seed генерации пулов.
+    :return: TextCorpus.
+    """
+    if path and os.path.exists(path):
+        with open(path, 'r', encoding='utf-8') as f:
+            data = json.load(f)
+        if set(data['words']) == set(locales):
+            return TextCorpus(data['words'], data['sentences'], locales)
+        print(f"Локали в {path} не совпадают с {list(locales)}, пул текста генерируется заново")
+
+    words = {}
+    sentences = {}
+    rng = random.Random(seed)
+    for locale in locales:
+        locale_faker = Faker(locale)
+        locale_faker.seed_instance(seed)
+        words[locale] = locale_faker.words(nb=TEXT_WORDS_PER_LOCALE)
+        sentences[locale] = [locale_faker.sentence(nb_words=rng.randint(*TEXT_SENTENCE_WORDS))
+                             for _ in range(TEXT_SENTENCES_PER_LOCALE)]
+    corpus = TextCorpus(words, sentences, locales)
+
+    if path:
+        tmp_path = f"{path}.{os.getpid()}.tmp"
+        corpus.save(tmp_path)
+        os.replace(tmp_path, path)
+    return corpus
+
+
+def get_text_corpus():
+    """
+    Возвращает пул текста процесса, строя его при первом вызове.
+    """
+    global text_corpus
+    if text_corpus is None:
+        text_corpus = build_text_corpus()
+    return text_corpus
 
 # Путь к папке с изображениями
 images_folder = 'natural_images'
+IMAGE_MAX_HEIGHT_PX = 500  # Максимальная высота изображения в документе (в пикселях при 96 dpi)
+IMAGE_JPEG_QUALITY = 90  # Качество JPEG уменьшенных изображений пула
+IMAGE_CACHE_DIR = 'natural_images_reduced'  # Дисковый кэш уменьшенных изображений, общий для процессов
+
+image_pool = []  # (путь к изображению, ширина, высота) - изображения, уже уменьшенные до IMAGE_MAX_HEIGHT_PX
 
 # Создаем папки для сохранения различных ресурсов
 os.makedirs('docx', exist_ok=True)
-os.makedirs('equations', exist_ok=True)
-os.makedirs('plots', exist_ok=True)
 
 num_documents = 3  # Количество документов для генерации
+num_workers = os.cpu_count() or 1  # Количество процессов для параллельной генерации
 
 # Список цветов в формате HEX
 COLORS = """000000 000080 00008B 0000CD 0000FF 006400 008000 008080 008B8B 00BFFF 00CED1 
@@ -67,42 +186,137 @@ FORMULAS = [
     r"\tau = r \times F"
 ]
 
-def generate_equation_image(equation_str, output_dir='equations'):
+EQUATION_FONT_SIZE = 20  # Размер шрифта формулы
+EQUATION_DPI = 100  # Разрешение изображения формулы (совпадает с dpi фигуры matplotlib по умолчанию)
+EQUATION_CACHE_DIR = 'equations'  # Дисковый кэш формул, общий для процессов (None - только память)
+
+# Кэш изображений формул в памяти процесса: (формула, размер шрифта, dpi) -> (PNG, ширина, высота)
+equation_cache = {}
+
+
+def generate_equation_image(equation_str, fontsize=EQUATION_FONT_SIZE, dpi=EQUATION_DPI):
     """
-    Генерирует изображение формулы из LaTeX-строки и сохраняет его.
+    Генерирует изображение формулы из LaTeX-строки в памяти.
 
     :param equation_str: Строка LaTeX-формулы.
-    :param output_dir: Директория для сохранения изображений формул.
-    :return: Путь к сохранённому изображению формулы.
+    :param fontsize: Размер шрифта формулы.
+    :param dpi: Разрешение изображения.
+    :return: Содержимое PNG-изображения формулы.
     """
-    os.makedirs(output_dir, exist_ok=True)
+    figure = Figure(figsize=(3, 1))
+    FigureCanvasAgg(figure)
+    axes = figure.add_subplot()
+    axes.text(0.5, 0.5, f"${equation_str}$", fontsize=fontsize, ha='center', va='center')
+    axes.axis('off')
+
+    buffer = io.BytesIO()
+    figure.savefig(buffer, format='png', dpi=dpi, bbox_inches='tight', pad_inches=0.1)
+    return buffer.getvalue()
+
 
-    # Генерируем уникальное имя файла
-    filename = f"equation_{random.randint(1000, 9999)}.png"
-    filepath = os.path.join(output_dir, filename)
+def get_equation_image(equation_str, fontsize=EQUATION_FONT_SIZE, dpi=EQUATION_DPI, cache_dir=EQUATION_CACHE_DIR):
+    """
+    Возвращает изображение формулы из кэша. Каждый вариант (формула, размер шрифта, dpi) рендерится один раз:
+    сначала ищется в памяти процесса, затем в дисковом кэше с именем по хэшу параметров,
+    и только потом рендерится и сохраняется в оба кэша.
+
+    :return: (содержимое PNG, ширина в пикселях, высота в пикселях).
+    """
+    key = (equation_str, fontsize, dpi)
+    if key in equation_cache:
+        return equation_cache[key]
+
+    filepath = None
+    image_bytes = None
+    if cache_dir:
+        name = hashlib.sha1(f"{equation_str}|{fontsize}|{dpi}".encode('utf-8')).hexdigest()[:16]
+        filepath = os.path.join(cache_dir, f"equation_{name}.png")
+        if os.path.exists(filepath):
+            with open(filepath, 'rb') as f:
+                image_bytes = f.read()
+
+    if image_bytes is None:
+        image_bytes = generate_equation_image(equation_str, fontsize=fontsize, dpi=dpi)
+        if filepath:
+            # Пишем во временный файл и атомарно переименовываем,
+            # чтобы другие процессы не прочитали недописанный файл
+            os.makedirs(cache_dir, exist_ok=True)
+            tmp_filepath = f"{filepath}.{os.getpid()}.tmp"
+            with open(tmp_filepath, 'wb') as f:
+                f.write(image_bytes)
+            os.replace(tmp_filepath, filepath)
+
+    with Image.open(io.BytesIO(image_bytes)) as img:
+        width, height = img.size
+    equation_cache[key] = (image_bytes, width, height)
+    return equation_cache[key]
+
+
+def load_pool_image(image_path, max_height_px=IMAGE_MAX_HEIGHT_PX, quality=IMAGE_JPEG_QUALITY,
+                    cache_dir=IMAGE_CACHE_DIR):
+    """
+    Готовит изображение для пула: уменьшает его до max_height_px по высоте и сохраняет в дисковый кэш.
+    Изображения, которые не нужно уменьшать, используются из исходной папки без перекодирования,
+    уменьшенная копия, которая новее исходного файла, берётся из кэша повторно.
+
+    :return: (путь к изображению, ширина в пикселях, высота в пикселях).
+    """
+    name = os.path.splitext(os.path.basename(image_path))[0]
+    cached_path = os.path.join(cache_dir, str(max_height_px), f"{name}.jpg")
+    if os.path.exists(cached_path) and os.path.getmtime(cached_path) >= os.path.getmtime(image_path):
+        with Image.open(cached_path) as cached:
+            return (cached_path,) + cached.size
+
+    with Image.open(image_path) as image:
+        width_px, height_px = image.size
+        if height_px <= max_height_px:
+            return image_path, width_px, height_px
+
+        width_px = max(1, int(width_px * max_height_px / height_px))
+        height_px = max_height_px
+        resized = image.convert('RGB').resize((width_px, height_px), Image.LANCZOS)
 
-    # Создаём изображение формулы
-    plt.figure(figsize=(3, 1))
-    plt.text(0.5, 0.5, f"${equation_str}$", fontsize=20, ha='center', va='center')
-    plt.axis('off')
-    plt.savefig(filepath, bbox_inches='tight', pad_inches=0.1)
-    plt.close()
+    # Пишем во временный файл и атомарно переименовываем, как в кэше формул
+    os.makedirs(os.path.dirname(cached_path), exist_ok=True)
+    tmp_path = f"{cached_path}.{os.getpid()}.tmp"
+    resized.save(tmp_path, format='JPEG', quality=quality)
+    os.replace(tmp_path, cached_path)
+    return cached_path, width_px, height_px
 
-    return filepath
 
-def add_image_to_document(document, image_path, max_height_px=500, base_font_size=12):
+def build_image_pool(folder=images_folder, max_height_px=IMAGE_MAX_HEIGHT_PX, cache_dir=IMAGE_CACHE_DIR):
+    """
+    Готовит все изображения папки один раз перед генерацией документов.
+    В пуле хранятся только пути к уменьшенным файлам и их размеры, поэтому он дёшево передаётся
+    процессам-обработчикам, а содержимое изображения читается с диска при вставке в документ.
+    Порядок изображений фиксирован, поэтому выбор изображения воспроизводим при заданном seed.
+
+    :return: Список (путь к изображению, ширина, высота).
+    """
+    if not os.path.exists(folder):
+        return []
+
+    pool = []
+    for image_file in sorted(os.listdir(folder)):
+        try:
+            pool.append(load_pool_image(os.path.join(folder, image_file), max_height_px, cache_dir=cache_dir))
+        except Exception as e:
+            print(f"Не удалось загрузить изображение {image_file}: {e}")
+    print(f"Загружено изображений в пул: {len(pool)}")
+    return pool
+
+
+def add_image_to_document(document, image, max_height_px=IMAGE_MAX_HEIGHT_PX, base_font_size=12):
     """
     Добавляет изображение в документ с ограничением по высоте.
 
     :param document: Объект документа Document.
-    :param image_path: Путь к изображению.
+    :param image: Изображение из пула: (путь к изображению, ширина, высота).
     :param max_height_px: Максимальная высота изображения в пикселях.
     :param base_font_size: Базовый размер шрифта для метки.
     :return: Параграф с изображением.
     """
-    # Открываем изображение
-    image = Image.open(image_path)
-    width_px, height_px = image.size
+    image_path, width_px, height_px = image
 
     # Ограничиваем высоту изображения
     if height_px > max_height_px:
@@ -136,8 +350,8 @@ def add_image_to_document(document, image_path, max_height_px=500, base_font_siz
     return paragraph
 
 def add_equation_to_docx(doc, equation_str, size_img, caption=True ):
-    equation_image_path = generate_equation_image(equation_str)
     try:
+        equation_image, width, height = get_equation_image(equation_str)
         if caption:
             # Создаем параграф и добавляем метку и изображение
             paragraph = doc.add_paragraph()
@@ -149,10 +363,6 @@ def add_equation_to_docx(doc, equation_str, size_img, caption=True ):
             run.font.color.rgb = RGBColor(255, 255, 255)  # Белый цвет
 
             # Определяем случайный размер
-
-            img = Image.open(equation_image_path)
-            width, height = img.size
-
             if size_img == "normal":
                 width *= 0.75
                 height *= 0.75
@@ -164,7 +374,7 @@ def add_equation_to_docx(doc, equation_str, size_img, caption=True ):
                 height *= 0.35
 
             # Добавляем изображение формулы с выбранным размером
-            run.add_picture(equation_image_path, width=Inches(width/96), height=Inches(height/96)) # Перевод из px в inches
+            run.add_picture(io.BytesIO(equation_image), width=Inches(width/96), height=Inches(height/96)) # Перевод из px в inches
 
 
 
@@ -261,41 +471,84 @@ def set_table_keep_together(table):
                 paragraph.paragraph_format.keep_together = True
                 paragraph.paragraph_format.keep_with_next = True
 
-def generate_random_plot(output_dir='plots'):
+# Функции и стили для случайных графиков
+PLOT_FUNCTIONS = [
+    np.sin, np.cos, np.tan, np.exp, lambda x: x ** 2, lambda x: x ** 3
+]
+PLOT_LINE_STYLES = ['-', '--', '-.', ':']
+PLOT_LINE_WIDTHS = [1.0, 1.5, 2.0]
+PLOT_COLORS = ['C0', 'C1', 'C2', 'C3', 'C4', 'black']
+
+PLOT_POOL_SIZE = 0  # Размер пула заранее сгенерированных графиков (0 - генерировать график для каждой вставки)
+PLOT_POOL_SEED = 0  # Seed пула, одинаковый во всех процессах
+
+plot_canvas = None  # (фигура, оси) - один холст Agg на процесс
+plot_pool = []  # PNG-изображения графиков из пула
+
+
+def get_plot_canvas():
     """
-    Генерирует случайный график и сохраняет его как изображение.
+    Возвращает холст Agg процесса, создавая его при первом вызове.
+    Фигура создаётся без pyplot, поэтому не попадает в его глобальное состояние.
     """
-    os.makedirs(output_dir, exist_ok=True)
+    global plot_canvas
+    if plot_canvas is None:
+        figure = Figure()  # Размер и dpi по умолчанию, как у plt.figure()
+        FigureCanvasAgg(figure)
+        plot_canvas = (figure, figure.add_subplot())
+    return plot_canvas
+
+
+def generate_random_plot(rng=random, faker=None):
+    """
+    Генерирует случайный график на холсте процесса.
 
-    # Генерируем уникальное имя файла
-    filename = f"plot_{random.randint(1000, 9999)}.png"
-    filepath = os.path.join(output_dir, filename)
+    :param rng: Генератор случайных чисел для выбора функции и стиля.
+    :param faker: Генератор слов для заголовка (по умолчанию пул текста процесса).
+    :return: Содержимое PNG-изображения графика.
+    """
+    figure, axes = get_plot_canvas()
+    axes.clear()
 
     # Определяем диапазон x
     x = np.linspace(-5, 5, 100)  # 100 точек от -5 до 5
 
-    # Список доступных функций
-    functions = [
-        np.sin, np.cos, np.tan, np.exp, lambda x: x ** 2, lambda x: x ** 3
-    ]
+    # Выбираем случайную функцию и стиль линии
+    f = rng.choice(PLOT_FUNCTIONS)
+    axes.plot(x, f(x),
+              linestyle=rng.choice(PLOT_LINE_STYLES),
+              linewidth=rng.choice(PLOT_LINE_WIDTHS),
+              color=rng.choice(PLOT_COLORS))
+    axes.set_title(f"График функции: {(faker or get_text_corpus()).word()}")
+    axes.set_xlabel("Ось X")
+    axes.set_ylabel("Ось Y")
+    axes.grid(True)
 
-    # Выбираем случайную функцию
-    f = random.choice(functions)
+    # Рендерим сразу в память, без файлов на диске
+    buffer = io.BytesIO()
+    figure.savefig(buffer, format='png')
+    return buffer.getvalue()
 
-    # Вычисляем y
-    y = f(x)
 
-    # Создаём график
-    plt.figure()
-    plt.plot(x, y)
-    plt.title(f"График функции: {fake.word()}")
-    plt.xlabel("Ось X")
-    plt.ylabel("Ось Y")
-    plt.grid(True)
-    plt.savefig(filepath)
-    plt.close()
+def build_plot_pool(size, seed=PLOT_POOL_SEED):
+    """
+    Заранее генерирует пул из size разных графиков, из которого документы выбирают случайный.
+    Пул генерируется собственными генераторами с фиксированным seed и одинаков во всех процессах.
+    """
+    rng = random.Random(seed)
+    pool_faker = Faker(locales)
+    pool_faker.seed_instance(seed)
+    return [generate_random_plot(rng, pool_faker) for _ in range(size)]
+
+
+def get_plot_image():
+    """
+    Возвращает PNG-изображение графика: из пула, если он построен, иначе новый график.
+    """
+    if plot_pool:
+        return random.choice(plot_pool)
+    return generate_random_plot()
 
-    return filepath
 
 def add_plot_to_docx(doc, base_font_size=12):
     """
@@ -304,8 +557,8 @@ def add_plot_to_docx(doc, base_font_size=12):
     :param doc: Объект документа Document.
     :param base_font_size: Базовый размер шрифта для метки.
     """
-    plot_image_path = generate_random_plot()
     try:
+        plot_image = get_plot_image()
         # Создаем параграф и добавляем метку и изображение
         paragraph = doc.add_paragraph()
         run = paragraph.add_run()
@@ -316,7 +569,7 @@ def add_plot_to_docx(doc, base_font_size=12):
         run.font.color.rgb = RGBColor(255, 255, 255)  # Белый цвет
 
         # Добавляем изображение графика
-        run.add_picture(plot_image_path)
+        run.add_picture(io.BytesIO(plot_image))
 
         # Устанавливаем выравнивание параграфа
         paragraph.alignment = WD_ALIGN_PARAGRAPH.CENTER
@@ -327,7 +580,7 @@ def add_plot_to_docx(doc, base_font_size=12):
 
         # Добавляем подпись к графику
         caption_type = random.choice(["Рис.", "Рисунок", "Рис. №", "Рисунок №"])
-        caption_text = f"{caption_type} {random.randint(1, 100)} — {fake.sentence(nb_words=random.randint(3, 7))}"
+        caption_text = f"{caption_type} {random.randint(1, 100)} — {get_text_corpus().sentence(nb_words=random.randint(3, 7))}"
         caption_paragraph = doc.add_paragraph(caption_text)
         caption_paragraph.alignment = WD_ALIGN_PARAGRAPH.CENTER
         run = caption_paragraph.runs[0]
@@ -360,7 +613,36 @@ def set_numbering_font_size(document, base_font_size=12):
             sz_val = str(int(base_font_size * 2))  # Размер шрифта в половинных пунктах
             sz.set(qn('w:val'), sz_val)
 
-for doc_num in range(num_documents):
+def document_seed(seed, doc_num):
+    """
+    Seed документа doc_num при базовом seed. Получается хэшированием пары (seed, doc_num), а не суммой,
+    поэтому запуски с разными базовыми seed не дают одинаковых документов (как seed=0/документ 1
+    и seed=1/документ 0 при seed + doc_num).
+    """
+    digest = hashlib.sha1(f"{seed}:{doc_num}".encode('utf-8')).digest()
+    return int.from_bytes(digest[:8], 'big')
+
+
+def seed_document(seed):
+    """
+    Задаёт seed генератору random перед генерацией документа (через него же выбирается текст из пула).
+    """
+    random.seed(seed)
+
+
+def generate_document(doc_num, output_dir='docx', seed=None):
+    """
+    Генерирует один документ и сохраняет его в output_dir/document_{doc_num}.docx.
+
+    :param doc_num: Номер документа.
+    :param output_dir: Директория для сохранения документа.
+    :param seed: Базовый seed; документ генерируется с document_seed(seed, doc_num) и не зависит
+                 от процесса и порядка генерации. Если не задан, документ случайный.
+    :return: Путь к сохранённому документу.
+    """
+    if seed is not None:
+        seed_document(document_seed(seed, doc_num))
+    corpus = get_text_corpus()
 
     document = Document()
 
@@ -406,7 +688,7 @@ for doc_num in range(num_documents):
             # Добавляем верхний колонтитул
             header = current_section.header
             header_paragraph = header.paragraphs[0]
-            header_paragraph.text = fake.sentence(nb_words=random.randint(1, 6))
+            header_paragraph.text = corpus.sentence(nb_words=random.randint(1, 6))
             # Устанавливаем размер шрифта для колонтитула
             for run in header_paragraph.runs:
                 run.font.size = Pt(base_font_size)
@@ -416,14 +698,14 @@ for doc_num in range(num_documents):
             # Добавляем нижний колонтитул
             footer = current_section.footer
             footer_paragraph = footer.paragraphs[0]
-            footer_paragraph.text = fake.sentence(nb_words=random.randint(1, 6))
+            footer_paragraph.text = corpus.sentence(nb_words=random.randint(1, 6))
             # Устанавливаем размер шрифта для колонтитула
             for run in footer_paragraph.runs:
                 run.font.size = Pt(base_font_size)
 
         # Добавляем заголовок
         level = random.randint(0, 4)
-        heading_text = fake.sentence(nb_words=random.randint(3, 7))
+        heading_text = corpus.sentence(nb_words=random.randint(3, 7))
         heading = document.add_heading(heading_text, level=level)
         run = heading.runs[0]
         run.font.color.rgb = RGBColor(0, 0, 0)
@@ -435,11 +717,10 @@ for doc_num in range(num_documents):
 
         # Определяем функции для добавления различных элементов
         def add_text_paragraph():
-            # Инициализация списка сносок
-            global footnotes
-            global footnote_num  # Начальный номер сноски
+            # Сноски общие для всего документа
+            nonlocal footnote_num
             # Добавляем абзац текста с возможными сносками
-            paragraph = document.add_paragraph(fake.text(max_nb_chars=random.randint(1000, 1500)))
+            paragraph = document.add_paragraph(corpus.text(max_nb_chars=random.randint(1000, 1500)))
             paragraph_format = paragraph.paragraph_format
             if random.choice([True, False]):
                 paragraph_format.first_line_indent = Cm(1)
@@ -458,7 +739,7 @@ for doc_num in range(num_documents):
 
                 # Случайно добавляем сноску
                 if random.choice([False, False, True, False, False]):
-                    footnote_text = fake.sentence(nb_words=5)
+                    footnote_text = corpus.sentence(nb_words=5)
                     add_footnote(paragraph, footnote_text, footnote_num, footnotes, base_font_size=base_font_size)
                     footnote_num += 1
 
@@ -471,7 +752,7 @@ for doc_num in range(num_documents):
             if table_sign_up:
                 # Добавляем подпись к таблице
                 caption_type = random.choice(["Табл.", "Таблица", "Табл. №", "Таблица №",])
-                caption_text = f"{caption_type} {random.randint(1, 100)} — {fake.sentence(nb_words=random.randint(3, 7))}"
+                caption_text = f"{caption_type} {random.randint(1, 100)} — {corpus.sentence(nb_words=random.randint(3, 7))}"
                 caption_paragraph = document.add_paragraph(caption_text)
                 caption_paragraph.alignment = WD_ALIGN_PARAGRAPH.CENTER
                 run = caption_paragraph.runs[0]
@@ -527,7 +808,7 @@ for doc_num in range(num_documents):
                     for idx_cell, cell in enumerate(row.cells):
                         # Заполнение ячеек
                         if fill_with_words:
-                            cell.text = fake.word()
+                            cell.text = corpus.word()
                         else:
                             cell.text = str(random.randint(1, 100))
 
@@ -570,7 +851,7 @@ for doc_num in range(num_documents):
                     for idx_cell, cell in enumerate(row.cells):
                         # Заполнение ячеек
                         if fill_with_words:
-                            cell.text = fake.word()
+                            cell.text = corpus.word()
                         else:
                             cell.text = str(random.randint(1, 100))
 
@@ -594,7 +875,7 @@ for doc_num in range(num_documents):
 
             if not table_sign_up:
                 # Добавляем подпись к таблице
-                caption_text = f"Таблица {random.randint(1, 100)} — {fake.sentence(nb_words=random.randint(3, 7))}"
+                caption_text = f"Таблица {random.randint(1, 100)} — {corpus.sentence(nb_words=random.randint(3, 7))}"
                 caption_paragraph = document.add_paragraph(caption_text)
                 caption_paragraph.alignment = WD_ALIGN_PARAGRAPH.CENTER
                 run = caption_paragraph.runs[0]
@@ -613,9 +894,8 @@ for doc_num in range(num_documents):
             add_image = random.choice([True, False])
             if add_image:
                 # Добавляем изображение
-                image_files = os.listdir(images_folder) if os.path.exists(images_folder) else []
-                if image_files:
-                    image_path = os.path.join(images_folder, random.choice(image_files))
+                if image_pool:
+                    image = random.choice(image_pool)
                     try:
                         # Добавляем метку с символом '&' перед изображением
                         label_paragraph = document.add_paragraph("&")
@@ -629,7 +909,8 @@ for doc_num in range(num_documents):
                         label_paragraph.paragraph_format.keep_together = True
 
                         # Добавляем изображение с ограничением по высоте
-                        image_paragraph = add_image_to_document(document, image_path, max_height_px=500, base_font_size=base_font_size)
+                        image_paragraph = add_image_to_document(document, image, max_height_px=IMAGE_MAX_HEIGHT_PX,
+                                                                base_font_size=base_font_size)
 
 
                         # Устанавливаем свойства форматирования для параграфа с изображением
@@ -638,7 +919,7 @@ for doc_num in range(num_documents):
 
                         # Добавляем подпись к изображению
                         caption_type = random.choice(["Рис.", "Рисунок", "Рис. №", "Рисунок №",])
-                        caption_text = f"{caption_type} {random.randint(1, 100)} — {fake.sentence(nb_words=random.randint(3, 7))}"
+                        caption_text = f"{caption_type} {random.randint(1, 100)} — {corpus.sentence(nb_words=random.randint(3, 7))}"
                         caption_paragraph = document.add_paragraph(caption_text)
                         caption_paragraph.alignment = WD_ALIGN_PARAGRAPH.CENTER
                         caption_paragraph.paragraph_format.keep_with_next = True
@@ -649,7 +930,7 @@ for doc_num in range(num_documents):
                         print(f"Ошибка при добавлении изображения: {e}")
 
         def add_numbered_list():
-            global footnote_num
+            nonlocal footnote_num
             numbered_paragraphs = []
             fully_indented = random.choice([True, False])
             # Определяем убирать ли отступы до и после списка
@@ -665,15 +946,15 @@ for doc_num in range(num_documents):
             bigger_items = random.choice([True, False, False])
             
             for item in range(num_of_items):
-                list_item = fake.sentence(nb_words=(random.randint(30, 55) if bigger_items else random.randint(5, 20)))                
+                list_item = corpus.sentence(nb_words=(random.randint(30, 55) if bigger_items else random.randint(5, 20)))                
                 if random.choices([True, False], weights=[0.16, 1 - 0.16])[0]:
-                    footnote_text = fake.sentence(nb_words=5)
+                    footnote_text = corpus.sentence(nb_words=5)
                     # Если элемент списка большой, то для него возможно добавление сноски где-то в середине
                     if bigger_items and random.choice([True, False]):                  
                         item_len = random.randint(30, 55)
                         first_part_len = random.randint(10, item_len - 10)
-                        list_item = fake.sentence(nb_words=first_part_len) + f' [{footnote_num}] '
-                        list_item += fake.sentence(nb_words=item_len - first_part_len)                      
+                        list_item = corpus.sentence(nb_words=first_part_len) + f' [{footnote_num}] '
+                        list_item += corpus.sentence(nb_words=item_len - first_part_len)                      
                     else:
                         list_item += f' [{footnote_num}]'
                     footnotes.append((footnote_num, footnote_text))
@@ -713,7 +994,7 @@ for doc_num in range(num_documents):
             set_numbering_font_size(document, base_font_size=base_font_size)
 
         def add_bulleted_list():
-            global footnote_num
+            nonlocal footnote_num
             bulleted_paragraphs = []
             fully_indented = random.choice([True, False])
             remove_bef_and_aft_spacing = random.choice([True, False])
@@ -728,15 +1009,15 @@ for doc_num in range(num_documents):
             bigger_items = random.choice([True, False, False])
 
             for item in range(num_of_items):
-                list_item = fake.sentence(nb_words=(random.randint(30, 55) if bigger_items else random.randint(5, 20)))
+                list_item = corpus.sentence(nb_words=(random.randint(30, 55) if bigger_items else random.randint(5, 20)))
                 if random.choices([True, False], weights=[0.16, 1 - 0.16])[0]:
-                    footnote_text = fake.sentence(nb_words=5)
+                    footnote_text = corpus.sentence(nb_words=5)
                     # Если элемент списка большой, то для него возможно добавление сноски где-то в середине
                     if bigger_items and random.choice([True, False]):                  
                         item_len = random.randint(30, 55)
                         first_part_len = random.randint(10, item_len - 10)
-                        list_item = fake.sentence(nb_words=first_part_len) + f' [{footnote_num}] '
-                        list_item += fake.sentence(nb_words=item_len - first_part_len)                      
+                        list_item = corpus.sentence(nb_words=first_part_len) + f' [{footnote_num}] '
+                        list_item += corpus.sentence(nb_words=item_len - first_part_len)                      
                     else:
                         list_item += f' [{footnote_num}]'
                     footnotes.append((footnote_num, footnote_text))
@@ -810,5 +1091,140 @@ for doc_num in range(num_documents):
     add_footnotes_section(document, footnotes, base_font_size=base_font_size)
 
     # Сохраняем документ в папку 'docx'
-    document.save(f'docx/document_{doc_num}.docx')
+    document_path = os.path.join(output_dir, f'document_{doc_num}.docx')
+    document.save(document_path)
     print(f"Документ {doc_num} успешно сгенерирован.")
+    return document_path
+
+
+def init_worker(plot_pool_size=PLOT_POOL_SIZE, images=None, corpus=None):
+    """
+    Инициализирует процесс-обработчик: задаёт генератору случайных чисел энтропию ОС,
+    строит пул графиков и принимает пулы изображений и текста.
+    Без этого процессы, запущенные через fork, наследуют одинаковое состояние random
+    и генерируют одинаковые документы, если seed не задан.
+
+    :param plot_pool_size: Размер пула графиков (см. build_plot_pool).
+    :param images: Пул изображений, подготовленный основным процессом (см. build_image_pool):
+                   только пути и размеры, сами файлы процесс читает с диска.
+    :param corpus: Пул текста, построенный основным процессом (см. build_text_corpus).
+    """
+    global plot_pool, image_pool, text_corpus
+    random.seed()
+    plot_pool = build_plot_pool(plot_pool_size) if plot_pool_size else []
+    image_pool = images or []
+    if corpus is not None:
+        text_corpus = corpus
+
+
+MANIFEST_NAME = 'manifest.jsonl'  # Список готовых документов в директории с документами
+
+
+def load_manifest(output_dir='docx'):
+    """
+    Читает манифест готовых документов.
+
+    :return: Словарь {номер документа: запись манифеста} для документов, файлы которых существуют.
+    """
+    manifest_path = os.path.join(output_dir, MANIFEST_NAME)
+    completed = {}
+    if not os.path.exists(manifest_path):
+        return completed
+    with open(manifest_path, 'r', encoding='utf-8') as manifest_file:
+        for line in manifest_file:
+            try:
+                record = json.loads(line)
+            except json.JSONDecodeError:
+                continue  # Недописанная строка после аварийного завершения
+            if os.path.exists(record['path']):
+                completed[record['doc_num']] = record
+    return completed
+
+
+def append_manifest(manifest_file, doc_num, document_path, seed):
+    record = {'doc_num': doc_num, 'path': document_path,
+              'seed': None if seed is None else document_seed(seed, doc_num)}
+    manifest_file.write(json.dumps(record, ensure_ascii=False) + '\n')
+    manifest_file.flush()
+
+
+def generate_documents(start=0, end=num_documents, workers=num_workers, output_dir='docx', seed=None,
+                       resume=False, plot_pool_size=PLOT_POOL_SIZE, text_corpus_path=None):
+    """
+    Генерирует документы с номерами из диапазона [start, end) в пуле процессов.
+    Каждый готовый документ записывается в манифест output_dir/manifest.jsonl.
+
+    :param start: Номер первого документа.
+    :param end: Номер, следующий за последним документом.
+    :param workers: Количество процессов.
+    :param output_dir: Директория для сохранения документов.
+    :param seed: Базовый seed; документ doc_num генерируется с document_seed(seed, doc_num) (см. generate_document).
+    :param resume: Пропускать документы, уже отмеченные в манифесте.
+    :param plot_pool_size: Размер пула заранее сгенерированных графиков в каждом процессе.
+    :param text_corpus_path: JSON-файл пула текста (см. build_text_corpus).
+    :return: Список путей к сгенерированным документам.
+    """
+    os.makedirs(output_dir, exist_ok=True)
+
+    doc_nums = list(range(start, end))
+    if resume:
+        completed = load_manifest(output_dir)
+        doc_nums = [doc_num for doc_num in doc_nums if doc_num not in completed]
+        print(f"Пропущено готовых документов: {end - start - len(doc_nums)}")
+
+    if not doc_nums:
+        return []
+
+    # Изображения и текст готовятся один раз, процессы получают готовые пулы
+    # (изображения - как пути к уменьшенным копиям, а не их содержимое)
+    images = build_image_pool()
+    corpus = build_text_corpus(text_corpus_path)
+
+    document_paths = []
+    # Манифест пишет только основной процесс, поэтому записи не перемешиваются
+    with open(os.path.join(output_dir, MANIFEST_NAME), 'a', encoding='utf-8') as manifest_file:
+        if workers <= 1:
+            init_worker(plot_pool_size, images, corpus)
+            for doc_num in doc_nums:
+                try:
+                    document_path = generate_document(doc_num, output_dir, seed)
+                except Exception as e:
+                    print(f"Ошибка при генерации документа {doc_num}: {e}")
+                    continue
+                append_manifest(manifest_file, doc_num, document_path, seed)
+                document_paths.append(document_path)
+            return document_paths
+
+        with ProcessPoolExecutor(max_workers=workers, initializer=init_worker,
+                                 initargs=(plot_pool_size, images, corpus)) as executor:
+            futures = {executor.submit(generate_document, doc_num, output_dir, seed): doc_num for doc_num in doc_nums}
+            for future in as_completed(futures):
+                doc_num = futures[future]
+                try:
+                    document_path = future.result()
+                except Exception as e:
+                    print(f"Ошибка при генерации документа {doc_num}: {e}")
+                    continue
+                append_manifest(manifest_file, doc_num, document_path, seed)
+                document_paths.append(document_path)
+    return sorted(document_paths)
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description="Генерация синтетических документов DOCX")
+    parser.add_argument("--start", type=int, default=0, help="Номер первого документа")
+    parser.add_argument("--end", type=int, default=num_documents, help="Номер, следующий за последним документом")
+    parser.add_argument("--workers", type=int, default=num_workers, help="Количество процессов")
+    parser.add_argument("--seed", type=int,
+                        help="Базовый seed: документ N генерируется с seed, производным от пары (seed, N), "
+                             "результат воспроизводим")
+    parser.add_argument("--resume", action="store_true",
+                        help="Пропустить документы, уже записанные в манифест (продолжение прерванного запуска)")
+    parser.add_argument("--plot-pool", type=int, default=PLOT_POOL_SIZE,
+                        help="Размер пула заранее сгенерированных графиков (0 - новый график для каждой вставки)")
+    parser.add_argument("--text-corpus",
+                        help="JSON-файл пула текста: читается, если существует, иначе создаётся при генерации")
+    args = parser.parse_args()
+
+    generate_documents(args.start, args.end, args.workers, seed=args.seed, resume=args.resume,
+                       plot_pool_size=args.plot_pool, text_corpus_path=args.text_corpus)
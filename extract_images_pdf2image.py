@@ -1,34 +1,112 @@
 import os
-from pdf2image import convert_from_path
+import argparse
+from concurrent.futures import ProcessPoolExecutor, as_completed
+from pdf2image import convert_from_path, pdfinfo_from_path
 
-def extract_images_from_pdf():
-    pdf_dir = 'pdf'
-    image_dir = 'image'
+from incremental import CHECK_MODES, StageManifest
 
+MANIFEST_NAME = 'rasterize_manifest.jsonl'  # Манифест растрированных PDF в директории изображений
+RASTERIZE_WORKERS = os.cpu_count() or 1  # Количество процессов растрирования
+
+def page_image_path(pdf_path, page_number, image_dir):
+    pdf_name = os.path.splitext(os.path.basename(pdf_path))[0]
+    return os.path.join(image_dir, f"{pdf_name}_page_{page_number}.png")
+
+def rasterize_page(pdf_path, page_number, image_dir='image', dpi=300):
+    """
+    Растрирует и сохраняет одну страницу PDF. В памяти находится только изображение этой страницы.
+
+    :param page_number: Номер страницы, начиная с 1.
+    :return: Путь к сохранённому изображению.
+    """
+    page = convert_from_path(pdf_path, dpi=dpi, first_page=page_number, last_page=page_number)[0]
+    image_path = page_image_path(pdf_path, page_number, image_dir)
+    page.save(image_path, 'PNG')
+    return image_path
+
+def extract_pdf_images(pdf_path, image_dir='image', dpi=300):
+    """
+    Сохраняет страницы одного PDF в PNG с именами {имя PDF}_page_{номер}.png.
+
+    :param pdf_path: Путь к PDF-файлу.
+    :param image_dir: Директория для изображений.
+    :param dpi: Разрешение растрирования (300 для высокого качества).
+    :return: Список путей к сохранённым изображениям.
+    """
+    os.makedirs(image_dir, exist_ok=True)
+
+    # Страницы растрируются по одной, чтобы не держать в памяти изображения всего документа
+    page_count = pdfinfo_from_path(pdf_path)['Pages']
+    return [rasterize_page(pdf_path, page_number, image_dir, dpi) for page_number in range(1, page_count + 1)]
+
+def extract_images_from_pdf(pdf_dir='pdf', image_dir='image', dpi=300, incremental=True, check_mode='mtime',
+                            workers=RASTERIZE_WORKERS):
+    """
+    Растрирует все PDF из pdf_dir. Страницы всех документов распределяются по пулу из workers процессов,
+    каждая страница растрируется и сохраняется независимо.
+
+    :param incremental: Пропускать PDF, которые не изменились с прошлого растрирования с тем же dpi
+                        (см. incremental.StageManifest).
+    :param check_mode: Способ проверки изменений: 'mtime' или 'hash'.
+    :param workers: Количество процессов.
+    """
     # Создаем директорию 'image', если она не существует
     if not os.path.exists(image_dir):
         os.makedirs(image_dir)
 
     # Получаем список всех файлов в папке 'pdf'
-    pdf_files = [f for f in os.listdir(pdf_dir) if f.lower().endswith('.pdf')]
+    pdf_files = sorted(f for f in os.listdir(pdf_dir) if f.lower().endswith('.pdf'))
+    pdf_paths = [os.path.join(pdf_dir, pdf_file) for pdf_file in pdf_files]
 
-    for pdf_file in pdf_files:
-        pdf_path = os.path.join(pdf_dir, pdf_file)
-        pdf_name = os.path.splitext(pdf_file)[0]
+    manifest = StageManifest(os.path.join(image_dir, MANIFEST_NAME), check_mode)
+    params = {'dpi': dpi}
+    if incremental:
+        pdf_paths, skipped = manifest.split(pdf_paths, params)
+        print(f'Пропущено актуальных PDF: {skipped}')
 
+    # Число страниц каждого PDF, чтобы раздать страницы как отдельные задачи
+    page_counts = {}
+    for pdf_path in pdf_paths:
         try:
-            print(f'Извлекаем изображения из {pdf_file}...')
-            # Конвертируем все страницы PDF в список изображений PIL
-            pages = convert_from_path(pdf_path, dpi=300)  # dpi=300 для высокого качества
+            page_counts[pdf_path] = pdfinfo_from_path(pdf_path)['Pages']
+        except Exception as e:
+            print(f'Ошибка при чтении {os.path.basename(pdf_path)}: {e}')
 
-            for page_number, page in enumerate(pages, start=1):
-                image_name = f"{pdf_name}_page_{page_number}.png"
-                image_path = os.path.join(image_dir, image_name)
-                page.save(image_path, 'PNG')
-                print(f'Изображение {image_name} сохранено.')
+    remaining = dict(page_counts)  # PDF -> число ещё не сохранённых страниц
+    failed = set()
+    with ProcessPoolExecutor(max_workers=workers) as executor:
+        futures = {
+            executor.submit(rasterize_page, pdf_path, page_number, image_dir, dpi): (pdf_path, page_number)
+            for pdf_path, page_count in page_counts.items()
+            for page_number in range(1, page_count + 1)
+        }
+        for future in as_completed(futures):
+            pdf_path, page_number = futures[future]
+            pdf_file = os.path.basename(pdf_path)
+            try:
+                image_path = future.result()
+                print(f'Изображение {os.path.basename(image_path)} сохранено.')
+            except Exception as e:
+                print(f'Ошибка при извлечении страницы {page_number} из {pdf_file}: {e}')
+                failed.add(pdf_path)
 
-        except Exception as e:
-            print(f'Ошибка при извлечении изображений из {pdf_file}: {e}')
+            remaining[pdf_path] -= 1
+            # PDF попадает в манифест, только когда сохранены все его страницы
+            if remaining[pdf_path] == 0 and pdf_path not in failed:
+                image_paths = [page_image_path(pdf_path, number, image_dir)
+                               for number in range(1, page_counts[pdf_path] + 1)]
+                manifest.record(pdf_path, image_paths, params)
 
 if __name__ == '__main__':
-    extract_images_from_pdf()
+    parser = argparse.ArgumentParser(description="Растрирование страниц PDF в PNG")
+    parser.add_argument("--pdf-dir", default='pdf')
+    parser.add_argument("--image-dir", default='image')
+    parser.add_argument("--dpi", type=int, default=300)
+    parser.add_argument("--check", choices=CHECK_MODES, default='mtime',
+                        help="Как определять изменившиеся PDF: по времени изменения или по хэшу")
+    parser.add_argument("--workers", type=int, default=RASTERIZE_WORKERS, help="Количество процессов")
+    parser.add_argument("--force", action="store_true", help="Растрировать все PDF заново")
+    args = parser.parse_args()
+
+    extract_images_from_pdf(args.pdf_dir, args.image_dir, dpi=args.dpi, incremental=not args.force,
+                            check_mode=args.check, workers=args.workers)
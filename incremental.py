@@ -0,0 +1,85 @@
+import os
+import json
+import hashlib
+
+# Способы проверки, изменился ли исходный файл
+CHECK_MODES = ('mtime', 'hash')
+
+
+def file_hash(path, chunk_size=1024 * 1024):
+    sha1 = hashlib.sha1()
+    with open(path, 'rb') as f:
+        for chunk in iter(lambda: f.read(chunk_size), b''):
+            sha1.update(chunk)
+    return sha1.hexdigest()
+
+
+class StageManifest:
+    """
+    Манифест стадии обработки: для каждого исходного файла хранит его отпечаток (время изменения и размер
+    или хэш содержимого), параметры стадии и список выходных файлов.
+    Файл считается актуальным, если отпечаток и параметры совпадают, а все выходные файлы существуют.
+
+    Манифест дописывается по строке на файл (JSON Lines), поэтому прерванный запуск не теряет
+    уже обработанные файлы; при чтении побеждает последняя запись.
+    """
+
+    def __init__(self, path, mode='mtime'):
+        """
+        :param path: Путь к файлу манифеста.
+        :param mode: 'mtime' - сравнивать время изменения и размер, 'hash' - хэш содержимого
+                     (не зависит от перезаписи файла с тем же содержимым).
+        """
+        if mode not in CHECK_MODES:
+            raise ValueError(f"Неизвестный способ проверки: {mode}")
+        self.path = path
+        self.mode = mode
+        self.entries = {}
+        if os.path.exists(path):
+            with open(path, 'r', encoding='utf-8') as manifest_file:
+                for line in manifest_file:
+                    try:
+                        entry = json.loads(line)
+                    except json.JSONDecodeError:
+                        continue  # Недописанная строка после аварийного завершения
+                    self.entries[entry['source']] = entry
+
+    def fingerprint(self, source_path):
+        stat = os.stat(source_path)
+        if self.mode == 'hash':
+            return {'hash': file_hash(source_path)}
+        return {'mtime': stat.st_mtime_ns, 'size': stat.st_size}
+
+    def is_up_to_date(self, source_path, params=None):
+        """
+        Проверяет, что файл уже обработан с теми же параметрами и не изменился с тех пор.
+        """
+        entry = self.entries.get(os.path.normpath(source_path))
+        if entry is None or entry.get('params') != params:
+            return False
+        if not all(os.path.exists(output) for output in entry['outputs']):
+            return False
+        fingerprint = self.fingerprint(source_path)
+        return all(entry.get(key) == value for key, value in fingerprint.items())
+
+    def record(self, source_path, outputs, params=None):
+        """
+        Записывает обработанный файл в манифест.
+        :param outputs: Список выходных файлов.
+        """
+        entry = {'source': os.path.normpath(source_path), 'outputs': [os.path.normpath(output) for output in outputs],
+                 'params': params}
+        entry.update(self.fingerprint(source_path))
+        self.entries[entry['source']] = entry
+
+        os.makedirs(os.path.dirname(self.path) or '.', exist_ok=True)
+        with open(self.path, 'a', encoding='utf-8') as manifest_file:
+            manifest_file.write(json.dumps(entry, ensure_ascii=False) + '\n')
+
+    def split(self, source_paths, params=None):
+        """
+        Делит файлы на требующие обработки и актуальные.
+        :return: (список файлов для обработки, количество пропущенных).
+        """
+        pending = [source_path for source_path in source_paths if not self.is_up_to_date(source_path, params)]
+        return pending, len(source_paths) - len(pending)
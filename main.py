@@ -1,13 +1,236 @@
+import os
+import sys
+import time
+import argparse
+import importlib.util
+from concurrent.futures import ProcessPoolExecutor, ThreadPoolExecutor, wait, FIRST_COMPLETED
+
 import convert_to_pdf
-import extract_images
-import extract_annotations
+import extract_images_pdf2image
 
-if __name__ == '__main__':
-    # Шаг 1: Конвертация DOCX в PDF
-    convert_to_pdf.convert_docx_to_pdf()
+BASE_DIR = os.path.dirname(os.path.abspath(__file__))
+
+
+def load_module(name, file_name):
+    """
+    Загружает скрипт, имя файла которого нельзя импортировать обычным import (например, docmake_v0.1.py).
+    Модуль регистрируется в sys.modules под именем name, чтобы его функции можно было передавать в процессы.
+    """
+    spec = importlib.util.spec_from_file_location(name, os.path.join(BASE_DIR, file_name))
+    module = importlib.util.module_from_spec(spec)
+    sys.modules[name] = module
+    spec.loader.exec_module(module)
+    return module
+
+
+docmake = load_module('docmake', 'docmake_v0.1.py')
+annotator = load_module('annotator', 'test_annot_v0.2.py')
+
+# Параллелизм стадий по умолчанию
+GENERATE_WORKERS = os.cpu_count() or 1
+CONVERT_WORKERS = None  # Экземпляров LibreOffice, по умолчанию зависит от бэкенда (для docx2pdf всегда 1)
+RASTERIZE_WORKERS = 2
+ANNOTATE_WORKERS = os.cpu_count() or 1
+MAX_IN_FLIGHT = 2 * (os.cpu_count() or 1)  # Документов одновременно в конвейере
+
+STAGES = ('generate', 'convert', 'rasterize', 'annotate')
+
+
+def timed_call(func, *args):
+    """
+    Вызывает func(*args) в процессе или потоке стадии.
+    :return: (результат, время выполнения в секундах).
+    """
+    started = time.monotonic()
+    result = func(*args)
+    return result, time.monotonic() - started
+
+
+class PipelineStats:
+    """
+    Счётчики стадий конвейера: количество, суммарное время и ошибки.
+    """
+
+    def __init__(self, total):
+        self.total = total
+        self.started = time.monotonic()
+        self.stage_times = {stage: [0, 0.0] for stage in STAGES}  # стадия -> [количество, суммарное время]
+        self.stage_errors = {stage: 0 for stage in STAGES}
+        self.completed = 0
+        self.failed = 0
+        self.pages = 0
+        self.first_sample = None  # Время до первого полностью обработанного документа
+
+    def add_time(self, stage, seconds):
+        self.stage_times[stage][0] += 1
+        self.stage_times[stage][1] += seconds
+
+    def add_error(self, stage):
+        self.stage_errors[stage] += 1
+
+    def finish_document(self, doc_num, ok):
+        elapsed = time.monotonic() - self.started
+        if ok:
+            self.completed += 1
+            if self.first_sample is None:
+                self.first_sample = elapsed
+        else:
+            self.failed += 1
+        done = self.completed + self.failed
+        status = "готов" if ok else "с ошибкой"
+        print(f"[{done}/{self.total}] Документ {doc_num} {status}, прошло {elapsed:.1f} с, "
+              f"{self.completed / elapsed * 60:.1f} док/мин")
 
-    # Шаг 2: Извлечение Изображений из PDF
-    extract_images.extract_images_from_pdf()
+    def print_summary(self):
+        wall_time = time.monotonic() - self.started
+        print(f"Готово документов: {self.completed}, с ошибками: {self.failed}, страниц: {self.pages}")
+        print(f"Общее время: {wall_time:.2f} с, до первого документа: "
+              f"{'-' if self.first_sample is None else f'{self.first_sample:.2f} с'}")
+        if wall_time > 0:
+            print(f"Пропускная способность: {self.completed / wall_time * 60:.1f} док/мин, "
+                  f"{self.pages / wall_time:.2f} стр/с")
+        for stage in STAGES:
+            count, total = self.stage_times[stage]
+            mean = total / count if count else 0.0
+            print(f"Стадия {stage}: {count} операций, ошибок {self.stage_errors[stage]}, "
+                  f"всего {total:.2f} с, в среднем {mean:.2f} с")
+
+
+def run_pipeline(start=0, end=docmake.num_documents, seed=None, docx_dir='docx', pdf_dir='pdf',
+                 image_dir='image', json_dir='json', generate_workers=GENERATE_WORKERS,
+                 convert_workers=CONVERT_WORKERS, rasterize_workers=RASTERIZE_WORKERS,
+                 annotate_workers=ANNOTATE_WORKERS, max_in_flight=MAX_IN_FLIGHT,
+                 plot_pool_size=docmake.PLOT_POOL_SIZE, text_corpus_path=None, cleanup=False,
+                 converter=convert_to_pdf.DEFAULT_BACKEND):
+    """
+    Потоковый конвейер: каждый документ проходит генерацию -> конвертацию в PDF ->
+    растрирование и разметку (две последние стадии идут параллельно) сразу, как только готов,
+    не дожидаясь остальных документов.
+    У каждой стадии свой пул обработчиков, а число документов в конвейере ограничено max_in_flight,
+    поэтому промежуточные файлы не накапливаются.
+
+    :param start: Номер первого документа.
+    :param end: Номер, следующий за последним документом.
+    :param seed: Базовый seed генерации (см. docmake.generate_document).
+    :param cleanup: Удалять DOCX и PDF успешно обработанного документа после растрирования и разметки.
+    :param convert_workers: Потоков конвертации (см. convert_to_pdf.resolve_workers).
+    :param converter: Бэкенд конвертации в PDF (см. convert_to_pdf.CONVERTER_BACKENDS).
+    :return: PipelineStats.
+    """
+    os.makedirs(docx_dir, exist_ok=True)
+    convert_workers = convert_to_pdf.resolve_workers(converter, convert_workers)
+
+    # Изображения и текст для генерации готовятся один раз, процессы получают готовые пулы
+    images = docmake.build_image_pool()
+    corpus = docmake.build_text_corpus(text_corpus_path)
+
+    if converter == 'libreoffice':
+        # Пул экземпляров LibreOffice по одному на поток конвертации
+        convert_to_pdf.get_office_pool(convert_workers)
+
+    executors = {
+        'generate': ProcessPoolExecutor(max_workers=generate_workers, initializer=docmake.init_worker,
+                                        initargs=(plot_pool_size, images, corpus)),
+        # Конвертация идёт во внешнем приложении, потоков достаточно
+        'convert': ThreadPoolExecutor(max_workers=convert_workers, initializer=convert_to_pdf.init_convert_thread,
+                                      initargs=(converter,)),
+        'rasterize': ProcessPoolExecutor(max_workers=rasterize_workers),
+        'annotate': ProcessPoolExecutor(max_workers=annotate_workers),
+    }
+
+    doc_nums = iter(range(start, end))
+    stats = PipelineStats(end - start)
+    pending = {}  # future -> (стадия, номер документа)
+    documents = {}  # номер документа -> {'docx', 'pdf', 'remaining', 'ok'}
+
+    def submit(stage, doc_num, func, *args):
+        pending[executors[stage].submit(timed_call, func, *args)] = (stage, doc_num)
+
+    def finish(doc_num):
+        document = documents.pop(doc_num)
+        if cleanup and document['ok']:
+            for path in (document.get('docx'), document.get('pdf')):
+                if path and os.path.exists(path):
+                    os.remove(path)
+        stats.finish_document(doc_num, document['ok'])
+
+    try:
+        while True:
+            # Подаём новые документы, пока не заполнен конвейер
+            while len(documents) < max_in_flight:
+                doc_num = next(doc_nums, None)
+                if doc_num is None:
+                    break
+                documents[doc_num] = {'remaining': 1, 'ok': True}
+                submit('generate', doc_num, docmake.generate_document, doc_num, docx_dir, seed)
+            if not pending:
+                break
+
+            done, _ = wait(pending, return_when=FIRST_COMPLETED)
+            for future in done:
+                stage, doc_num = pending.pop(future)
+                document = documents[doc_num]
+                document['remaining'] -= 1
+                try:
+                    result, seconds = future.result()
+                except Exception as e:
+                    print(f"Ошибка на стадии {stage} для документа {doc_num}: {e}")
+                    stats.add_error(stage)
+                    document['ok'] = False
+                else:
+                    stats.add_time(stage, seconds)
+                    if stage == 'generate':
+                        document['docx'] = result
+                        document['remaining'] += 1
+                        submit('convert', doc_num, convert_to_pdf.convert_file, result, pdf_dir, converter)
+                    elif stage == 'convert':
+                        # Растрирование и разметка читают только PDF и не зависят друг от друга
+                        document['pdf'] = result
+                        document['remaining'] += 2
+                        submit('rasterize', doc_num, extract_images_pdf2image.extract_pdf_images, result, image_dir)
+                        submit('annotate', doc_num, annotator.annotate_pdf, result, json_dir)
+                    elif stage == 'rasterize':
+                        stats.pages += len(result)
+                if document['remaining'] == 0:
+                    finish(doc_num)
+    finally:
+        for executor in executors.values():
+            executor.shutdown(cancel_futures=True)
+
+    stats.print_summary()
+    return stats
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(
+        description="Потоковая генерация датасета: DOCX -> PDF -> изображения страниц и JSON-разметка")
+    parser.add_argument("--start", type=int, default=0, help="Номер первого документа")
+    parser.add_argument("--end", type=int, default=docmake.num_documents,
+                        help="Номер, следующий за последним документом")
+    parser.add_argument("--seed", type=int, help="Базовый seed генерации документов")
+    parser.add_argument("--docx-dir", default='docx')
+    parser.add_argument("--pdf-dir", default='pdf')
+    parser.add_argument("--image-dir", default='image')
+    parser.add_argument("--json-dir", default='json')
+    parser.add_argument("--generate-workers", type=int, default=GENERATE_WORKERS)
+    parser.add_argument("--convert-workers", type=int, default=CONVERT_WORKERS,
+                        help="Экземпляров LibreOffice (по умолчанию половина ядер; для docx2pdf всегда 1)")
+    parser.add_argument("--rasterize-workers", type=int, default=RASTERIZE_WORKERS)
+    parser.add_argument("--annotate-workers", type=int, default=ANNOTATE_WORKERS)
+    parser.add_argument("--max-in-flight", type=int, default=MAX_IN_FLIGHT,
+                        help="Максимальное число документов, одновременно находящихся в конвейере")
+    parser.add_argument("--plot-pool", type=int, default=docmake.PLOT_POOL_SIZE,
+                        help="Размер пула заранее сгенерированных графиков")
+    parser.add_argument("--text-corpus", help="JSON-файл пула текста (см. docmake_v0.1.py)")
+    parser.add_argument("--converter", choices=convert_to_pdf.CONVERTER_BACKENDS,
+                        default=convert_to_pdf.DEFAULT_BACKEND, help="Бэкенд конвертации DOCX в PDF")
+    parser.add_argument("--cleanup", action="store_true",
+                        help="Удалять DOCX и PDF после получения изображений и разметки")
+    args = parser.parse_args()
 
-    # Шаг 3: Извлечение Координат Элементов из PDF
-    extract_annotations.extract_annotations_from_pdf()
+    run_pipeline(args.start, args.end, seed=args.seed, docx_dir=args.docx_dir, pdf_dir=args.pdf_dir,
+                 image_dir=args.image_dir, json_dir=args.json_dir, generate_workers=args.generate_workers,
+                 convert_workers=args.convert_workers, rasterize_workers=args.rasterize_workers,
+                 annotate_workers=args.annotate_workers, max_in_flight=args.max_in_flight,
+                 plot_pool_size=args.plot_pool, text_corpus_path=args.text_corpus, cleanup=args.cleanup,
+                 converter=args.converter)
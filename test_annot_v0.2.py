@@ -1,10 +1,15 @@
 import os
 import json
 import re
+import time
+import argparse
+from concurrent.futures import ProcessPoolExecutor, as_completed
+from concurrent.futures.process import BrokenProcessPool
 from pdfminer.high_level import extract_pages
 from pdfminer.layout import (LAParams, LTTextBoxHorizontal, LTTextLineHorizontal,
                              LTChar)
 from collections import defaultdict
+import numpy as np
 import fitz  # PyMuPDF
 import pdfplumber
 
@@ -13,336 +18,744 @@ import pdfplumber
 SCALING_FACTOR = 4.1667  # Пример для dpi=300 (300 / 72)
 IMAGE_DIR = 'image'  # Папка, где сохраняются изображения страницы
 
+# Настройки поиска таблиц по линиям (одинаковые для pdfplumber и PyMuPDF)
+TABLE_SETTINGS = {
+    "vertical_strategy": "lines",
+    "horizontal_strategy": "lines",
+    "intersection_tolerance": 5,
+}
 
-def extract_annotations_from_pdf(pdf_path, output_dir='json'):
+# Движки разметки: 'pymupdf' - один проход PyMuPDF, 'legacy' - pdfminer/pdfplumber, затем PyMuPDF
+ENGINES = ('pymupdf', 'legacy')
+
+# Максимальное число пар-кандидатов (бокс запроса, бокс индекса) в одном векторном сравнении
+BATCH_PAIRS = 1 << 20
+
+# Параллельная разметка документов
+ANNOTATE_WORKERS = os.cpu_count() or 1  # Количество процессов
+PAGES_PER_TASK = 50  # Большие документы делятся на задачи по столько страниц
+SUMMARY_NAME = 'annotation_summary.json'  # Сводка по документам
+
+
+def page_file_name(pdf_path, page_number, extension):
+    """
+    Имя файла страницы: {имя PDF}_page_{номер страницы, начиная с 1}.{extension}
+    """
+    return f"{os.path.splitext(os.path.basename(pdf_path))[0]}_page_{page_number}.{extension}"
+
+
+def new_page_annotation(pdf_path, page_number, page_width, page_height):
+    """
+    Пустая разметка страницы со всеми 13 классами.
+    :param page_width: Ширина страницы в пикселях изображения.
+    :param page_height: Высота страницы в пикселях изображения.
+    """
+    return {
+        "image_height": int(page_height),
+        "image_width": int(page_width),
+        "image_path": os.path.join(IMAGE_DIR, page_file_name(pdf_path, page_number, 'png')),
+        "title": [],
+        "paragraph": [],
+        "table": [],
+        "picture": [],
+        "table_signature": [],
+        "picture_signature": [],
+        "numbered_list": [],
+        "marked_list": [],
+        "header": [],
+        "footer": [],
+        "footnote": [],
+        "formula": [],
+        "graph": []
+    }
+
+
+def save_page_annotation(json_data, json_path):
+    with open(json_path, 'w', encoding='utf-8') as json_file:
+        json.dump(json_data, json_file, ensure_ascii=False, indent=4)
+
+
+def scale_bbox(bbox):
+    x0, y0, x1, y1 = bbox
+    return [x0 * SCALING_FACTOR, y0 * SCALING_FACTOR, x1 * SCALING_FACTOR, y1 * SCALING_FACTOR]
+
+
+def merge_signature_lines(elements, idx):
+    """
+    Объединяет строку подписи с идущими следом строками того же размера шрифта.
+    :return: (объединенный бокс, индекс первой не вошедшей строки).
+    """
+    # Инициализируем объединенный бокс
+    combined_coords = elements[idx]['coords'].copy()
+    # Сохраняем размер шрифта и нижнюю координату Y текущего элемента
+    current_font_size = elements[idx]['font_size']
+    current_bottom_y = combined_coords[3]
+    # Инициализируем индекс для просмотра следующих элементов
+    idx_next = idx + 1
+    while idx_next < len(elements):
+        next_elem = elements[idx_next]
+        next_font_size = next_elem['font_size']
+        next_coords = next_elem['coords']
+        # Проверяем, похож ли размер шрифта
+        if abs(next_font_size - current_font_size) < 0.1:
+            # Проверяем, близко ли расположены элементы по Y
+            vertical_gap = next_coords[1] - current_bottom_y
+            if 0 <= vertical_gap <= 20:
+                # Обновляем объединенный бокс
+                combined_coords[0] = min(combined_coords[0], next_coords[0])
+                combined_coords[1] = min(combined_coords[1], next_coords[1])
+                combined_coords[2] = max(combined_coords[2], next_coords[2])
+                combined_coords[3] = max(combined_coords[3], next_coords[3])
+                current_bottom_y = combined_coords[3]
+                idx_next += 1
+                continue
+        break
+    return combined_coords, idx_next
+
+
+def classify_text_lines(elements, annotations, page_width, page_height):
+    """
+    Размечает по строкам текста хедер, футер, сноски, подписи к рисункам и таблицам и заголовки.
+    Строки, не попавшие в эти классы, остаются параграфам и спискам.
+
+    :param elements: Строки текста вне таблиц в порядке чтения. Каждая строка - словарь с ключами
+                     text, font_size, is_bold, is_italic, coords (бокс в пикселях изображения)
+                     и chars - список (символ, бокс символа или None) по всем символам строки.
+    :param annotations: Разметка страницы, в которую добавляются боксы.
+    :param page_width: Ширина страницы в пикселях изображения.
+    :param page_height: Высота страницы в пикселях изображения.
+    """
+    is_landscape = page_width > page_height
+
+    # Настройка порогов для хедера и футера в зависимости от ориентации
+    if is_landscape:
+        header_y_threshold = page_height * 0.10
+        footer_y_threshold = page_height * 0.90
+    else:
+        header_y_threshold = page_height * 0.05
+        footer_y_threshold = page_height * 0.95
+
+    header_elements = []
+    footer_elements = []
+
+    idx = 0
+    current_title = None
+    while idx < len(elements):
+        elem = elements[idx]
+        text = elem['text']
+        is_bold = elem['is_bold']
+        is_italic = elem['is_italic']
+        coords_transformed = elem['coords']
+
+        x0_scaled, y0_scaled, x1_scaled, y1_scaled = coords_transformed
+
+        # Определение хедера и футера
+        if y0_scaled < header_y_threshold:
+            header_elements.append(coords_transformed)
+            idx += 1
+            continue
+        elif y1_scaled > footer_y_threshold:
+            footer_elements.append(coords_transformed)
+            idx += 1
+            continue
+
+        # Обработка сносок в тексте
+        line_text = ''.join(char_text for char_text, _ in elem['chars'])
+        footnote_matches = re.finditer(r'\[\d+\]', line_text)
+        x0_br = y0_br = x1_br = y1_br = 0
+        for match in footnote_matches:
+            start, end = match.span()
+            for char_text, char_bbox in elem['chars'][start:end]:
+                if char_bbox is None:
+                    continue
+                if char_text == '[':
+                    x0_br, y0_br = char_bbox[0], char_bbox[1]
+                if char_text == ']':
+                    x1_br, y1_br = char_bbox[2], char_bbox[3]
+                    annotations['footnote'].append([x0_br, y0_br, x1_br, y1_br])
+                    break
+
+        # Обработка подписей к рисункам
+        figure_signature_match = re.match(r'^\s*(рис\.?|рисунок)\s*((№|#)\s*)*\d+', text.lower())
+        if figure_signature_match:
+            if current_title is not None:
+                annotations['title'].append(current_title)
+                current_title = None
+            combined_coords, idx = merge_signature_lines(elements, idx)
+            annotations['picture_signature'].append(combined_coords)
+            continue
+
+        # Обработка подписей к таблицам
+        table_signature_match = re.match(r'^\s*(табл\.?|таблица)\s*((№|#)\s*)*\d+', text.lower())
+        if table_signature_match:
+            if current_title is not None:
+                annotations['title'].append(current_title)
+                current_title = None
+            combined_coords, idx = merge_signature_lines(elements, idx)
+            annotations['table_signature'].append(combined_coords)
+            continue
+
+        # Обработка формул
+        formula_match = re.match(r'^\s*формула', text.lower())
+        if formula_match or (is_centered_text(coords_transformed, page_width) and not any(c.isalnum() for c in text)):
+            if current_title is not None:
+                annotations['title'].append(current_title)
+                current_title = None
+            # Формулы размечаются по изображениям, поэтому здесь пропускаем
+            idx += 1
+            continue
+
+        # Обработка заголовков
+        if is_bold or is_italic:
+            if current_title is None:
+                current_title = coords_transformed.copy()
+            else:
+                current_title[0] = min(current_title[0], coords_transformed[0])
+                current_title[1] = min(current_title[1], coords_transformed[1])
+                current_title[2] = max(current_title[2], coords_transformed[2])
+                current_title[3] = max(current_title[3], coords_transformed[3])
+        else:
+            # Если мы были в заголовке, завершаем его
+            if current_title is not None:
+                annotations['title'].append(current_title)
+                current_title = None
+            # Параграфы размечаются по спанам PyMuPDF, поэтому здесь пропускаем
+
+        idx += 1
+
+    # После цикла добавляем незавершенные элементы
+    if current_title is not None:
+        annotations['title'].append(current_title)
+
+    # Объединение боксов хедера и футера
+    if header_elements:
+        min_x = min(box[0] for box in header_elements)
+        min_y = min(box[1] for box in header_elements)
+        max_x = max(box[2] for box in header_elements)
+        max_y = max(box[3] for box in header_elements)
+        annotations['header'].append([min_x, min_y, max_x, max_y])
+    if footer_elements:
+        min_x = min(box[0] for box in footer_elements)
+        min_y = min(box[1] for box in footer_elements)
+        max_x = max(box[2] for box in footer_elements)
+        max_y = max(box[3] for box in footer_elements)
+        annotations['footer'].append([min_x, min_y, max_x, max_y])
+
+
+def make_text_line(chars, sizes, is_bold, is_italic, coords):
+    """
+    Собирает строку текста для classify_text_lines.
+    Строки из одних специальных символов-меток ('~', '&', '$') и строки без символов шрифта пропускаются.
+    :return: Словарь строки или None.
+    """
+    text = ''.join(char_text for char_text, _ in chars)
+    # Если строка содержит только специальные символы, пропускаем ее
+    contains_special_symbol = any(c in text for c in '~&$')
+    if contains_special_symbol and not any(c.isalnum() for c in text):
+        return None
+    if not sizes:
+        return None
+    return {
+        'text': text.strip(),
+        'chars': chars,
+        'font_size': sum(sizes) / len(sizes),
+        'is_bold': is_bold,
+        'is_italic': is_italic,
+        'coords': coords
+    }
+
+
+def collect_pdfminer_lines(page_layout, page_height, table_bboxes):
+    """
+    Собирает строки текста страницы pdfminer вне таблиц.
+    :param table_bboxes: Боксы таблиц страницы.
+    """
+    text_lines = []
+    for element in page_layout:
+        if isinstance(element, LTTextBoxHorizontal):
+            for text_line in element:
+                if isinstance(text_line, LTTextLineHorizontal):
+                    # Получаем координаты текстовой строки
+                    x0, y0, x1, y1 = text_line.bbox
+                    x0_scaled = x0 * SCALING_FACTOR
+                    x1_scaled = x1 * SCALING_FACTOR
+                    y0_scaled = y0 * SCALING_FACTOR
+                    y1_scaled = y1 * SCALING_FACTOR
+
+                    # Преобразуем координаты в систему с началом в верхнем левом углу
+                    text_y0 = page_height - y1_scaled  # Верхняя граница
+                    text_y1 = page_height - y0_scaled  # Нижняя граница
+
+                    text_lines.append((text_line, [x0_scaled, text_y0, x1_scaled, text_y1]))
+
+    # Строки внутри таблиц пропускаются; проверка всех строк страницы - один векторный запрос
+    in_table = BoxIndex(table_bboxes).overlaps_any([coords for _, coords in text_lines])
+
+    elements = []
+    for (text_line, coords_transformed), inside in zip(text_lines, in_table):
+        if inside or not text_line.get_text().strip():
+            continue
+
+        sizes = []
+        is_bold = False
+        is_italic = False
+        chars = []
+        for char in text_line:
+            if isinstance(char, LTChar):
+                sizes.append(char.size)
+                font_name = char.fontname.lower()
+                if 'bold' in font_name:
+                    is_bold = True
+                if 'italic' in font_name or 'oblique' in font_name:
+                    is_italic = True
+                cx0, cy0, cx1, cy1 = char.bbox
+                chars.append((char.get_text(), [cx0 * SCALING_FACTOR, page_height - cy1 * SCALING_FACTOR,
+                                                cx1 * SCALING_FACTOR, page_height - cy0 * SCALING_FACTOR]))
+            else:
+                chars.append((char.get_text(), None))
+
+        line = make_text_line(chars, sizes, is_bold, is_italic, coords_transformed)
+        if line is not None:
+            elements.append(line)
+    return elements
+
+
+def collect_rawdict_lines(page_dict, table_bboxes):
+    """
+    Собирает строки текста страницы из get_text("rawdict") PyMuPDF вне таблиц.
+    :param table_bboxes: Боксы таблиц страницы.
+    """
+    lines = [line for block in page_dict['blocks'] if block['type'] == 0 for line in block['lines']]
+    line_bboxes = [scale_bbox(line['bbox']) for line in lines]
+    # Строки внутри таблиц пропускаются; проверка всех строк страницы - один векторный запрос
+    in_table = BoxIndex(table_bboxes).overlaps_any(line_bboxes)
+
+    elements = []
+    for line, coords_transformed, inside in zip(lines, line_bboxes, in_table):
+        if inside:
+            continue
+
+        sizes = []
+        is_bold = False
+        is_italic = False
+        chars = []
+        for span in line['spans']:
+            font_name = span['font'].lower()
+            for char in span['chars']:
+                sizes.append(span['size'])
+                if 'bold' in font_name:
+                    is_bold = True
+                if 'italic' in font_name or 'oblique' in font_name:
+                    is_italic = True
+                chars.append((char['c'], scale_bbox(char['bbox'])))
+
+        if not ''.join(char_text for char_text, _ in chars).strip():
+            continue
+        line = make_text_line(chars, sizes, is_bold, is_italic, coords_transformed)
+        if line is not None:
+            elements.append(line)
+    return elements
+
+
+def collect_pymupdf_elements(page_dict, page_width):
+    """
+    Собирает спаны текста и изображения страницы из get_text("dict") или get_text("rawdict") PyMuPDF
+    и определяет по меткам '~', '&', '$' типы изображений ("formula", "image", "graph").
+    :param page_width: Ширина страницы в пунктах PDF.
+    :return: (элементы страницы, список типов изображений).
+    """
+    elements = []  # Список для хранения элементов страницы
+    pictures_type = []  # Список для хранения типов аннотаций ("formula", "image", "graph")
+    second_mid_sym_in_row = False # Флаг для корректного нахождения изображений, занимающих большую часть ширины страницы
+    for block in page_dict['blocks']:
+        if block['type'] == 0:  # Текстовый блок
+            for line in block['lines']:
+                for span in line['spans']:
+                    # В rawdict текст спана хранится только посимвольно
+                    text = span['text'] if 'text' in span else ''.join(char['c'] for char in span['chars'])
+                    x0, _, x1, _ = span['bbox']
+                    elements.append({
+                        'type': 'text',
+                        'text': text,
+                        'bbox': scale_bbox(span['bbox']),
+                        'char_count': len(text),
+                        'font_size': span['size'],
+                        'contains_list_stop_sym': '@' in text  # Наличие символа-признака конца списка
+                    })
+                    # Проверяем на наличие символов "~", "&" и "$"
+                    if '~' in text:
+                        pictures_type.append('formula')
+                    elif '&' in text:
+                        if abs(x0 + x1 - page_width) > 1.0:
+                            pictures_type.append('image')
+                            second_mid_sym_in_row = False
+                        else:
+                            if second_mid_sym_in_row:
+                                pictures_type.append('image')
+                            second_mid_sym_in_row = not second_mid_sym_in_row
+                    elif '$' in text:
+                        pictures_type.append('graph')
+        elif block['type'] == 1:  # Изображение
+            elements.append({
+                'type': 'image',
+                'bbox': scale_bbox(block['bbox'])
+            })
+    return elements, pictures_type
+
+
+def add_picture_annotations(elements, pictures_type, json_data):
+    """
+    Присваивает последним изображениям страницы типы из pictures_type и добавляет их в разметку.
+    """
+    image_elements = [elem for elem in elements if elem['type'] == 'image']
+    if not pictures_type:
+        return
+
+    for image_elem, picture_type in zip(image_elements[-len(pictures_type):], pictures_type):
+        if picture_type == 'formula':
+            json_data['formula'].append(image_elem['bbox'])
+        elif picture_type == 'image':
+            json_data['picture'].append(image_elem['bbox'])
+        elif picture_type == 'graph':
+            json_data['graph'].append(image_elem['bbox'])
+
+
+def add_list_annotations(text_elements, json_data):
+    """
+    Размечает нумерованные и маркированные списки по спанам текста.
+    """
+    # Флаги для управления состоянием
+    in_numbered_list = False
+    in_bulleted_list = False
+
+    idx = 0
+    x_list_begin = y_list_begin = -1
+    x_list_end = y_list_end = -1
+    bullet_chars = '•◦●○▪–—*-·•‣⁃▪■❖➤►▶‣⁌⁍'
+
+    # Цикл по текстовым элементам страницы
+    while idx < len(text_elements):
+        text = text_elements[idx]['text']
+        containts_list_stop_sym = text_elements[idx]['contains_list_stop_sym']
+        if text == ' ':
+            idx += 1
+            if idx == len(text_elements):
+                if in_numbered_list:
+                    json_data['numbered_list'].append(
+                        [x_list_begin, y_list_begin, x_list_end, y_list_end])
+                if in_bulleted_list:
+                    json_data['marked_list'].append(
+                        [x_list_begin, y_list_begin, x_list_end, y_list_end])
+            continue
+        coords_transformed = text_elements[idx]['bbox']
+
+        # Обработка нумерованных списков
+        numbered_match = re.match(r'^\s*\d+[\.\)]\s*', text)
+        if numbered_match and not in_numbered_list:
+            in_numbered_list = True
+            if in_bulleted_list:
+                json_data['marked_list'].append([x_list_begin, y_list_begin, x_list_end, y_list_end])
+                in_bulleted_list = False
+            if not any(char.isalpha() for char in text):
+                idx += 2
+            x_list_begin, y_list_begin, _, y_list_end = coords_transformed
+            x_list_end = text_elements[idx]['bbox'][2]
+            idx += 1
+            continue
+
+        # Продолжение нумерованного списка
+        if in_numbered_list:
+            if not containts_list_stop_sym:
+                if y_list_end - coords_transformed[1] > 500:
+                    json_data['numbered_list'].append(
+                        [x_list_begin, y_list_begin, x_list_end, y_list_end])
+                    x_list_begin = coords_transformed[0]
+                    y_list_begin = coords_transformed[1]
+
+                if x_list_begin > coords_transformed[0]:
+                    x_list_begin = coords_transformed[0]
+                if x_list_end < coords_transformed[2]:
+                    x_list_end = coords_transformed[2]
+                y_list_end = coords_transformed[3]
+
+                idx += 1
+                if idx == len(text_elements):
+                    json_data['numbered_list'].append(
+                        [x_list_begin, y_list_begin, x_list_end, y_list_end])
+                if not any(char.isalpha() for char in text):
+                    idx += 1
+                continue
+            else:
+                json_data['numbered_list'].append(
+                    [x_list_begin, y_list_begin, x_list_end, y_list_end])
+                in_numbered_list = False
+                idx += 1
+                continue
+
+        # Обработка маркированных списков
+        bulleted_match = re.match(r'^\s*[' + re.escape(bullet_chars) + r']\s*', text)
+        if bulleted_match and not in_bulleted_list:
+            in_bulleted_list = True
+            in_numbered_list = False
+            if not any(char.isalpha() for char in text):
+                idx += 2
+            x_list_begin, y_list_begin, _, y_list_end = coords_transformed
+            x_list_end = text_elements[idx]['bbox'][2]
+            idx += 1
+            continue
+
+        # Продолжение маркированного списка
+        if in_bulleted_list:
+            if not containts_list_stop_sym:
+                if y_list_end - coords_transformed[1] > 500:
+                    json_data['marked_list'].append(
+                        [x_list_begin, y_list_begin, x_list_end, y_list_end])
+                    x_list_begin = coords_transformed[0]
+                    y_list_begin = coords_transformed[1]
+
+                if x_list_begin > coords_transformed[0]:
+                    x_list_begin = coords_transformed[0]
+                if x_list_end < coords_transformed[2]:
+                    x_list_end = coords_transformed[2]
+                y_list_end = coords_transformed[3]
+
+                idx += 1
+                if idx == len(text_elements):
+                    json_data['marked_list'].append(
+                        [x_list_begin, y_list_begin, x_list_end, y_list_end])
+                if not any(char.isalpha() for char in text):
+                    idx += 1
+                continue
+            else:
+                json_data['marked_list'].append(
+                    [x_list_begin, y_list_begin, x_list_end, y_list_end])
+                in_bulleted_list = False
+                idx += 1
+                continue
+
+        idx += 1
+
+
+def add_paragraph_annotations(text_elements, json_data):
+    """
+    Размечает параграфы: спаны текста, не пересекающиеся с уже размеченными элементами,
+    группируются в столбцы по вертикальной близости и объединяются в один бокс на столбец.
+    """
+    # Собираем все существующие боксы, чтобы избежать пересечений
+    existing_boxes = []
+    for key in ['title', 'table', 'picture', 'table_signature', 'picture_signature', 'numbered_list', 'marked_list',
+                'header', 'footer', 'formula', 'graph']:
+        existing_boxes.extend(json_data.get(key, []))
+
+    # Фильтруем текстовые элементы, не пересекающиеся с существующими боксами (одним векторным запросом)
+    overlaps = BoxIndex(existing_boxes).overlaps_any([elem['bbox'] for elem in text_elements])
+    filtered_text_elements = [elem for elem, overlap in zip(text_elements, overlaps) if not overlap]
+
+    # Исключаем элементы, содержащие только символы " ", "~", "&", "$", "@" из аннотирования как параграф
+    paragraph_elements = []
+    for elem in filtered_text_elements:
+        text_content = elem['text'].strip()
+        if text_content not in ["", "~", "&", "$", "@"]:
+            paragraph_elements.append(elem)
+
+    # Группируем элементы в столбцы на основе координаты x0
+    threshold = 200
+    # Собираем элементы с их x0 и y0 координатами
+    sorted_elements = paragraph_elements
+    columns = []
+    current_column = []
+    prev_y0 = None
+
+    for elem in sorted_elements:
+        y0 = elem['bbox'][1]
+        if prev_y0 is None:
+            current_column.append(elem)
+        elif abs(y0 - prev_y0) <= threshold:
+            current_column.append(elem)
+        else:
+            columns.append(current_column)
+            current_column = [elem]
+        prev_y0 = y0
+
+    # Добавляем последний столбец
+    if current_column:
+        columns.append(current_column)
+
+    # Объединяем боксы в каждом столбце
+    for column in columns:
+        x0s = [elem['bbox'][0] for elem in column]
+        y0s = [elem['bbox'][1] for elem in column]
+        x1s = [elem['bbox'][2] for elem in column]
+        y1s = [elem['bbox'][3] for elem in column]
+        merged_bbox = [min(x0s), min(y0s), max(x1s), max(y1s)]
+        # Добавляем объединенный бокс в поле 'paragraph' в json_data
+        json_data['paragraph'].append(merged_bbox)
+
+
+def annotate_page_pymupdf(page, pdf_path, page_number):
+    """
+    Размечает одну страницу за один разбор PyMuPDF: таблицы ищутся page.find_tables,
+    а строки, спаны, символы и изображения берутся из одного вызова get_text("rawdict").
+
+    :param page: Страница fitz.Page.
+    :param page_number: Номер страницы, начиная с 1.
+    :return: Разметка страницы (13 классов).
+    """
+    page_width, page_height = page.rect.width, page.rect.height
+    json_data = new_page_annotation(pdf_path, page_number, page_width * SCALING_FACTOR, page_height * SCALING_FACTOR)
+
+    # Таблицы
+    table_bboxes = [scale_bbox(table.bbox) for table in page.find_tables(**TABLE_SETTINGS).tables]
+    json_data['table'].extend(table_bboxes)
+
+    page_dict = page.get_text("rawdict")
+
+    # Заголовки, подписи, сноски, хедер и футер - по строкам
+    lines = collect_rawdict_lines(page_dict, table_bboxes)
+    classify_text_lines(lines, json_data, page_width * SCALING_FACTOR, page_height * SCALING_FACTOR)
+
+    # Формулы, изображения, графики, списки и параграфы - по спанам
+    elements, pictures_type = collect_pymupdf_elements(page_dict, page_width)
+    add_picture_annotations(elements, pictures_type, json_data)
+    text_elements = [elem for elem in elements if elem['type'] == 'text']
+    add_list_annotations(text_elements, json_data)
+    add_paragraph_annotations(text_elements, json_data)
+    return json_data
+
+
+def extract_annotations_single_pass(pdf_path, output_dir='json', pages=None):
+    """
+    Размечает PDF-файл одним разбором PyMuPDF и сохраняет JSON каждой страницы.
+    :param pages: Номера страниц (начиная с 1); по умолчанию все страницы.
+    """
+    os.makedirs(output_dir, exist_ok=True)
+
+    with fitz.open(pdf_path) as doc:
+        for page_number in select_pages(pages, len(doc)):
+            json_data = annotate_page_pymupdf(doc[page_number - 1], pdf_path, page_number)
+            json_path = os.path.join(output_dir, page_file_name(pdf_path, page_number, 'json'))
+            save_page_annotation(json_data, json_path)
+            print(f"Аннотации для страницы {page_number} сохранены в {json_path}.")
+
+
+def extract_annotations_from_pdf(pdf_path, output_dir='json', pages=None, save=True):
     """
     Извлекает координаты элементов из PDF-файла и сохраняет их в JSON-файлы.
     Теперь с поддержкой аннотирования таблиц с использованием pdfplumber, включая таблицы без границ.
     Параграфы не обрабатываются здесь и будут обрабатываться PyMuPDF.
+    :param pages: Номера страниц (начиная с 1); по умолчанию все страницы.
+    :param save: Сохранять JSON страниц; без сохранения разметка только возвращается
+                 (для передачи в extract_annotations_with_pymupdf).
+    :return: Словарь {номер страницы: разметка страницы}.
     """
-    if not os.path.exists(output_dir):
+    if save and not os.path.exists(output_dir):
         os.makedirs(output_dir)
 
+    page_annotations = {}
+
     laparams = LAParams()
 
     # Открываем PDF-файл с помощью pdfplumber
     with pdfplumber.open(pdf_path) as pdf:
-        for page_number, page_layout in enumerate(extract_pages(pdf_path, laparams=laparams)):
+        page_indices = [page_number - 1 for page_number in select_pages(pages, len(pdf.pages))]
+        page_layouts = extract_pages(pdf_path, page_numbers=page_indices, laparams=laparams)
+        for page_index, page_layout in zip(page_indices, page_layouts):
             annotations = defaultdict(list)
-            font_sizes = []
-            elements = []
-            header_elements = []
-            footer_elements = []
-            page = pdf.pages[page_number]
+            page = pdf.pages[page_index]
 
             # Получаем размеры страницы
             page_width = page_layout.bbox[2] * SCALING_FACTOR
             page_height = page_layout.bbox[3] * SCALING_FACTOR
 
-            is_landscape = page_width > page_height
-
-            # Настройка порогов для хедера и футера в зависимости от ориентации
-            if is_landscape:
-                header_y_threshold = page_height * 0.10
-                footer_y_threshold = page_height * 0.90
-            else:
-                header_y_threshold = page_height * 0.05
-                footer_y_threshold = page_height * 0.95
-
-            # Извлекаем таблицы с помощью pdfplumber с использованием режима 'stream' для обнаружения таблиц без границ
-            table_settings = {
-                "vertical_strategy": "lines",
-                "horizontal_strategy": "lines",
-                "intersection_tolerance": 5,
-            }
-            tables = page.extract_tables(table_settings=table_settings)
+            # Получаем координаты таблиц (включая таблицы без границ)
             table_bboxes = []
-
-            # Получаем координаты таблиц
-            for table in page.find_tables(table_settings=table_settings):
+            for table in page.find_tables(table_settings=TABLE_SETTINGS):
                 x0, top, x1, bottom = table.bbox  # bbox = (x0, top, x1, bottom)
-                x0_scaled = x0 * SCALING_FACTOR
-                x1_scaled = x1 * SCALING_FACTOR
-                y0_scaled = top * SCALING_FACTOR
-                y1_scaled = bottom * SCALING_FACTOR
-                # Координаты преобразуются в формат [x0, y0, x1, y1]
-                coords_transformed = [x0_scaled, y0_scaled, x1_scaled, y1_scaled]
-                table_bboxes.append(coords_transformed)
+                table_bboxes.append(scale_bbox((x0, top, x1, bottom)))
             # Добавляем координаты таблиц в аннотации
             annotations['table'].extend(table_bboxes)
 
-            # Сбор информации о шрифтах и элементах, за исключением параграфов
-            for element in page_layout:
-                if isinstance(element, LTTextBoxHorizontal):
-                    for text_line in element:
-                        if isinstance(text_line, LTTextLineHorizontal):
-                            # Получаем координаты текстовой строки
-                            x0, y0, x1, y1 = text_line.bbox
-                            x0_scaled = x0 * SCALING_FACTOR
-                            x1_scaled = x1 * SCALING_FACTOR
-                            y0_scaled = y0 * SCALING_FACTOR
-                            y1_scaled = y1 * SCALING_FACTOR
-
-                            # Преобразуем координаты в систему с началом в верхнем левом углу
-                            text_y0 = page_height - y1_scaled  # Верхняя граница
-                            text_y1 = page_height - y0_scaled  # Нижняя граница
-
-                            coords_transformed = [x0_scaled, text_y0, x1_scaled, text_y1]
-
-                            # Проверяем, находится ли текстовая строка внутри таблицы
-                            if is_in_table(coords_transformed, table_bboxes):
-                                continue  # Пропускаем обработку этой строки, так как она внутри таблицы
-
-                            line_text = text_line.get_text().strip()
-                            if not line_text:
-                                continue
-
-                            sizes = []
-                            is_bold = False
-                            is_italic = False
-                            text_chars = []
-                            font_colors = set()
-                            contains_special_symbol = False  # Флаг наличия специальных символов
-                            for char in text_line:
-                                if isinstance(char, LTChar):
-                                    sizes.append(char.size)
-                                    font_name = char.fontname.lower()
-                                    if 'bold' in font_name:
-                                        is_bold = True
-                                    if 'italic' in font_name or 'oblique' in font_name:
-                                        is_italic = True
-                                    char_text = char.get_text()
-                                    text_chars.append(char_text)
-                                    # Проверяем наличие специальных символов
-                                    if char_text in ['~', '&', '$']:
-                                        contains_special_symbol = True
-                                    # Получение информации о цвете шрифта
-                                    try:
-                                        font_color = char.graphicstate.ncolor
-                                        font_colors.add(font_color)
-                                    except AttributeError:
-                                        pass
-                                else:
-                                    text_chars.append(char.get_text())
-
-                            # Если строка содержит только специальные символы, пропускаем ее
-                            if contains_special_symbol and not any(c.isalnum() for c in ''.join(text_chars)):
-                                continue
-
-                            if sizes:
-                                font_size = sum(sizes) / len(sizes)
-                                font_sizes.append(font_size)
-                                elements.append({
-                                    'text_line': text_line,
-                                    'text': ''.join(text_chars).strip(),
-                                    'char_count': len(text_chars),  # Изменено: добавлено количество символов
-                                    'font_size': font_size,
-                                    'is_bold': is_bold,
-                                    'is_italic': is_italic,
-                                    'font_colors': font_colors,
-                                    'coords': coords_transformed,
-                                    'contains_special_symbol': contains_special_symbol
-                                })
-
-            # Убираем обработку параграфов в pdfminer
-            # Все параграфы будут обрабатываться в PyMuPDF
-
-            # Обработка заголовков
-            idx = 0
-            current_title = None
-            while idx < len(elements):
-                elem = elements[idx]
-                text_line = elem['text_line']
-                text = elem['text']
-                font_size = elem['font_size']
-                is_bold = elem['is_bold']
-                is_italic = elem['is_italic']
-                font_colors = elem['font_colors']
-                coords_transformed = elem['coords']
-                contains_special_symbol = elem['contains_special_symbol']
-
-                x0_scaled, y0_scaled, x1_scaled, y1_scaled = coords_transformed
-
-                # Определение хедера и футера
-                if y0_scaled < header_y_threshold:
-                    header_elements.append(coords_transformed)
-                    idx += 1
-                    continue
-                elif y1_scaled > footer_y_threshold:
-                    footer_elements.append(coords_transformed)
-                    idx += 1
-                    continue
+            # Сбор строк текста, за исключением строк в таблицах, и их разметка
+            elements = collect_pdfminer_lines(page_layout, page_height, table_bboxes)
+            classify_text_lines(elements, annotations, page_width, page_height)
 
-                # Обработка сносок в тексте
-                footnote_matches = re.finditer(r'\[\d+\]', text)
-                x0_br = y0_br = x1_br = y1_br = 0
-                for match in footnote_matches:
-                    start, end = match.span()
-                    for idxx, char in enumerate(text_line):
-                        if start <= idxx < end:
-                            if isinstance(char, LTChar):
-                                char_text = char.get_text()
-                                if char_text == '[':
-                                    x0_br = char.bbox[0] * SCALING_FACTOR
-                                    y0_br = page_height - char.bbox[3] * SCALING_FACTOR
-                                if char_text == ']':
-                                    x1_br = char.bbox[2] * SCALING_FACTOR
-                                    y1_br = page_height - char.bbox[1] * SCALING_FACTOR
-                                    annotations['footnote'].append([x0_br, y0_br, x1_br, y1_br])
-                                    break            
-
-                # Обработка подписей к рисункам
-                figure_signature_match = re.match(r'^\s*(рис\.?|рисунок)\s*((№|#)\s*)*\d+', text.lower())
-                if figure_signature_match:
-                    if current_title is not None:
-                        annotations['title'].append(current_title)
-                        current_title = None
-                    # Инициализируем объединенный бокс
-                    combined_coords = coords_transformed.copy()
-                    # Сохраняем размер шрифта и нижнюю координату Y текущего элемента
-                    current_font_size = font_size
-                    current_bottom_y = combined_coords[3]
-                    # Инициализируем индекс для просмотра следующих элементов
-                    idx_next = idx + 1
-                    while idx_next < len(elements):
-                        next_elem = elements[idx_next]
-                        next_font_size = next_elem['font_size']
-                        next_coords = next_elem['coords']
-                        # Проверяем, похож ли размер шрифта
-                        if abs(next_font_size - current_font_size) < 0.1:
-                            # Проверяем, близко ли расположены элементы по Y
-                            vertical_gap = next_coords[1] - current_bottom_y
-                            if 0 <= vertical_gap <= 20:
-                                # Обновляем объединенный бокс
-                                combined_coords[0] = min(combined_coords[0], next_coords[0])
-                                combined_coords[1] = min(combined_coords[1], next_coords[1])
-                                combined_coords[2] = max(combined_coords[2], next_coords[2])
-                                combined_coords[3] = max(combined_coords[3], next_coords[3])
-                                current_bottom_y = combined_coords[3]
-                                idx_next += 1
-                                continue
-                        break
-                    # Добавляем объединенный бокс в аннотации
-                    annotations['picture_signature'].append(combined_coords)
-                    idx = idx_next
-                    continue
+            # Структура JSON (параграфы, изображения, формулы и графики заполняются в PyMuPDF)
+            json_data = new_page_annotation(pdf_path, page_index + 1, page_width, page_height)
+            for key in json_data:
+                if key in annotations:
+                    json_data[key] = annotations[key]
 
-                # Обработка подписей к таблицам
-                table_signature_match = re.match(r'^\s*(табл\.?|таблица)\s*((№|#)\s*)*\d+', text.lower())
-                if table_signature_match:
-                    if current_title is not None:
-                        annotations['title'].append(current_title)
-                        current_title = None
-                    # Инициализируем объединенный бокс
-                    combined_coords = coords_transformed.copy()
-                    # Сохраняем размер шрифта и нижнюю координату Y текущего элемента
-                    current_font_size = font_size
-                    current_bottom_y = combined_coords[3]
-                    # Инициализируем индекс для просмотра следующих элементов
-                    idx_next = idx + 1
-                    while idx_next < len(elements):
-                        next_elem = elements[idx_next]
-                        next_font_size = next_elem['font_size']
-                        next_coords = next_elem['coords']
-                        # Проверяем, похож ли размер шрифта
-                        if abs(next_font_size - current_font_size) < 0.1:
-                            # Проверяем, близко ли расположены элементы по Y
-                            vertical_gap = next_coords[1] - current_bottom_y
-                            if 0 <= vertical_gap <= 20:
-                                # Обновляем объединенный бокс
-                                combined_coords[0] = min(combined_coords[0], next_coords[0])
-                                combined_coords[1] = min(combined_coords[1], next_coords[1])
-                                combined_coords[2] = max(combined_coords[2], next_coords[2])
-                                combined_coords[3] = max(combined_coords[3], next_coords[3])
-                                current_bottom_y = combined_coords[3]
-                                idx_next += 1
-                                continue
-                        break
-                    # Добавляем объединенный бокс в аннотации
-                    annotations['table_signature'].append(combined_coords)
-                    idx = idx_next
-                    continue
+            page_annotations[page_index + 1] = json_data
 
-                # Обработка формул
-                formula_match = re.match(r'^\s*формула', text.lower())
-                if formula_match or (is_centered_text(text_line, page_width) and not any(c.isalnum() for c in text)):
-                    if current_title is not None:
-                        annotations['title'].append(current_title)
-                        current_title = None
-                    # Формулы будут обработаны PyMuPDF, поэтому здесь пропускаем
-                    idx += 1
-                    continue
-
-                # Обработка заголовков
-                if is_bold or is_italic:
-                    if current_title is None:
-                        current_title = coords_transformed.copy()
-                    else:
-                        current_title[0] = min(current_title[0], coords_transformed[0])
-                        current_title[1] = min(current_title[1], coords_transformed[1])
-                        current_title[2] = max(current_title[2], coords_transformed[2])
-                        current_title[3] = max(current_title[3], coords_transformed[3])
-                else:
-                    # Если мы были в заголовке, завершаем его
-                    if current_title is not None:
-                        annotations['title'].append(current_title)
-                        current_title = None
-                    # Параграфы будут обработаны в блоке PyMuPDF, поэтому здесь пропускаем
+            # Сохранение аннотаций
+            if save:
+                json_path = os.path.join(output_dir, page_file_name(pdf_path, page_index + 1, 'json'))
+                save_page_annotation(json_data, json_path)
+                print(f"Аннотации для страницы {page_index + 1} сохранены в {json_path}.")
 
-                idx += 1
+    return page_annotations
 
-            # После цикла добавляем незавершенные элементы
-            if current_title is not None:
-                annotations['title'].append(current_title)
 
-            # Объединение боксов хедера и футера
-            if header_elements:
-                min_x = min(box[0] for box in header_elements)
-                min_y = min(box[1] for box in header_elements)
-                max_x = max(box[2] for box in header_elements)
-                max_y = max(box[3] for box in header_elements)
-                annotations['header'].append([min_x, min_y, max_x, max_y])
-            if footer_elements:
-                min_x = min(box[0] for box in footer_elements)
-                min_y = min(box[1] for box in footer_elements)
-                max_x = max(box[2] for box in footer_elements)
-                max_y = max(box[3] for box in footer_elements)
-                annotations['footer'].append([min_x, min_y, max_x, max_y])
-
-            # Формирование пути к изображению
-            image_path = f"{os.path.splitext(os.path.basename(pdf_path))[0]}_page_{page_number + 1}.png"
-
-            # Структура JSON
-            json_data = {
-                "image_height": int(page_height),
-                "image_width": int(page_width),
-                "image_path": os.path.join(IMAGE_DIR, image_path),
-                "title": annotations["title"],
-                "paragraph": [],  # Параграфы будут заполнены в PyMuPDF
-                "table": annotations["table"],
-                "picture": annotations["picture"],  # Пустой список, так как pdfminer не помечает картинки
-                "table_signature": annotations["table_signature"],
-                "picture_signature": annotations["picture_signature"],
-                "numbered_list": annotations["numbered_list"],
-                "marked_list": annotations["marked_list"],
-                "header": annotations["header"],
-                "footer": annotations["footer"],
-                "footnote": annotations["footnote"],
-                "formula": annotations["formula"],
-                "graph": annotations["graph"]  # Добавлено поле для графиков
-            }
+class BoxIndex:
+    """
+    Индекс боксов страницы для пакетных запросов на пересечение.
+    Боксы отсортированы по x0, поэтому кандидаты для запроса - непрерывный диапазон боксов с
+    x0 в (x0 запроса - максимальная ширина бокса, x1 запроса), который находится np.searchsorted;
+    точная проверка выполняется векторно только для этих пар. Отсечение слабее для очень широких
+    боксов (таблица на всю ширину страницы), тогда кандидатами становятся почти все боксы.
+    Пересечение определяется так же, как в bboxes_overlap (касание границами не считается пересечением).
+    """
 
-            # Сохранение аннотаций
-            json_name = f"{os.path.splitext(os.path.basename(pdf_path))[0]}_page_{page_number + 1}.json"
-            json_path = os.path.join(output_dir, json_name)
-            with open(json_path, 'w', encoding='utf-8') as json_file:
-                json.dump(json_data, json_file, ensure_ascii=False, indent=4)
-            print(f"Аннотации для страницы {page_number + 1} сохранены в {json_path}.")
+    def __init__(self, boxes):
+        """
+        :param boxes: Список боксов [x0, y0, x1, y1].
+        """
+        boxes = np.asarray(boxes, dtype=np.float64).reshape(-1, 4)
+        self.boxes = boxes[np.argsort(boxes[:, 0], kind='stable')]
+        # Запас на округление при вычитании, чтобы диапазон кандидатов не терял касающиеся боксы
+        widths = self.boxes[:, 2] - self.boxes[:, 0]
+        self.max_width = widths.max() * (1 + 1e-9) + 1e-9 if len(widths) else 0.0
+
+    def __len__(self):
+        return len(self.boxes)
+
+    def overlaps_any(self, bboxes):
+        """
+        Для каждого бокса из bboxes проверяет, пересекается ли он хотя бы с одним боксом индекса.
+        :return: Массив bool длины len(bboxes).
+        """
+        queries = np.asarray(bboxes, dtype=np.float64).reshape(-1, 4)
+        result = np.zeros(len(queries), dtype=bool)
+        if not len(self.boxes) or not len(queries):
+            return result
+
+        # Диапазон кандидатов [lo, hi) каждого запроса в отсортированных по x0 боксах
+        lo = np.searchsorted(self.boxes[:, 0], queries[:, 0] - self.max_width, side='left')
+        hi = np.searchsorted(self.boxes[:, 0], queries[:, 2], side='left')
+        counts = np.maximum(hi - lo, 0)
+        ends = np.cumsum(counts)
+
+        # Запросы обрабатываются частями, чтобы число пар-кандидатов в части не превышало BATCH_PAIRS
+        start = 0
+        while start < len(queries):
+            done = ends[start - 1] if start else 0
+            stop = max(start + 1, int(np.searchsorted(ends, done + BATCH_PAIRS, side='right')))
+            part_counts = counts[start:stop]
+            query_idx = np.repeat(np.arange(start, stop), part_counts)
+            offsets = np.arange(len(query_idx)) - np.repeat(np.cumsum(part_counts) - part_counts, part_counts)
+            part = queries[query_idx]
+            boxes = self.boxes[lo[query_idx] + offsets]
+            hits = ((part[:, 2] > boxes[:, 0]) & (part[:, 0] < boxes[:, 2]) &
+                    (part[:, 3] > boxes[:, 1]) & (part[:, 1] < boxes[:, 3]))
+            result[start:stop] = np.bincount(query_idx[hits] - start, minlength=stop - start) > 0
+            start = stop
+        return result
 
 
 def is_in_table(bbox, table_bboxes):
     """
     Проверяет, находится ли данный bbox внутри какого-либо из боксов таблиц.
+    Для всех строк страницы сразу используйте BoxIndex(table_bboxes).overlaps_any.
     :param bbox: Координаты бокса [x0, y0, x1, y1].
     :param table_bboxes: Список координат боксов таблиц.
     :return: True, если bbox находится внутри таблицы, иначе False.
@@ -370,333 +783,225 @@ def bboxes_overlap(bbox1, bbox2):
     return True  # Есть пересечение
 
 
-def is_centered_text(text_line, page_width, tolerance=20):
+def is_centered_text(coords, page_width, tolerance=20):
     """
     Проверяет, выровнен ли текст по центру страницы для выявления надписи "Формула" под рисунком.
-    :param text_line: Объект LTTextLineHorizontal.
+    :param coords: Бокс строки в пикселях изображения [x0, y0, x1, y1].
     :param page_width: Ширина страницы.
     :param tolerance: Допустимое отклонение в пикселях.
     :return: True, если текст выровнен по центру, иначе False.
     """
-    x0, _, x1, _ = text_line.bbox
-    text_center = (x0 + x1) / 2 * SCALING_FACTOR
+    x0, _, x1, _ = coords
+    text_center = (x0 + x1) / 2
     page_center = page_width / 2
     return abs(page_center - text_center) <= tolerance
 
-def extract_annotations_with_pymupdf(pdf_path, output_dir='json'):
+def extract_annotations_with_pymupdf(pdf_path, output_dir='json', pages=None, page_annotations=None):
     """
     Извлекает координаты элементов из PDF-файла с помощью PyMuPDF и добавляет аннотации формул, графиков и изображений.
     Также обрабатывает параграфы, учитывая многоколоночные документы.
+    :param pages: Номера страниц (начиная с 1); по умолчанию все страницы.
+    :param page_annotations: Разметка страниц из extract_annotations_from_pdf в памяти
+                             (см. её результат); если не задана, разметка читается из JSON в output_dir.
     """
     if not os.path.exists(output_dir):
         os.makedirs(output_dir)
 
     doc = fitz.open(pdf_path)
 
-    for page_number in range(len(doc)):
-        page = doc[page_number]
+    for page_number in select_pages(pages, len(doc)):
+        page = doc[page_number - 1]
         page_width, page_height = page.rect.width, page.rect.height
 
         # Получаем текстовые блоки в виде словаря
-        page_dict = page.get_text("dict")
-        blocks = page_dict["blocks"]
-
-        elements = []  # Список для хранения элементов страницы
-        pictures_type = []  # Список для хранения типов аннотаций ("formula", "image", "graph")       
-        second_mid_sym_in_row = False # Флаг для корректного нахождения изображений, занимающих большую часть ширины страницы
-        for block in blocks:          
-            if block['type'] == 0:  # Текстовый блок
-                for line in block['lines']:
-                    for span in line['spans']:
-                        text = span['text']
-                        bbox = span['bbox']  # [x0, y0, x1, y1]
-                        font_size = span['size']
-                        x0, y0, x1, y1 = bbox
-                        # Преобразуем координаты в нужный формат
-                        x0_scaled = x0 * SCALING_FACTOR
-                        y0_scaled = y0 * SCALING_FACTOR
-                        x1_scaled = x1 * SCALING_FACTOR
-                        y1_scaled = y1 * SCALING_FACTOR
-                        coords_transformed = [x0_scaled, y0_scaled, x1_scaled, y1_scaled]
-                        char_count = len(text)
-                        elements.append({
-                            'type': 'text',
-                            'text': text,
-                            'bbox': coords_transformed,
-                            'char_count': char_count,  # Добавлено: количество символов
-                            'font_size': font_size, # Добавлено: размер шрифта
-                            'contains_list_stop_sym': '@' in text # Добавлено: наличие символа-признака конца списка
-                        })
-                        # Проверяем на наличие символов "~", "&" и "$"
-                        if '~' in text:
-                            pictures_type.append('formula')
-                        elif '&' in text:
-                            if abs(x0 + x1 - page_width) > 1.0:
-                                pictures_type.append('image')
-                                second_mid_sym_in_row = False
-                            else:
-                                if second_mid_sym_in_row:
-                                    pictures_type.append('image')
-                                second_mid_sym_in_row = not second_mid_sym_in_row
-                        elif '$' in text:
-                            pictures_type.append('graph')
-            elif block['type'] == 1:  # Изображение
-                bbox = block['bbox']
-                x0, y0, x1, y1 = bbox
-                x0_scaled = x0 * SCALING_FACTOR
-                y0_scaled = y0 * SCALING_FACTOR
-                x1_scaled = x1 * SCALING_FACTOR
-                y1_scaled = y1 * SCALING_FACTOR
-                coords_transformed = [x0_scaled, y0_scaled, x1_scaled, y1_scaled]
-                elements.append({
-                    'type': 'image',
-                    'bbox': coords_transformed
-                })
-
-        # Проходим по последним элементам в количестве len(pictures_type) и присваиваем аннотации
-        image_elements = [elem for elem in elements if elem['type'] == 'image']
-
-        # Теперь присваиваем аннотации
-        for idx, image_elem in enumerate(image_elements[-len(pictures_type):]):
-            if idx < len(pictures_type):
-                image_elem['annotations'] = pictures_type[idx]
+        elements, pictures_type = collect_pymupdf_elements(page.get_text("dict"), page_width)
 
         # Загрузка существующих аннотаций из pdfminer
-        json_name = f"{os.path.splitext(os.path.basename(pdf_path))[0]}_page_{page_number + 1}.json"
-        json_path = os.path.join(output_dir, json_name)
-        if os.path.exists(json_path):
+        json_path = os.path.join(output_dir, page_file_name(pdf_path, page_number, 'json'))
+        if page_annotations is not None and page_number in page_annotations:
+            json_data = page_annotations[page_number]
+        elif page_annotations is None and os.path.exists(json_path):
             with open(json_path, 'r', encoding='utf-8') as json_file:
                 json_data = json.load(json_file)
         else:
-            json_data = {
-                "image_height": int(page_height * SCALING_FACTOR),
-                "image_width": int(page_width * SCALING_FACTOR),
-                "image_path": os.path.join(IMAGE_DIR,
-                                           f"{os.path.splitext(os.path.basename(pdf_path))[0]}_page_{page_number + 1}.png"),
-                "title": [],
-                "paragraph": [],
-                "table": [],
-                "picture": [],
-                "table_signature": [],
-                "picture_signature": [],
-                "numbered_list": [],
-                "marked_list": [],
-                "header": [],
-                "footer": [],
-                "footnote": [],
-                "formula": [],
-                "graph": []  # Добавляем ключ 'graph'
-            }
+            json_data = new_page_annotation(pdf_path, page_number,
+                                            page_width * SCALING_FACTOR, page_height * SCALING_FACTOR)
 
         # Добавляем аннотации из PyMuPDF к существующим аннотациям
-        for element in elements:
-            if 'annotations' in element:
-                if element['annotations'] == 'formula':
-                    json_data['formula'].append(element['bbox'])
-                elif element['annotations'] == 'image':
-                    json_data['picture'].append(element['bbox'])
-                elif element['annotations'] == 'graph':
-                    json_data['graph'].append(element['bbox'])
-
-        # Флаги для управления состоянием
-        in_numbered_list = False
-        in_bulleted_list = False
-        
-        idx = 0
-        indent = -1
-        x_list_pred = y_list_pred = char_size_pred = 0
-        x_list_begin = y_list_begin = -1
-        x_list_end = y_list_end = -1       
-        bullet_chars = '•◦●○▪–—*-·•‣⁃▪■❖➤►▶‣⁌⁍'
-
+        add_picture_annotations(elements, pictures_type, json_data)
         text_elements = [elem for elem in elements if elem['type'] == 'text']
+        add_list_annotations(text_elements, json_data)
+        add_paragraph_annotations(text_elements, json_data)
 
-        # Цикл по текстовым элементам страницы     
-        while idx < len(text_elements):                
-            text = text_elements[idx]['text']
-            containts_list_stop_sym = text_elements[idx]['contains_list_stop_sym']
-            if text == ' ':
-                idx += 1
-                if idx == len(text_elements):
-                    if in_numbered_list:
-                        json_data['numbered_list'].append(
-                            [x_list_begin, y_list_begin, x_list_end, y_list_end])
-                    if in_bulleted_list:
-                        json_data['marked_list'].append(
-                            [x_list_begin, y_list_begin, x_list_end, y_list_end])
-                continue
-            coords_transformed = text_elements[idx]['bbox']
+        # Сохраняем обновленные данные в JSON-файл
+        save_page_annotation(json_data, json_path)
+        print(f"Аннотации для страницы {page_number} сохранены в {json_path}.")
 
-            # Обработка нумерованных списков 
-            numbered_match = re.match(r'^\s*\d+[\.\)]\s*', text)
-            if numbered_match and not in_numbered_list:                
-                in_numbered_list = True
-                if in_bulleted_list:
-                    json_data['marked_list'].append([x_list_begin, y_list_begin, x_list_end, y_list_end])
-                    in_bulleted_list = False
-                if not any(char.isalpha() for char in text):
-                    idx += 2
-                x_list_begin, y_list_begin, _, y_list_end = coords_transformed
-                x_list_end = text_elements[idx]['bbox'][2]
-                idx += 1
-                continue
+    doc.close()
 
-            # Продолжение нумерованного списка
-            if in_numbered_list:
-                if not containts_list_stop_sym:
-                    if y_list_end - coords_transformed[1] > 500:
-                        json_data['numbered_list'].append(
-                            [x_list_begin, y_list_begin, x_list_end, y_list_end])
-                        x_list_begin = coords_transformed[0]
-                        y_list_begin = coords_transformed[1]
-                    
-                    if x_list_begin > coords_transformed[0]:
-                        x_list_begin = coords_transformed[0]
-                    if x_list_end < coords_transformed[2]:
-                        x_list_end = coords_transformed[2]
-                    y_list_end = coords_transformed[3]
-                    
-                    idx += 1
-                    if idx == len(text_elements):
-                        json_data['numbered_list'].append(
-                            [x_list_begin, y_list_begin, x_list_end, y_list_end])
-                    if not any(char.isalpha() for char in text):
-                        idx += 1                    
-                    continue
-                else:             
-                    json_data['numbered_list'].append(
-                        [x_list_begin, y_list_begin, x_list_end, y_list_end])
-                    in_numbered_list = False
-                    idx += 1
-                    continue
 
-            # Обработка маркированных списков 
-            bulleted_match = re.match(r'^\s*[' + re.escape(bullet_chars) + r']\s*', text)
-            if bulleted_match and not in_bulleted_list:
-                in_bulleted_list = True
-                in_numbered_list = False
-                if not any(char.isalpha() for char in text):
-                    idx += 2
-                x_list_begin, y_list_begin, _, y_list_end = coords_transformed
-                x_list_end = text_elements[idx]['bbox'][2]
-                idx += 1
-                continue
-            
-            # Продолжение маркированного списка
-            if in_bulleted_list:
-                if not containts_list_stop_sym:
-                    if y_list_end - coords_transformed[1] > 500:
-                        json_data['marked_list'].append(
-                            [x_list_begin, y_list_begin, x_list_end, y_list_end])
-                        x_list_begin = coords_transformed[0]
-                        y_list_begin = coords_transformed[1]
-                    
-                    if x_list_begin > coords_transformed[0]:
-                        x_list_begin = coords_transformed[0]
-                    if x_list_end < coords_transformed[2]:
-                        x_list_end = coords_transformed[2]
-                    y_list_end = coords_transformed[3]
-                    
-                    idx += 1
-                    if idx == len(text_elements):
-                        json_data['marked_list'].append(
-                            [x_list_begin, y_list_begin, x_list_end, y_list_end])
-                    if not any(char.isalpha() for char in text):
-                        idx += 1
-                    continue
-                else:                  
-                    json_data['marked_list'].append(
-                        [x_list_begin, y_list_begin, x_list_end, y_list_end])
-                    in_bulleted_list = False
-                    idx += 1
-                    continue
-            
-            idx += 1
+def select_pages(pages, page_count):
+    """
+    Номера страниц для разметки (начиная с 1) в порядке документа; номера вне документа отбрасываются.
+    """
+    if pages is None:
+        return list(range(1, page_count + 1))
+    return sorted(page_number for page_number in set(pages) if 1 <= page_number <= page_count)
 
-        # Обработка параграфов
-        # Собираем все существующие боксы, чтобы избежать пересечений
-        existing_boxes = []
-        for key in ['title', 'table', 'picture', 'table_signature', 'picture_signature', 'numbered_list', 'marked_list',
-                    'header', 'footer', 'formula', 'graph']:
-            existing_boxes.extend(json_data.get(key, []))
-
-        # Фильтруем текстовые элементы, не пересекающиеся с существующими боксами
-        filtered_text_elements = []
-        for elem in text_elements:
-            overlaps = False
-            for bbox in existing_boxes:
-                if bboxes_overlap(elem['bbox'], bbox):
-                    overlaps = True
-                    break
-            if not overlaps:
-                filtered_text_elements.append(elem)
-
-        # Исключаем элементы, содержащие только символы " ", "~", "&", "$", "@" из аннотирования как параграф
-        paragraph_elements = []
-        for elem in filtered_text_elements:
-            text_content = elem['text'].strip()
-            if text_content not in ["", "~", "&", "$", "@"]:
-                paragraph_elements.append(elem)
-
-        # Группируем элементы в столбцы на основе координаты x0
-        threshold = 200
-        # Собираем элементы с их x0 и y0 координатами
-        sorted_elements = paragraph_elements
-        columns = []
-        current_column = []
-        prev_y0 = None
-
-        for elem in sorted_elements:
-            y0 = elem['bbox'][1]
-            if prev_y0 is None:
-                current_column.append(elem)
-            elif abs(y0 - prev_y0) <= threshold:
-                current_column.append(elem)
-            else:
-                columns.append(current_column)
-                current_column = [elem]
-            prev_y0 = y0
 
-        # Добавляем последний столбец
-        if current_column:
-            columns.append(current_column)
+def parse_page_range(value):
+    """
+    Разбирает диапазон страниц вида "1-3,7,10-12" в список номеров страниц.
+    """
+    pages = []
+    for part in value.split(','):
+        part = part.strip()
+        if not part:
+            continue
+        if '-' in part:
+            first, last = part.split('-', 1)
+            pages.extend(range(int(first), int(last) + 1))
+        else:
+            pages.append(int(part))
+    return pages
 
-        # Объединяем боксы в каждом столбце
-        for column in columns:
-            x0s = [elem['bbox'][0] for elem in column]
-            y0s = [elem['bbox'][1] for elem in column]
-            x1s = [elem['bbox'][2] for elem in column]
-            y1s = [elem['bbox'][3] for elem in column]
-            merged_bbox = [min(x0s), min(y0s), max(x1s), max(y1s)]
-            # Добавляем объединенный бокс в поле 'paragraph' в json_data
-            json_data['paragraph'].append(merged_bbox)
 
-        # Сохраняем обновленные данные в JSON-файл
-        with open(json_path, 'w', encoding='utf-8') as json_file:
-            json.dump(json_data, json_file, ensure_ascii=False, indent=4)
+def annotate_pdf(pdf_path, output_dir='json', engine='pymupdf', pages=None):
+    """
+    Размечает один PDF-файл.
+    :param engine: 'pymupdf' - один разбор PyMuPDF (по умолчанию);
+                   'legacy' - сначала pdfminer/pdfplumber, затем PyMuPDF дополняет разметку страниц
+                   в памяти, и JSON каждой страницы записывается один раз.
+    :param pages: Номера страниц (начиная с 1); по умолчанию все страницы.
+    """
+    if engine == 'pymupdf':
+        extract_annotations_single_pass(pdf_path, output_dir=output_dir, pages=pages)
+    else:
+        page_annotations = extract_annotations_from_pdf(pdf_path, output_dir=output_dir, pages=pages, save=False)
+        extract_annotations_with_pymupdf(pdf_path, output_dir=output_dir, pages=pages,
+                                         page_annotations=page_annotations)
 
-def bboxes_overlap(bbox1, bbox2):
+
+def annotate_task(pdf_path, output_dir, engine, pages):
     """
-    Проверяет, пересекаются ли два бокса.
-    :param bbox1: Первый бокс [x0, y0, x1, y1].
-    :param bbox2: Второй бокс [x0, y0, x1, y1].
-    :return: True, если боксы пересекаются, иначе False.
+    Задача процесса-обработчика: размечает страницы pages документа.
+    :return: Время разметки в секундах.
     """
-    x0_1, y0_1, x1_1, y1_1 = bbox1
-    x0_2, y0_2, x1_2, y1_2 = bbox2
+    started = time.monotonic()
+    annotate_pdf(pdf_path, output_dir=output_dir, engine=engine, pages=pages)
+    return time.monotonic() - started
 
-    if x1_1 <= x0_2 or x0_1 >= x1_2:
-        return False  # Нет горизонтального пересечения
-    if y1_1 <= y0_2 or y0_1 >= y1_2:
-        return False  # Нет вертикального пересечения
-    return True  # Есть пересечение
 
+def annotate_documents(pdf_dir='pdf', output_dir='json', engine='pymupdf', pages=None, workers=ANNOTATE_WORKERS,
+                       pages_per_task=PAGES_PER_TASK, summary_path=SUMMARY_NAME):
+    """
+    Размечает все PDF из pdf_dir в пуле процессов. Документы длиннее pages_per_task страниц
+    делятся на задачи по диапазонам страниц. Ошибка в одном документе не останавливает разметку остальных;
+    статус, время и ошибки каждого документа записываются в summary_path.
 
-if __name__ == "__main__":
-    pdf_folder = "pdf"
-    pdf_files = [f for f in os.listdir(pdf_folder) if f.lower().endswith('.pdf')]
+    :param pages: Номера страниц (начиная с 1) для разметки в каждом документе; по умолчанию все страницы.
+    :param workers: Количество процессов.
+    :return: Сводка (см. summary_path).
+    """
+    os.makedirs(output_dir, exist_ok=True)
+    started = time.monotonic()
+
+    pdf_files = sorted(f for f in os.listdir(pdf_dir) if f.lower().endswith('.pdf'))
+    documents = {}  # имя PDF -> запись сводки
+    tasks = []  # (имя PDF, страницы задачи)
     for pdf_file in pdf_files:
-        pdf_path = os.path.join(pdf_folder, pdf_file)
-        print(f"Обработка файла: {pdf_file}")
-        extract_annotations_from_pdf(pdf_path, output_dir='json')
-        extract_annotations_with_pymupdf(pdf_path, output_dir='json')
+        document = {"pdf": pdf_file, "status": "ok", "pages": 0, "seconds": 0.0, "errors": []}
+        documents[pdf_file] = document
+        try:
+            with fitz.open(os.path.join(pdf_dir, pdf_file)) as doc:
+                page_numbers = select_pages(pages, len(doc))
+        except Exception as e:
+            document["status"] = "failed"
+            document["errors"].append(f"Не удалось открыть документ: {e}")
+            continue
+        document["pages"] = len(page_numbers)
+        for i in range(0, len(page_numbers), pages_per_task):
+            tasks.append((pdf_file, page_numbers[i:i + pages_per_task]))
+
+    def record_result(pdf_file, task_pages, future):
+        """
+        Записывает результат задачи в сводку документа.
+        :return: False, если процесс-обработчик аварийно завершился и результата нет.
+        """
+        document = documents[pdf_file]
+        try:
+            document["seconds"] += future.result()
+        except BrokenProcessPool:
+            return False
+        except Exception as e:
+            document["status"] = "failed"
+            document["errors"].append(f"Страницы {task_pages[0]}-{task_pages[-1]}: {e}")
+            print(f"Ошибка при разметке {pdf_file}: {e}")
+            return True
+        print(f"Размечены страницы {task_pages[0]}-{task_pages[-1]} документа {pdf_file}")
+        return True
+
+    # Аварийное завершение процесса (например, падение MuPDF на испорченном файле) ломает весь пул,
+    # и BrokenProcessPool получают все незавершённые задачи, а не только виновная
+    crashed = []
+    with ProcessPoolExecutor(max_workers=workers) as executor:
+        futures = {}
+        for task_idx, (pdf_file, task_pages) in enumerate(tasks):
+            try:
+                future = executor.submit(annotate_task, os.path.join(pdf_dir, pdf_file), output_dir, engine,
+                                         task_pages)
+            except BrokenProcessPool:
+                # Пул сломался, пока задачи ещё ставились в очередь: оставшиеся задачи сразу идут
+                # в повторную разметку по одной
+                crashed.extend(tasks[task_idx:])
+                break
+            futures[future] = (pdf_file, task_pages)
+        for future in as_completed(futures):
+            pdf_file, task_pages = futures[future]
+            if not record_result(pdf_file, task_pages, future):
+                crashed.append((pdf_file, task_pages))
+
+    # Поэтому задачи сломанного пула перезапускаются по одной, каждая в своём процессе:
+    # ошибкой отмечается только задача, процесс которой снова аварийно завершился
+    if crashed:
+        print(f"Процесс-обработчик аварийно завершился, повторная разметка {len(crashed)} задач по одной")
+    for pdf_file, task_pages in crashed:
+        with ProcessPoolExecutor(max_workers=1) as executor:
+            future = executor.submit(annotate_task, os.path.join(pdf_dir, pdf_file), output_dir, engine, task_pages)
+            if not record_result(pdf_file, task_pages, future):
+                documents[pdf_file]["status"] = "failed"
+                documents[pdf_file]["errors"].append(
+                    f"Страницы {task_pages[0]}-{task_pages[-1]}: процесс-обработчик аварийно завершился")
+                print(f"Процесс-обработчик аварийно завершился на документе {pdf_file}")
+
+    failed = [document for document in documents.values() if document["status"] != "ok"]
+    summary = {
+        "documents": list(documents.values()),
+        "total": {
+            "documents": len(documents),
+            "failed": len(failed),
+            "pages": sum(document["pages"] for document in documents.values()),
+            "seconds": time.monotonic() - started
+        }
+    }
+    with open(summary_path, 'w', encoding='utf-8') as summary_file:
+        json.dump(summary, summary_file, ensure_ascii=False, indent=4)
+    print(f"Размечено документов: {len(documents) - len(failed)} из {len(documents)}, "
+          f"время: {summary['total']['seconds']:.1f} с, сводка: {summary_path}")
+    return summary
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Разметка страниц PDF в JSON")
+    parser.add_argument("--pdf-dir", default='pdf')
+    parser.add_argument("--output-dir", default='json')
+    parser.add_argument("--engine", choices=ENGINES, default='pymupdf')
+    parser.add_argument("--pages", type=parse_page_range, help="Страницы для разметки, например 1-3,7")
+    parser.add_argument("--workers", type=int, default=ANNOTATE_WORKERS, help="Количество процессов")
+    parser.add_argument("--pages-per-task", type=int, default=PAGES_PER_TASK,
+                        help="Большие документы делятся на задачи по столько страниц")
+    parser.add_argument("--summary", default=SUMMARY_NAME, help="Файл сводки по документам")
+    args = parser.parse_args()
+
+    annotate_documents(args.pdf_dir, args.output_dir, engine=args.engine, pages=args.pages, workers=args.workers,
+                       pages_per_task=args.pages_per_task, summary_path=args.summary)